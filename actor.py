@@ -0,0 +1,66 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class ActorBusy(RuntimeError):
+    pass
+
+
+class DuplicateAction(RuntimeError):
+    pass
+
+
+class ActorClosed(RuntimeError):
+    pass
+
+
+class GameActor:
+    def __init__(self, max_depth: int = 64):
+        self.queue: asyncio.Queue[tuple[Hashable | None, Callable[[], Awaitable[Any]], asyncio.Future]] = \
+            asyncio.Queue(maxsize=max_depth)
+        self.pending: set[Hashable] = set()
+        self.task: asyncio.Task | None = None
+        self.closed = False
+
+    async def submit(self, key: Hashable | None, action: Callable[[], Awaitable[Any]]) -> Any:
+        return await self.enqueue(key, action)
+
+    def enqueue(self, key: Hashable | None, action: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        # queues without waiting, a rejected action is known before the caller does anything else
+        if self.closed:
+            raise ActorClosed('submit, the game is over')
+        if key is not None and key in self.pending:
+            raise DuplicateAction(f'submit, action {key} is already queued')
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((key, action, future))
+        except asyncio.QueueFull:
+            raise ActorBusy(f'submit, queue is full ({self.queue.maxsize} actions)')
+        if key is not None:
+            self.pending.add(key)
+        if self.task is None:
+            self.task = asyncio.create_task(self.__run__())
+        return future
+
+    def close(self):
+        self.closed = True
+        while not self.queue.empty():
+            key, _, future = self.queue.get_nowait()
+            self.pending.discard(key)
+            if not future.done():
+                future.set_exception(ActorClosed('close, the game is over'))
+
+    async def __run__(self):
+        try:
+            while not self.queue.empty():
+                key, action, future = self.queue.get_nowait()
+                try:
+                    if not future.cancelled():
+                        future.set_result(await action())
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                finally:
+                    self.pending.discard(key)
+        finally:
+            self.task = None
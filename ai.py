@@ -0,0 +1,185 @@
+import asyncio
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from game import *
+from simulation import POLICIES, Policy, greedy_policy
+from snapshot import dump_game, load_game
+
+Move = tuple[int | None, Color | None]
+
+DEFAULT_BUDGET = 0.25  # seconds of thinking per move
+ROLLOUT_TURNS = 500
+AI_TAG_START = -1  # bots get negative discord tags so they never collide with real users
+
+
+class AIPlayer(Player):
+    policy: str
+
+    def __init__(self, discord_tag, nickname, policy: str = 'montecarlo'):
+        super().__init__(discord_tag, nickname)
+        self.policy = policy
+
+
+def is_ai(player: Player) -> bool:
+    # restored games only keep the tag, so the sign is what marks a bot
+    return player.discord_tag < 0
+
+
+def candidate_moves(game: Game, player: Player) -> list[Move]:
+    # drawing while holding a playable card is never better in practice and only adds noise to the search
+    moves: list[Move] = []
+    seen = set()
+    for card in game.playable_cards(player):
+        face = card & FACE_MASK
+        if face in seen:
+            continue  # identical faces lead to identical games
+        seen.add(face)
+        if is_wild(card):
+            moves.extend((card_id(card), color) for color in Color)
+        else:
+            moves.append((card_id(card), None))
+    return moves or [(None, None)]
+
+
+def determinize(game: Game, player: Player, rng: random.Random) -> Game:
+    # a copy of the game in which everything the player cannot see, the other hands and the deck, is reshuffled
+    hidden = array(CARD_TYPECODE)
+    for other in game.players:
+        if other is not player:
+            hidden.extend(game.playersToCards[other].cards)
+    hidden.extend(game.deck)
+    rng.shuffle(hidden)
+
+    copy = Game(game.admin, rng=random.Random(rng.getrandbits(32)), rules=game.rules)
+    copy.players = game.players
+    copy.seats = game.seats
+    copy.state = game.state
+    copy.current_seat = game.current_seat
+    copy.current_player = game.current_player
+    copy.last_player = game.last_player
+    copy.current_card = game.current_card
+    copy.current_color = game.current_color
+    copy.rule_index = game.rule_index
+    copy.playable_mask = game.playable_mask
+    copy.pickup_stack = game.pickup_stack
+    copy.is_reversed = game.is_reversed
+    copy.discard = array(CARD_TYPECODE, game.discard)
+    offset = 0
+    for other in game.players:
+        hand = Hand()
+        if other is player:
+            cards = game.playersToCards[other].cards
+        else:
+            cards = hidden[offset:offset + len(game.playersToCards[other])]
+            offset += len(cards)
+        for card in cards:
+            hand.add(card)
+        copy.playersToCards[other] = hand
+    copy.deck = hidden[offset:]
+    return copy
+
+
+def rollout(game: Game, rng: random.Random, policy: Policy = greedy_policy) -> Player | None:
+    for _ in range(ROLLOUT_TURNS):
+        player = game.current_player
+        card_id, wild_color = policy(game, player, rng)
+        winner = game.apply_turn(player.discord_tag, card_id, wild_color)
+        if winner is not None:
+            return winner
+    return None
+
+
+def monte_carlo_search(game: Game, player: Player, budget: float, rng: random.Random) -> tuple[Move, int]:
+    # determinized flat Monte Carlo: each round guesses the hidden cards once and plays every candidate move
+    # out on that same guess, so moves are compared on equal footing. The greedy move is kept unless another
+    # move beats it by more than the noise of a paired sign test.
+    moves = candidate_moves(game, player)
+    if len(moves) == 1:
+        return moves[0], 0
+    baseline = greedy_policy(game, player, rng)
+    won = [0] * len(moves)  # bit r is set when the move won in round r
+    deadline = time.perf_counter() + budget
+    rounds = 0
+    while rounds == 0 or time.perf_counter() < deadline:
+        seed = rng.getrandbits(32)
+        for index, (card_id, wild_color) in enumerate(moves):
+            world_rng = random.Random(seed)
+            world = determinize(game, player, world_rng)
+            winner = world.apply_turn(player.discord_tag, card_id, wild_color)
+            if winner is None:
+                winner = rollout(world, world_rng)
+            if winner is player:
+                won[index] |= 1 << rounds
+        rounds += 1
+    base = moves.index(baseline) if baseline in moves else 0
+    best = max(range(len(moves)), key=lambda i: won[i].bit_count())
+    margin = won[best].bit_count() - won[base].bit_count()
+    if margin * margin <= 4 * (won[best] ^ won[base]).bit_count():
+        best = base
+    return moves[best], rounds * len(moves)
+
+
+class MonteCarloPolicy:
+    def __init__(self, budget: float = DEFAULT_BUDGET):
+        self.budget = budget
+        self.rollouts = 0
+
+    def __call__(self, game: Game, player: Player, rng: random.Random) -> Move:
+        move, rollouts = monte_carlo_search(game, player, self.budget, rng)
+        self.rollouts += rollouts
+        return move
+
+
+def think(data: bytes, seat: int, policy: str, budget: float, seed: int, deadline: float) -> Move:
+    # runs inside a worker process, the game travels as a snapshot; the deadline is wall clock time because the
+    # clocks of the processes only agree on that, a search that started late is cut short, one that started after
+    # the caller gave up is skipped
+    budget = min(budget, deadline - time.time())
+    if budget <= 0:
+        return None, None  # nobody waits for this move any more
+    game = load_game(data)
+    player = game.players[seat]
+    rng = random.Random(seed)
+    if policy == 'montecarlo':
+        return monte_carlo_search(game, player, budget, rng)[0]
+    return POLICIES[policy](game, player, rng)
+
+
+def default_workers() -> int:
+    # one search per core, the event loop keeps a core for itself
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+class AIRunner:
+    def __init__(self, workers: int | None = None, budget: float = DEFAULT_BUDGET):
+        self.budget = budget
+        self.workers = workers or default_workers()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.rng = random.Random()
+
+    def create_player(self, game: Game, policy: str = 'montecarlo') -> AIPlayer:
+        # the next tag below the bots already seated, a counter would start over after a restart
+        # and hand out the tags of the bots in restored games
+        tag = min([AI_TAG_START + 1] + [player.discord_tag for player in game.players]) - 1
+        return AIPlayer(tag, f'Bot {-tag}', policy)
+
+    async def choose(self, game: Game, player: Player) -> Move:
+        policy = getattr(player, 'policy', 'montecarlo')
+        if policy != 'montecarlo':
+            return POLICIES[policy](game, player, self.rng)
+        # a search still queued when the wait times out is cancelled, one already running stops at the deadline
+        timeout = self.budget * 4 + 1.0
+        future = asyncio.get_running_loop().run_in_executor(
+            self.executor, think, dump_game(game, log=False), game.seats[player.discord_tag], policy, self.budget,
+            self.rng.getrandbits(32), time.time() + timeout)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            print(f'choose, {player.nickname} ran out of time, falling back to the greedy policy')
+            return greedy_policy(game, player, self.rng)
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
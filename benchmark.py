@@ -0,0 +1,1167 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+
+from game import *
+from events import EventBus
+from images import CardRenderer, images_available
+from ai import AIRunner, MonteCarloPolicy
+from actor import ActorBusy, DuplicateAction, GameActor
+from broadcast import Broadcast, spectator_view
+import metrics
+from reaper import Reaper
+from render import RenderScheduler
+from replay import analyse, iter_games, replay_game
+from routing import Action, Router, build_view, decode_custom_id, encode_custom_id, hand_page
+from rules import RULE_NAMES, compile_rules, rule_index
+from shard import Supervisor, shard_for_guild, shards_from_env
+from snapshot import SnapshotStore
+from stats import INITIAL_RATING, StatsStore
+from store import CAS_SHA, GameStore, MemoryGameStore, RedisGameStore, VersionConflict
+from tournament import Table, TableScheduler, Tournament, TournamentMode, create_table_game
+from simulation import (check_consistency, create_game, first_playable_policy, greedy_policy, pick_wild_color,
+                        random_policy, run_batch, run_game, run_parallel)
+
+
+def report(name: str, count: int, unit: str, elapsed: float):
+    print(f'{name}: {count} {unit} in {elapsed:.3f}s, {count / elapsed:,.0f} {unit}/sec')
+
+
+def bench_simulation(args):
+    result = run_parallel(args.games, ['first', 'random', 'random', 'random'], args.workers, args.seed)
+    report('simulation', result.games, 'games', result.elapsed)
+    report('simulation', result.turns, 'turns', result.elapsed)
+
+
+def play_process_turns(args) -> tuple[int, float]:
+    async def play(games: list[Game]) -> int:
+        turns = 0
+        rng = random.Random(args.seed)
+        for game in games:
+            while game.state == GameState.ONGOING:
+                player = game.current_player
+                card_id, wild_color = first_playable_policy(game, player, rng)
+                await game.process_turn(player.discord_tag, card_id, wild_color)
+                turns += 1
+        return turns
+
+    games = [create_game(args.seed + i, 4) for i in range(args.games)]
+    start = time.perf_counter()
+    turns = asyncio.run(play(games))
+    return turns, time.perf_counter() - start
+
+
+def bench_process_turn(args):
+    turns, elapsed = play_process_turns(args)
+    report('process_turn', turns, 'turns', elapsed)
+
+
+def bench_metrics(args):
+    timings = {True: [], False: []}
+    for _ in range(3):
+        for enabled in (False, True):
+            metrics.set_enabled(enabled)
+            timings[enabled].append(play_process_turns(args))
+    metrics.set_enabled(True)
+    turns, baseline = min(timings[False], key=lambda timing: timing[1])
+    instrumented = min(timing[1] for timing in timings[True])
+
+    # the end to end numbers are noisy, so also price exactly what process_turn adds per call
+    histogram = metrics.Histogram('bench', '')
+    calls = 1_000_000
+    start = time.perf_counter()
+    for _ in range(calls):
+        if next(metrics.sampler):
+            sampled_start = time.perf_counter_ns()
+            metrics.record_since(histogram, sampled_start, metrics.SAMPLE_EVERY)
+            metrics.record_since(histogram, sampled_start, metrics.SAMPLE_EVERY)
+            metrics.record_since(histogram, sampled_start, metrics.SAMPLE_EVERY)
+    with_metrics = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(calls):
+        pass
+    empty = time.perf_counter() - start
+    per_call = (with_metrics - empty) / calls
+    print(f'metrics: {per_call * 1e9:.0f}ns per process_turn, {per_call / (baseline / turns) * 100:.2f}% of a '
+          f'{baseline / turns * 1e6:.2f}us turn; end to end {(instrumented / baseline - 1) * 100:+.2f}% (best of 3)')
+    print(metrics.registry.render_summary())
+
+
+def bench_is_playable(args):
+    game = create_game(args.seed, 4)
+    cards = list(game.deck)
+    checks = 0
+    start = time.perf_counter()
+    for _ in range(args.games):
+        for card in cards:
+            game.is_playable(card)
+        checks += len(cards)
+    report('is_playable', checks, 'checks', time.perf_counter() - start)
+
+
+def legacy_playable_masks() -> dict[tuple[int, Color | None], int]:
+    # the masks as they were computed before the rule table, keyed by the top face and color
+    faces = [face for face, label in enumerate(CARD_LABELS) if label is not None]
+    masks = {}
+    for top in faces:
+        for color in (None, *Color):
+            masks[top, color] = sum(1 << face for face in faces
+                                    if face & KIND_MASK >= CardKind.WILD
+                                    or (color is not None and (face & COLOR_MASK) >> COLOR_SHIFT == color.value)
+                                    or (face ^ top) & (KIND_MASK | NUMBER_MASK) == 0)
+    return masks
+
+
+def bench_rules(args):
+    # the lookup that replaced the dict of masks, then whole games under each house rule
+    masks = legacy_playable_masks()
+    table = compile_rules(DEFAULT_RULES)
+    # states a game can reach: a colored top card carries its own color, a wild one any color or none yet
+    states = [(top, color) for top, color in masks
+              if top & KIND_MASK >= CardKind.WILD or color is card_color(top)]
+    lookups = args.games * len(states)
+    start = time.perf_counter()
+    for _ in range(args.games):
+        for top, color in states:
+            masks[top, color]
+    legacy = time.perf_counter() - start
+    indices = [rule_index(top, color, 0) for top, color in states]  # the game keeps its index up to date
+    start = time.perf_counter()
+    playable = table.playable
+    for _ in range(args.games):
+        for index in indices:
+            playable[index]
+    report('rules (legacy masks)', lookups, 'lookups', legacy)
+    report('rules (rule table)', lookups, 'lookups', time.perf_counter() - start)
+    mismatches = sum(masks[top, color] != table.playable[rule_index(top, color, 0)] for top, color in states)
+    print(f'rules: {mismatches} of {len(states)} states differ from the legacy masks')
+
+    games = max(args.games // 4, 50)
+    variants = [('default', DEFAULT_RULES)] + [(name, DEFAULT_RULES | rule) for rule, name in RULE_NAMES.items()
+                                               if not DEFAULT_RULES & rule]
+    variants.append(('all', HouseRule(sum(HouseRule))))
+    for name, rules in variants:
+        result = run_batch(list(range(args.seed, args.seed + games)), ['greedy'] * 4, rules=rules)
+        print(f'rules ({name}): {result.turns / result.games:.1f} turns/game, '
+              f'{result.turns / result.elapsed:,.0f} turns/sec')
+
+
+def bench_setup(args):
+    players = [Player(seat, f'bot{seat}') for seat in range(4)]
+    start = time.perf_counter()
+    games = []
+    for i in range(args.games):
+        game = Game(players[0], rng=random.Random(args.seed + i))
+        game.players.extend(players[1:])
+        game.state = GameState.READY_TO_START
+        game.deal()
+        games.append(game)
+    report('game setup (4 players)', args.games, 'games', time.perf_counter() - start)
+
+    game = games[0]
+    start = time.perf_counter()
+    for _ in range(args.games):
+        game.__new_deck__()
+    report('deck template copy + shuffle', args.games, 'decks', time.perf_counter() - start)
+
+
+def bench_large_lobby(args):
+    game = create_game(args.seed, 24)
+    for player in game.players:
+        game.__pick_up_cards__(player, 33)
+    rng = random.Random(args.seed)
+    turns = 0
+    start = time.perf_counter()
+    while turns < args.games * 10 and game.state == GameState.ONGOING:
+        player = game.current_player
+        game.playable_cards(player)
+        card_id, wild_color = first_playable_policy(game, player, rng)
+        game.apply_turn(player.discord_tag, card_id, wild_color)
+        turns += 1
+    report('large_lobby (24 players, 40 cards)', turns, 'turns', time.perf_counter() - start)
+
+
+class FakeMessage:
+    def __init__(self, id: int, latency: float):
+        self.id = id
+        self.latency = latency
+        self.edits = 0
+
+    async def edit(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        self.edits += 1
+
+
+def percentile(samples: list[float], q: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def bench_render(args):
+    latency = 0.02
+    channels = 50
+    turns_per_channel = max(1, args.games // 100)
+
+    async def sequential(samples: list[float]) -> int:
+        board, current, last = (FakeMessage(i, latency) for i in range(3))
+        for _ in range(turns_per_channel):
+            start = time.perf_counter()
+            # a turn fires the board callback more than once (player count, ongoing, turn completed)
+            for message in (board, board, current, last):
+                await message.edit(content='')
+            samples.append(time.perf_counter() - start)
+        return board.edits + current.edits + last.edits
+
+    async def scheduled(scheduler: RenderScheduler, channel_id: int, samples: list[float]) -> int:
+        board, current, last = (FakeMessage(i, latency) for i in range(3))
+        for _ in range(turns_per_channel):
+            start = time.perf_counter()
+            waiters = [scheduler.schedule(channel_id, message.id, message, lambda: dict(content=''))
+                       for message in (board, board, current, last)]
+            await asyncio.gather(*waiters)
+            samples.append(time.perf_counter() - start)
+        return board.edits + current.edits + last.edits
+
+    async def run(mode: str):
+        samples: list[float] = []
+        scheduler = RenderScheduler(delay=0.005, rate=50, per=1.0)
+        start = time.perf_counter()
+        if mode == 'sequential':
+            edits = await asyncio.gather(*(sequential(samples) for _ in range(channels)))
+        else:
+            edits = await asyncio.gather(*(scheduled(scheduler, c, samples) for c in range(channels)))
+        elapsed = time.perf_counter() - start
+        turns = channels * turns_per_channel
+        print(f'render ({mode}): {sum(edits) / turns:.2f} edits/turn, '
+              f'p50 {percentile(samples, 0.5) * 1000:.1f}ms, p99 {percentile(samples, 0.99) * 1000:.1f}ms, '
+              f'{turns / elapsed:,.0f} turns/sec')
+
+    asyncio.run(run('sequential'))
+    asyncio.run(run('scheduled'))
+
+
+def bench_restore(args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        store = SnapshotStore(directory, compact_after=64)
+        start = time.perf_counter()
+        journaled = 0
+        for channel_id in range(args.games):
+            game = create_game(args.seed + channel_id, 4)
+            store.save(channel_id, channel_id, game)
+            for _ in range(rng.randrange(100)):
+                player = game.current_player
+                card_id, wild_color = first_playable_policy(game, player, rng)
+                if game.apply_turn(player.discord_tag, card_id, wild_color) is not None:
+                    break
+                store.append_turn(channel_id, channel_id, game, *game.last_action)
+                journaled += 1
+        submitted = time.perf_counter() - start
+        store.flush()
+        report('snapshot writes (event loop side)', args.games, 'games', submitted)
+        report('snapshot writes (including disk)', journaled + args.games, 'writes', time.perf_counter() - start)
+        store.close()
+
+        start = time.perf_counter()
+        restored = SnapshotStore(directory).load_all()
+        report('cold-start restore', len(restored), 'games', time.perf_counter() - start)
+
+
+SHARD_BENCH_GAMES_ENV = 'UNO_BENCH_GAMES_PER_SHARD'
+
+
+class FakeShardGateway:
+    # what the gateway delivers to one worker: button clicks of the games in the guilds of its shards,
+    # made by players looking at their hand the way main renders it
+    def __init__(self, shard_ids: list[int], shard_count: int, games_per_shard: int):
+        self.tables: dict[int, Game] = {}
+        self.guilds: dict[int, int] = {}
+        for shard_id in shard_ids:
+            for index in range(games_per_shard):
+                guild_id = (index * shard_count + shard_id) << 22  # snowflakes are sharded by their upper bits
+                self.tables[guild_id + 1] = create_game(guild_id, 4)
+                self.guilds[guild_id + 1] = guild_id
+        self.sent = 0
+
+    def click(self, channel_id: int, game: Game) -> bytes:
+        player = game.current_player
+        buttons, _, _ = hand_page(channel_id, game, player, 0)
+        custom_id = next(custom_id for _, custom_id, disabled in buttons if not disabled)
+        _, action, arg = decode_custom_id(custom_id)
+        if action == Action.WILD:
+            custom_id = encode_custom_id(channel_id, Action.COLOR, f'{arg}.{pick_wild_color(game, player).value}')
+        self.sent += 1
+        return json.dumps({'t': 'INTERACTION_CREATE', 'd': {
+            'id': str(self.sent), 'type': 3, 'channel_id': str(channel_id), 'guild_id': str(self.guilds[channel_id]),
+            'member': {'user': {'id': str(player.discord_tag), 'username': player.nickname}},
+            'data': {'component_type': 2, 'custom_id': custom_id}}}).encode()
+
+    def receive(self) -> list[bytes]:
+        # one click per running game, the next batch is what players do after seeing the outcome
+        return [self.click(channel_id, game) for channel_id, game in self.tables.items()
+                if game.state == GameState.ONGOING]
+
+
+async def serve_shards(shard_ids: list[int], shard_count: int, gateway: FakeShardGateway) -> dict[str, int]:
+    # the interaction path of a worker: decode the event, check it belongs to this worker's shards,
+    # route the custom id and apply the move through the channel's actor
+    router = Router()
+    actors = {channel_id: GameActor() for channel_id in gateway.tables}
+    outcomes = {'applied': 0, 'rejected': 0, 'misrouted': 0}
+
+    def clicked(interaction: dict) -> tuple[Game, int]:
+        return gateway.tables[int(interaction['channel_id'])], int(interaction['member']['user']['id'])
+
+    @router.route(Action.PLAY)
+    async def play(interaction: dict, channel_id: int, arg: str):
+        game, discord_tag = clicked(interaction)
+        await game.process_turn(discord_tag, int(arg), None)
+
+    @router.route(Action.DRAW)
+    async def draw(interaction: dict, channel_id: int, arg: str):
+        game, discord_tag = clicked(interaction)
+        await game.process_turn(discord_tag, None, None)
+
+    @router.route(Action.COLOR)
+    async def color(interaction: dict, channel_id: int, arg: str):
+        game, discord_tag = clicked(interaction)
+        card, wild_color = arg.split('.')
+        await game.process_turn(discord_tag, int(card), Color(int(wild_color)))
+
+    async def on_event(event: bytes):
+        interaction = json.loads(event)['d']
+        if shard_for_guild(int(interaction['guild_id']), shard_count) not in shard_ids:
+            outcomes['misrouted'] += 1
+            return
+        channel_id, action, arg = decode_custom_id(interaction['data']['custom_id'])
+        try:
+            await actors[channel_id].submit(interaction['id'],
+                                            lambda: router.dispatch(interaction, channel_id, action, arg))
+            outcomes['applied'] += 1
+        except RuntimeError:
+            outcomes['rejected'] += 1
+
+    while events := gateway.receive():
+        await asyncio.gather(*map(on_event, events))
+    return outcomes
+
+
+SHARD_BENCH_GAMES_ENV = 'UNO_BENCH_GAMES_PER_SHARD'
+
+
+def shard_worker():
+    shard_ids, shard_count = shards_from_env()
+    gateway = FakeShardGateway(shard_ids, shard_count, int(os.environ[SHARD_BENCH_GAMES_ENV]))
+    outcomes = asyncio.run(serve_shards(shard_ids, shard_count, gateway))
+    if outcomes['rejected'] or outcomes['misrouted']:
+        print(f'shard_worker, shards {shard_ids}: {outcomes}')
+        sys.exit(1)
+
+
+def bench_shards(args):
+    shard_count = 8
+    games_per_shard = max(1, args.games // shard_count)
+    os.environ[SHARD_BENCH_GAMES_ENV] = str(games_per_shard)
+    command = [sys.executable, '-c', 'import benchmark; benchmark.shard_worker()']
+    workers = 1
+    while workers <= min(shard_count, os.cpu_count() or 1):
+        # worker processes as the supervisor runs them, each serving the interactions of its own shards
+        supervisor = Supervisor(command, workers, shard_count, restart=False)
+        start = time.perf_counter()
+        supervisor.start()
+        supervisor.wait(interval=0.01)
+        elapsed = time.perf_counter() - start
+        failed = sum(worker.process.returncode != 0 for worker in supervisor.workers)
+        report(f'shards ({workers} workers, {shard_count} shards)', games_per_shard * shard_count, 'games', elapsed)
+        if failed:
+            raise RuntimeError(f'bench_shards, {failed} of {workers} workers failed')
+        workers *= 2
+
+
+def legacy_hand_view(game: Game, player: Player):
+    from discord.ui import Button, View
+
+    async def draw_card_callback(interaction):
+        await game.process_turn(player.discord_tag, None, None)
+
+    buttons = []
+    for card in game.playersToCards[player]:
+        async def regular_card_callback(interaction):
+            await game.process_turn(player.discord_tag, int(interaction.data['custom_id']), None)
+
+        async def wild_card_callback(interaction):
+            pass
+
+        buttons.append(Button(label=card_label(card), custom_id=str(card_id(card)), disabled=(
+                not game.is_playable(card) or game.current_player.discord_tag != player.discord_tag)))
+        buttons[-1].callback = wild_card_callback if is_wild(card) else regular_card_callback
+    buttons.append(Button(label='Draw a card', disabled=game.current_player.discord_tag != player.discord_tag))
+    buttons[-1].callback = draw_card_callback
+    v = View(timeout=None)
+    for button in buttons:
+        v.add_item(button)
+    return v
+
+
+def measure_renders(name: str, render: Callable, count: int):
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    result = render()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    start = time.perf_counter()
+    for _ in range(count):
+        render()
+    elapsed = time.perf_counter() - start
+    print(f'{name}: {count / elapsed:,.0f} renders/sec, {(retained - before) / 1024:.1f} KiB retained and '
+          f'{(peak - before) / 1024:.1f} KiB peak per render')
+
+
+def bench_views(args):
+    game = create_game(args.seed, 2)
+    player = game.current_player
+    game.__pick_up_cards__(player, 13)
+    measure_renders('hand_page (data only)', lambda: hand_page(1, game, player, 0), args.games)
+    try:
+        import discord.ui
+    except ImportError:
+        print('views: discord.py is not installed, skipping the View comparison')
+        return
+
+    async def run():
+        measure_renders('legacy closure view', lambda: legacy_hand_view(game, player), args.games)
+        measure_renders('routed view', lambda: build_view(hand_page(1, game, player, 0)[0]), args.games)
+
+    asyncio.run(run())
+
+
+def bench_actor(args):
+    clicks = args.games * 5
+
+    async def run():
+        rng = random.Random(args.seed)
+        latencies: list[float] = []
+        outcomes = {'applied': 0, 'rejected': 0, 'duplicate': 0, 'busy': 0}
+        games = 0
+
+        async def click(game: Game, actor: GameActor, player: Player):
+            card_id, wild_color = first_playable_policy(game, player, rng)
+            start = time.perf_counter()
+            try:
+                await actor.submit((player.discord_tag, card_id),
+                                   lambda: game.process_turn(player.discord_tag, card_id, wild_color))
+                outcomes['applied'] += 1
+            except DuplicateAction:
+                outcomes['duplicate'] += 1
+            except ActorBusy:
+                outcomes['busy'] += 1
+            except RuntimeError:
+                outcomes['rejected'] += 1  # a CorruptedGame is no RuntimeError, it ends the run
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        while len(latencies) < clicks:
+            game = create_game(args.seed + games, 6)
+            games += 1
+
+            async def on_turn_completed(event: TurnCompleted):
+                # rendering and persistence yield to the event loop in the middle of a turn
+                await asyncio.sleep(0)
+                check_consistency(event.game)
+
+            game.events.subscribe(TurnCompleted, on_turn_completed)
+            actor = GameActor(max_depth=32)
+            while game.state == GameState.ONGOING and len(latencies) < clicks:
+                # everyone mashes buttons at once, only the current player's first click can apply
+                batch = []
+                for player in game.players:
+                    batch.append(click(game, actor, player))
+                    if rng.random() < 0.3:
+                        batch.append(click(game, actor, player))
+                await asyncio.gather(*batch)
+            check_consistency(game)
+        elapsed = time.perf_counter() - start
+        print(f'actor: {len(latencies)} clicks over {games} games in {elapsed:.2f}s, {outcomes}, '
+              f'p50 {percentile(latencies, 0.5) * 1000:.2f}ms, p99 {percentile(latencies, 0.99) * 1000:.2f}ms')
+
+    asyncio.run(run())
+
+
+def bench_hand_pages(args):
+    for hand_size in (7, 25, 100):
+        game = create_game(args.seed, 2)
+        player = game.current_player
+        game.__pick_up_cards__(player, hand_size - 7)
+        hand = game.playersToCards[player]
+        start = time.perf_counter()
+        for page in range(args.games):
+            hand_page(1, game, player, page % 3)
+        elapsed = time.perf_counter() - start
+        print(f'hand pages: {len(hand)} cards, {len(hand.faces)} distinct faces, '
+              f'{args.games / elapsed:,.0f} renders/sec')
+
+
+def bench_tournament(args):
+    entrants = 512
+    create_latency = 0.05  # a thread plus its first message
+
+    async def run():
+        rng = random.Random(args.seed)
+        players = [Player(i, f'Player {i}') for i in range(entrants)]
+        lags: list[float] = []
+        done = asyncio.Event()
+
+        async def heartbeat():
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.005)
+                lags.append(time.perf_counter() - start - 0.005)
+
+        for mode in TournamentMode:
+            t = Tournament(players[0], mode, rng=random.Random(args.seed))
+            for player in players[1:]:
+                t.add_entrant(player)
+            # 50 tables per second is what the scheduler would be given across a handful of channels
+            scheduler = TableScheduler(rate=50, per=1.0)
+            lags.clear()
+            done.clear()
+            monitor = asyncio.create_task(heartbeat())
+            tables = t.start()
+            turns = 0
+            while tables:
+                round_start = time.perf_counter()
+                played = t.round
+                next_round: list[Table] = []
+
+                async def play(table: Table):
+                    nonlocal turns
+                    await asyncio.sleep(create_latency)
+                    game = create_table_game(table, random.Random(rng.random()))
+
+                    async def on_finished(event: GameFinished):
+                        next_tables = t.record_winner(table, event.winner)
+                        if next_tables is not None:
+                            next_round.extend(next_tables)
+
+                    game.events.subscribe(GameFinished, on_finished)
+                    await game.start_game()
+                    while game.state == GameState.ONGOING:
+                        player = game.current_player
+                        card_id, wild_color = first_playable_policy(game, player, rng)
+                        await game.process_turn(player.discord_tag, card_id, wild_color)
+                        turns += 1
+                        await asyncio.sleep(0)
+
+                await scheduler.open_tables(tables, play)
+                print(f'tournament: {t.mode.value} round {played}, {len(tables)} tables, '
+                      f'{time.perf_counter() - round_start:.2f}s')
+                tables = next_round
+            done.set()
+            await monitor
+            print(f'tournament: {mode.value} with {entrants} entrants, {turns} turns, champion '
+                  f'{t.champion.nickname}, event loop lag p99 {percentile(lags, 0.99) * 1000:.2f}ms '
+                  f'max {max(lags) * 1000:.2f}ms')
+
+    asyncio.run(run())
+
+
+def bench_ai(args):
+    budget = 0.02
+    games = max(10, args.games // 100)
+    policy = MonteCarloPolicy(budget)
+    start = time.perf_counter()
+    wins = 0
+    for seed in range(args.seed, args.seed + games):
+        # both seat orders so that moving first does not favour either policy
+        wins += run_game(seed, [policy, greedy_policy]).winner_seat == 0
+        wins += run_game(seed, [greedy_policy, policy]).winner_seat == 1
+    elapsed = time.perf_counter() - start
+    report('ai rollouts', policy.rollouts, 'rollouts', elapsed)
+    print(f'ai: montecarlo ({budget * 1000:.0f}ms per move) won {wins}/{games * 2} games '
+          f'({wins / games / 2:.1%}) against greedy')
+    baseline = run_batch(list(range(args.seed, args.seed + args.games)), ['greedy', 'first'])
+    print(f'ai: greedy won {baseline.wins[0]}/{baseline.games} games ({baseline.wins[0] / baseline.games:.1%}) '
+          f'against first playable')
+
+    async def run():
+        runner = AIRunner(workers=args.workers, budget=0.1)
+        lags: list[float] = []
+        done = asyncio.Event()
+
+        async def heartbeat():
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.005)
+                lags.append(time.perf_counter() - start - 0.005)
+
+        monitor = asyncio.create_task(heartbeat())
+        game = create_game(args.seed, 4)
+        start = time.perf_counter()
+        moves = 0
+        while game.state == GameState.ONGOING and moves < 20:
+            player = game.current_player
+            await game.process_turn(player.discord_tag, *await runner.choose(game, player))
+            moves += 1
+        elapsed = time.perf_counter() - start
+        done.set()
+        await monitor
+        runner.close()
+        print(f'ai: {moves} pooled moves in {elapsed:.2f}s, event loop lag p99 {percentile(lags, 0.99) * 1000:.2f}ms '
+              f'max {max(lags) * 1000:.2f}ms')
+
+    asyncio.run(run())
+
+
+class RespStandIn:
+    # just enough of a redis server for the game store: hashes, DEL, and the compare-and-set script
+    def __init__(self):
+        self.hashes: dict[bytes, dict[bytes, bytes]] = {}
+        self.commands = 0
+
+    def execute(self, command: list[bytes]) -> bytes:
+        self.commands += 1
+        name = command[0].upper()
+        if name == b'PING':
+            return b'+PONG\r\n'
+        if name == b'SCRIPT':
+            return b'$%d\r\n%s\r\n' % (len(CAS_SHA), CAS_SHA)
+        if name == b'DEL':
+            return b':%d\r\n' % (self.hashes.pop(command[1], None) is not None)
+        if name == b'HMGET':
+            fields = self.hashes.get(command[1], {})
+            values = [fields.get(field) for field in command[2:]]
+            return b'*%d\r\n' % len(values) + b''.join(
+                b'$-1\r\n' if v is None else b'$%d\r\n%s\r\n' % (len(v), v) for v in values)
+        if name == b'EVALSHA' and command[1] == CAS_SHA:
+            key, expected, data = command[3], int(command[4]), command[5]
+            fields = self.hashes.setdefault(key, {})
+            version = int(fields.get(b'version', b'0'))
+            if version != expected:
+                return b':-1\r\n'
+            fields[b'data'] = data
+            fields[b'version'] = b'%d' % (version + 1)
+            return b':%d\r\n' % (version + 1)
+        return b'-ERR unknown command\r\n'
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                header = await reader.readline()
+                if not header:
+                    break
+                command = []
+                for _ in range(int(header[1:-2])):
+                    length = int((await reader.readline())[1:-2])
+                    command.append((await reader.readexactly(length + 2))[:-2])
+                writer.write(self.execute(command))
+                if not reader._buffer:
+                    await writer.drain()
+        finally:
+            writer.close()
+
+
+def bench_store(args):
+    games = 200
+    turns_per_game = max(10, args.games // 20)
+
+    async def play(store: GameStore, offset: int) -> int:
+        turns = 0
+        rng = random.Random(args.seed)
+
+        async def run(channel_id: int):
+            nonlocal turns
+            game = create_game(args.seed + channel_id - offset, 4)
+            store.add(channel_id, game, FakeMessage(channel_id, 0))
+            await store.commit(channel_id)
+            for _ in range(turns_per_game):
+                # a game evicted from the local cache is loaded again, like the next interaction would
+                game = (await store.load(channel_id)).game
+                if game.state != GameState.ONGOING:
+                    break
+                player = game.current_player
+                game.apply_turn(player.discord_tag, *first_playable_policy(game, player, rng))
+                await store.commit(channel_id)
+                turns += 1
+
+        await asyncio.gather(*(run(offset + i) for i in range(games)))
+        return turns
+
+    async def run():
+        start = time.perf_counter()
+        turns = await play(MemoryGameStore(), 0)
+        report('store memory', turns, 'turns', time.perf_counter() - start)
+
+        stand_in = RespStandIn()
+        server = await asyncio.start_server(stand_in.handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        for cache_size in (games, games // 2):
+            # with half the games cached every access misses, the worst case for the local cache
+            store = RedisGameStore('127.0.0.1', port, cache_size=cache_size)
+            commands = stand_in.commands
+            start = time.perf_counter()
+            turns = await play(store, games * 2 if cache_size < games else games)
+            elapsed = time.perf_counter() - start
+            report(f'store redis, cache {cache_size}/{games}', turns, 'turns', elapsed)
+            print(f'store redis: {store.round_trips} round trips, '
+                  f'{(stand_in.commands - commands) / store.round_trips:.1f} commands per round trip')
+            await store.close()
+
+        # two processes pick up the same game, only the first turn to reach redis may apply
+        first = RedisGameStore('127.0.0.1', port)
+        second = RedisGameStore('127.0.0.1', port)
+        channel_id = games * 4
+        first.add(channel_id, create_game(args.seed, 4), FakeMessage(channel_id, 0))
+        await first.commit(channel_id)
+        first.pop(channel_id)
+        outcomes = []
+        for other in (first, second):
+            entry = await other.load(channel_id)
+            player = entry.game.current_player
+            entry.game.apply_turn(player.discord_tag, *first_playable_policy(entry.game, player, random.Random()))
+        for other in (first, second):
+            try:
+                await other.commit(channel_id)
+                outcomes.append('applied')
+            except VersionConflict:
+                outcomes.append(f'conflict, cached: {channel_id in other}')
+        print(f'store redis: concurrent turns from two processes: {outcomes}')
+        for other in (first, second):
+            await other.close()
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(run())
+
+
+def bench_soak(args):
+    # a simulated week of traffic against a fake clock: lobbies that never start, games whose players walk
+    # away mid-game and games that are played out, with the reaper as the only thing keeping memory in check
+    days = 7
+    games_per_hour = max(60, args.games // 10)
+
+    async def run():
+        now = 0.0
+        store = MemoryGameStore()
+        actors: dict[int, GameActor] = {}
+        rng = random.Random(args.seed)
+        finished = 0
+
+        async def close(channel_id: int, content: str):
+            store.delete(channel_id)
+            actors.pop(channel_id).close()
+            reaper.forget(channel_id)
+
+        with tempfile.TemporaryDirectory() as directory:
+            archive = SnapshotStore(directory)
+            reaper = Reaper(store, close, submit=lambda channel_id, action: actors[channel_id].submit(None, action),
+                            archive=archive, max_games=games_per_hour // 2, clock=lambda: now)
+            tracemalloc.start()
+            channel_id = 0
+            for hour in range(days * 24):
+                for _ in range(games_per_hour):
+                    channel_id += 1
+                    kind = rng.random()
+                    game = create_game(args.seed + channel_id, 4) if kind > 0.3 else Game(Player(0, 'bot0'))
+                    store.add(channel_id, game, FakeMessage(channel_id, 0))
+                    actors[channel_id] = GameActor()
+
+                    async def on_finished(event: GameFinished, channel_id=channel_id):
+                        nonlocal finished
+                        finished += 1
+                        await close(channel_id, '')
+
+                    async def on_activity(event: GameEvent, channel_id=channel_id):
+                        reaper.touch(channel_id)
+
+                    game.events.subscribe(GameFinished, on_finished)
+                    game.events.subscribe((TurnCompleted, PlayersChanged), on_activity)
+                    await reaper.admit(channel_id)
+                    if kind > 0.6:
+                        # played out right away
+                        while game.state == GameState.ONGOING:
+                            player = game.current_player
+                            await game.process_turn(player.discord_tag, *first_playable_policy(game, player, rng))
+                    elif kind > 0.3:
+                        # a few turns, then everybody leaves
+                        for _ in range(rng.randrange(10)):
+                            player = game.current_player
+                            await game.process_turn(player.discord_tag, *first_playable_policy(game, player, rng))
+                live = len(store)
+                for _ in range(60):
+                    now += 60.0
+                    await reaper.reap()
+                if hour % 24 == 23:
+                    current, _ = tracemalloc.get_traced_memory()
+                    print(f'soak: day {hour // 24 + 1}, {live} live games at the hour, {len(reaper.wheel)} timers, '
+                          f'{current / 1e6:.1f} MB traced, {finished} finished, {reaper.expired} expired, '
+                          f'{reaper.auto_draws} auto draws, {reaper.kicks} kicks, {reaper.archived} archived')
+            tracemalloc.stop()
+            archive.close()
+
+    asyncio.run(run())
+
+
+def bench_replay(args):
+    seeds = list(range(args.seed, args.seed + args.games))
+    plain = run_batch(seeds, ['first', 'random', 'random'])
+    recorded = run_batch(seeds, ['first', 'random', 'random'], record=True)
+    print(f'replay: recording costs {recorded.elapsed / plain.elapsed - 1:+.1%} on simulation time, '
+          f'{len(recorded.logs) / recorded.games:.0f} bytes per game, {len(recorded.logs) / recorded.turns:.1f} per turn')
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'games.unolog')
+        with open(path, 'wb') as archive:
+            for _ in range(5):
+                archive.write(recorded.logs)  # a bigger archive without paying for the simulation again
+        stats = analyse([path], args.workers)
+        report('replay', stats.games, 'games', stats.elapsed)
+        tracemalloc.start()
+        analyse([path])
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'replay: {os.path.getsize(path) / 1e6:.1f} MB archive analysed with a {peak / 1e6:.2f} MB peak, '
+              f'{stats.turns} turns, winners match the simulation: {stats.finished == plain.finished * 5}')
+
+    result = replay_game(next(iter_games(memoryview(recorded.logs))))
+    expected = run_game(seeds[0], [first_playable_policy, random_policy, random_policy]).winner_seat
+    print(f'replay: first game replayed to the same winner: {result.players.index(result.winner) == expected}')
+
+
+def bench_events(args):
+    # the listeners main attaches to a game: a store commit that waits on a round trip, a journal write
+    # and a render
+    round_trip = 0.002
+    turns = max(args.games // 10, 50)
+
+    async def run():
+        renders = 0
+
+        async def persist(event: GameEvent):
+            await asyncio.sleep(round_trip)
+
+        async def journal(event: GameEvent):
+            await asyncio.sleep(round_trip / 2)
+
+        async def render(event: GameEvent):
+            nonlocal renders
+            if event.game.state != GameState.STARTED:
+                renders += 1
+
+        async def broken(event: GameEvent):
+            raise RuntimeError('broken, listener failed')
+
+        listeners = [persist, journal, render]
+        game = create_game(args.seed, 4)
+        event = TurnCompleted(game, game.current_player, game.current_card, game.current_player)
+        start = time.perf_counter()
+        for _ in range(turns):
+            for listener in listeners:
+                await listener(event)
+        sequential = (time.perf_counter() - start) / turns
+
+        bus = EventBus()
+        for listener in listeners:
+            bus.subscribe(TurnCompleted, listener)
+        start = time.perf_counter()
+        for _ in range(turns):
+            await bus.publish(event)
+        concurrent = (time.perf_counter() - start) / turns
+        print(f'events: turn fan-out {sequential * 1000:.2f}ms sequential, {concurrent * 1000:.2f}ms concurrent')
+
+        renders = 0
+        bus.subscribe(TurnCompleted, broken)
+        errors = await bus.publish(event)
+        print(f'events: a failing listener is isolated, {len(errors)} error returned, {renders} render still done')
+
+        renders = 0
+        game = Game(Player(0, 'admin'))
+        game.events.subscribe((PlayersChanged, StateChanged, TurnCompleted), render)
+        for i in range(1, 4):
+            await game.add_player(Player(i, f'player{i}'))
+        await game.start_game()
+        print(f'events: {renders} renders for 3 joins and a start')
+
+    asyncio.run(run())
+
+
+def bench_images(args):
+    # the renders reformat_game_message would queue: the board and the hands of the current and last player
+    if not images_available():
+        print('images: Pillow is not installed, skipped')
+        return
+    games = max(args.games // 10, 20)
+
+    async def run():
+        renderer = CardRenderer()
+        start = time.perf_counter()
+        await renderer.preload()
+        print(f'images: sprite atlas drawn in {(time.perf_counter() - start) * 1000:.1f}ms')
+        rng = random.Random(args.seed)
+        lags: list[float] = []
+        done = asyncio.Event()
+
+        async def heartbeat():
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.002)
+                lags.append(time.perf_counter() - start - 0.002)
+
+        monitor = asyncio.create_task(heartbeat())
+        renders = 0
+        start = time.perf_counter()
+        for seed in range(args.seed, args.seed + games):
+            game = create_game(seed, 4)
+            while game.state == GameState.ONGOING:
+                player = game.current_player
+                game.apply_turn(player.discord_tag, *first_playable_policy(game, player, rng))
+                if game.state != GameState.ONGOING:
+                    break
+                jobs = [renderer.board(game.current_card, game.current_color, game.pickup_stack, game.is_reversed)]
+                for other in (game.current_player, game.last_player):
+                    if other is not None:
+                        mask = game.playable_mask if other is game.current_player else 0
+                        jobs.append(renderer.hand(game.playersToCards[other].faces, mask))
+                await asyncio.gather(*jobs)
+                renders += len(jobs)
+        elapsed = time.perf_counter() - start
+        done.set()
+        await monitor
+        report('images', renders, 'renders', elapsed)
+        print(f'images: {renderer.hits / (renderer.hits + renderer.misses):.1%} cache hits, '
+              f'{renderer.misses} images drawn, event loop lag p99 {percentile(lags, 0.99) * 1000:.2f}ms')
+        renderer.close()
+
+    asyncio.run(run())
+
+
+def bench_stats(args):
+    # games recorded while leaderboards are cached, then the top queries against an archive of millions of games
+    guilds = 10
+    games = args.games * 10
+    archived = args.games * 500
+
+    async def run(directory: str):
+        store = StatsStore(os.path.join(directory, 'stats.sqlite3'))
+        for guild_id in range(guilds):
+            await store.leaderboard(guild_id)  # empty boards are cached and have to be kept right from then on
+        rng = random.Random(args.seed)
+        game = create_game(args.seed, 4)
+        lags: list[float] = []
+        costs: list[float] = []
+        done = asyncio.Event()
+
+        async def heartbeat():
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.002)
+                lags.append(time.perf_counter() - start - 0.002)
+
+        monitor = asyncio.create_task(heartbeat())
+        start = time.perf_counter()
+        for i in range(games):
+            guild_id = rng.randrange(guilds)
+            game.players = [Player(guild_id * 1000 + tag, f'player{tag}') for tag in rng.sample(range(300), 4)]
+            begin = time.perf_counter()
+            store.record(guild_id, guild_id, game, rng.choice(game.players))
+            costs.append(time.perf_counter() - begin)
+            if i % 10 == 0:
+                await asyncio.sleep(0)  # finished games arrive between turns, not in one burst
+        await asyncio.get_running_loop().run_in_executor(None, store.flush)
+        elapsed = time.perf_counter() - start
+        done.set()
+        await monitor
+        report('stats writes', store.written, 'games', elapsed)
+        print(f'stats: record() p99 {percentile(costs, 0.99) * 1e6:.1f}us on the event loop, '
+              f'event loop lag p99 {percentile(lags, 0.99) * 1000:.2f}ms')
+        stale = 0
+        for guild_id in range(guilds):
+            cached = [(row.discord_tag, row.rating) for row in await store.leaderboard(guild_id)]
+            stored = [(row.discord_tag, row.rating) for row in store.__top__(guild_id, len(cached))]
+            stale += cached != stored
+        print(f'stats: {stale} of {guilds} incrementally updated leaderboards differ from the database')
+
+        # an archive of old games and a big guild, written directly as the writer would have over years
+        connection = store.connection
+        connection.execute('BEGIN')
+        connection.executemany(
+            'INSERT INTO games (guild_id, channel_id, finished_at, winner, player_count) VALUES (?, ?, ?, ?, ?)',
+            ((i % 1000 + guilds, 0, i, i, 4) for i in range(archived)))
+        connection.executemany(
+            'INSERT INTO players (guild_id, discord_tag, nickname, rating, games, wins) VALUES (?, ?, ?, ?, ?, ?)',
+            ((guilds + i % 1000, i, f'player{i}', INITIAL_RATING + rng.gauss(0, 200), 10, 5)
+             for i in range(archived // 10)))
+        connection.execute('COMMIT')
+        store.cache.clear()
+        plan = connection.execute('EXPLAIN QUERY PLAN SELECT discord_tag FROM players WHERE guild_id = ? '
+                                  'ORDER BY rating DESC, discord_tag LIMIT ?', (0, 10)).fetchall()
+        print(f'stats: {archived:,} archived games, top query plan: {plan[-1][-1]}')
+        for name, queries in (('uncached', lambda: store.cache.clear()), ('cached', lambda: None)):
+            samples = []
+            for i in range(200):
+                queries()
+                begin = time.perf_counter()
+                await store.leaderboard(guilds + i % 20)
+                samples.append(time.perf_counter() - begin)
+            print(f'stats leaderboard ({name}): p50 {percentile(samples, 0.5) * 1000:.3f}ms, '
+                  f'p99 {percentile(samples, 0.99) * 1000:.3f}ms')
+        begin = time.perf_counter()
+        await store.player(guilds, guilds)
+        print(f'stats: rank of one player in {(time.perf_counter() - begin) * 1000:.2f}ms')
+        store.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(directory))
+
+
+IMPORT_TARGETS = ('card', 'game', 'simulation', 'replay', 'ai', 'stats', 'main')
+# the engine and what simulation and replay workers import stay clear of these: typing alone costs more to import
+# than the engine, so annotations come from collections.abc and pools and json are imported where they are used
+HEAVY_MODULES = ('asyncio', 'concurrent.futures', 'discord', 'json', 'typing')
+
+
+def import_profile(module: str) -> list[tuple[int, int, str]] | None:
+    # -X importtime rows of a fresh interpreter: self and cumulative microseconds, the module last
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        return None
+    rows = []
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and 'self [us]' not in line:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            rows.append((int(self_us), int(cumulative_us), name.rstrip()[1:]))
+    # the interpreter's own startup is listed first, only what the module pulls in is kept
+    first = len(rows) - 1
+    while first > 0 and rows[first - 1][2].startswith(' '):
+        first -= 1
+    return [(self_us, cumulative_us, name.strip()) for self_us, cumulative_us, name in rows[first:]]
+
+
+def bench_imports(args):
+    # what a simulation or ai worker process pays before it can play, and what the bot pays before logging in
+    here = os.path.dirname(os.path.abspath(__file__))
+    for module in IMPORT_TARGETS:
+        profiles = [import_profile(module) for _ in range(5)]
+        if profiles[0] is None:
+            print(f'imports: {module} cannot be imported here, is discord installed?')
+            continue
+        best = min(profiles, key=lambda rows: rows[-1][1])
+        check = subprocess.run([sys.executable, '-c', f'import sys, {module}; '
+                                f'print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))'],
+                               capture_output=True, text=True, cwd=here)
+        print(f'imports: {module} in {best[-1][1] / 1000:.1f}ms, loads {check.stdout.strip() or "none"} of '
+              f'{", ".join(HEAVY_MODULES)}')
+        if module == 'game':
+            slowest = sorted(best, reverse=True)[:5]
+            print('imports: slowest modules under game: '
+                  + ', '.join(f'{name} {self_us / 1000:.1f}ms' for self_us, _, name in slowest))
+    for name, code in (('bare interpreter', 'pass'), ('simulation worker', 'import simulation')):
+        samples = []
+        for _ in range(5):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], check=True, cwd=here)
+            samples.append(time.perf_counter() - start)
+        print(f'imports: {name} starts in {min(samples) * 1000:.1f}ms')
+
+
+def bench_spectators(args):
+    # a streamed game with a growing audience: the shared view against a view rendered and sent per spectator
+    latency = 0.02
+    turn_gap = 0.005  # players take a moment between turns
+    turns = max(args.games // 50, 20)
+
+    async def play(spectators: int, shared: bool) -> tuple[int, int, list[float]]:
+        scheduler = RenderScheduler(delay=0.005, rate=50, per=1.0)
+        game = create_game(args.seed, 4)
+        broadcast = Broadcast(game)
+        broadcast.message = FakeMessage(0, latency)
+        messages = [FakeMessage(i + 1, latency) for i in range(spectators)]
+        fanout: list[float] = []
+        renders = 0
+
+        def render_for(viewer: FakeMessage) -> dict:
+            nonlocal renders
+            renders += 1
+            return dict(content=spectator_view(game, broadcast.recent))
+
+        async def deliver(event: GameEvent):
+            start = time.perf_counter()
+            broadcast.changed(event)
+            if shared:
+                scheduler.schedule(0, 0, broadcast.message, broadcast.render, bucket=0)
+            else:
+                for message in messages:
+                    scheduler.schedule(0, message.id, message, lambda m=message: render_for(m), bucket=message.id)
+            fanout.append(time.perf_counter() - start)
+
+        game.events.subscribe((SpectatorsChanged, TurnCompleted), deliver)
+        for i in range(spectators):
+            await game.add_spectator(Player(100_000 + i, f'spectator{i}'))
+        fanout.clear()
+        rng = random.Random(args.seed)
+        for _ in range(turns):
+            if game.state != GameState.ONGOING:
+                break
+            player = game.current_player
+            await game.process_turn(player.discord_tag, *first_playable_policy(game, player, rng))
+            await asyncio.sleep(turn_gap)
+        while scheduler.channels:
+            await asyncio.sleep(latency)
+        edits = broadcast.message.edits + sum(message.edits for message in messages)
+        return broadcast.renders + renders, edits, fanout
+
+    for spectators, shared in ((10, True), (100, True), (1000, True), (10, False), (100, False), (1000, False)):
+        renders, edits, fanout = asyncio.run(play(spectators, shared))
+        print(f'spectators ({"shared view" if shared else "view per spectator"}, {spectators}): '
+              f'{renders} renders and {edits} edits for {spectators} joins and {len(fanout)} turns, '
+              f'fan-out p50 {percentile(fanout, 0.5) * 1e6:,.0f}us, p99 {percentile(fanout, 0.99) * 1e6:,.0f}us')
+
+
+BENCHMARKS: dict[str, Callable] = {
+    'simulation': bench_simulation,
+    'process_turn': bench_process_turn,
+    'is_playable': bench_is_playable,
+    'setup': bench_setup,
+    'large_lobby': bench_large_lobby,
+    'render': bench_render,
+    'restore': bench_restore,
+    'shards': bench_shards,
+    'views': bench_views,
+    'hand_pages': bench_hand_pages,
+    'actor': bench_actor,
+    'metrics': bench_metrics,
+    'tournament': bench_tournament,
+    'ai': bench_ai,
+    'store': bench_store,
+    'soak': bench_soak,
+    'replay': bench_replay,
+    'events': bench_events,
+    'images': bench_images,
+    'rules': bench_rules,
+    'stats': bench_stats,
+    'imports': bench_imports,
+    'spectators': bench_spectators,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs throughput benchmarks for the uno engine')
+    parser.add_argument('benchmarks', nargs='*', default=list(BENCHMARKS), help=', '.join(BENCHMARKS))
+    parser.add_argument('--games', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        BENCHMARKS[name](args)
+
+
+if __name__ == '__main__':
+    main()
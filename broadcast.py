@@ -0,0 +1,79 @@
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from game import *
+
+RECENT_PLAYS = 5
+MESSAGE_LIMIT = 2000  # characters discord accepts in a message
+
+
+def describe_turn(event: TurnCompleted) -> str:
+    if event.card is None:
+        return f'{event.player.nickname} drew a card'
+    return f'{event.player.nickname} played {card_label(event.card)}'
+
+
+def spectator_view(game: Game, recent: deque[str]) -> str:
+    watching = f'{len(game.spectators)} watching'
+    if game.state in (GameState.INITIALIZED, GameState.READY_TO_START, GameState.STARTED):
+        players = '\n'.join(player.nickname for player in game.players)
+        return f'Spectating, {watching}\nWaiting for the game to start\n{players}'
+    lines = [f'Spectating, {watching}',
+             f'It is {game.current_player.nickname}\'s turn, last card was {card_label(game.current_card)}, '
+             f'current color is {game.current_color}, pickup stack is {game.pickup_stack}']
+    lines.extend(f'{player.nickname} – {len(game.playersToCards[player])} cards' for player in game.players)
+    if recent:
+        lines.append('Recent plays:')
+        lines.extend(recent)
+    return '\n'.join(lines)
+
+
+def revealed_hands(game: Game, limit: int = MESSAGE_LIMIT) -> str:
+    lines = ['Hands at the end of the game:']
+    for player, hand in game.playersToCards.items():
+        lines.append(f'{player.nickname}: {", ".join(card_label(card) for card in hand) or "no cards"}')
+    text = '\n'.join(lines)
+    if len(text) > limit:
+        # too many cards to list them all, only the counts are shown
+        text = '\n'.join([lines[0]] + [f'{player.nickname}: {len(hand)} cards'
+                                       for player, hand in game.playersToCards.items()])
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+class Broadcast:
+    # spectators share one view of the game: it is rendered at most once per change, whoever and however many
+    # are watching, and delivered by editing one message, so a turn costs the same for one spectator or thousands
+    game: Game
+    message: Any | None  # the spectator message, posted when the first spectator joins
+    recent: deque[str]
+
+    def __init__(self, game: Game, buttons: Callable[[], Any] | None = None):
+        self.game = game
+        self.buttons = buttons
+        self.message = None
+        self.posting: Awaitable[Any] | None = None  # the spectator message while it is being posted
+        self.recent = deque(maxlen=RECENT_PLAYS)
+        self.version = 0  # bumped by every change spectators can see
+        self.rendered_version = -1
+        self.view: dict[str, Any] | None = None
+        self.renders = 0
+
+    def changed(self, event: GameEvent | None = None):
+        if isinstance(event, TurnCompleted):
+            self.recent.append(describe_turn(event))
+        self.version += 1
+
+    def render(self) -> dict[str, Any]:
+        if self.rendered_version != self.version:
+            self.view = dict(content=spectator_view(self.game, self.recent))
+            if self.buttons is not None:
+                self.view['view'] = self.buttons()
+            self.rendered_version = self.version
+            self.renders += 1
+        return self.view
+
+    def final(self, content: str) -> str:
+        # the hands are still there when the game is closed, revealing them costs one render at the very end
+        if self.game.reveal_hands and self.game.playersToCards and len(content) < MESSAGE_LIMIT - 1:
+            return f'{content}\n{revealed_hands(self.game, MESSAGE_LIMIT - len(content) - 1)}'
+        return content
@@ -1,5 +1,6 @@
 from abc import ABC
-from enum import Enum
+from array import array
+from enum import Enum, IntEnum
 
 
 class Color(Enum):
@@ -18,14 +19,73 @@ class Color(Enum):
         return 'Blue'
 
 
+class CardKind(IntEnum):
+    NUMBER = 0
+    SKIP = 1
+    REVERSE = 2
+    PLUS = 3
+    WILD = 4
+    WILD_PLUS = 5
+
+
+# A card is packed into a single int: | id (22 bits) | number (4 bits) | color (3 bits) | kind (3 bits) |
+# The lower ID_SHIFT bits form the card face, which is all the game rules and the display care about.
+KIND_MASK = 0b111
+COLOR_SHIFT = 3
+COLOR_MASK = 0b111 << COLOR_SHIFT
+NUMBER_SHIFT = 6
+NUMBER_MASK = 0b1111 << NUMBER_SHIFT
+ID_SHIFT = 10
+ID_MASK = (1 << 22) - 1
+FACE_MASK = (1 << ID_SHIFT) - 1
+CARD_TYPECODE = 'I'
+
+
+def encode_card(kind: CardKind, color: Color | None, number: int, id: int) -> int:
+    color_value = 0 if color is None else color.value
+    return (id & ID_MASK) << ID_SHIFT | number << NUMBER_SHIFT | color_value << COLOR_SHIFT | kind
+
+
+def card_id(code: int) -> int:
+    return code >> ID_SHIFT
+
+
+def card_face(code: int) -> int:
+    return code & FACE_MASK
+
+
+def card_kind(code: int) -> CardKind:
+    return CardKind(code & KIND_MASK)
+
+
+def card_color(code: int) -> Color | None:
+    color_value = (code & COLOR_MASK) >> COLOR_SHIFT
+    return None if color_value == 0 else Color(color_value)
+
+
+def card_number(code: int) -> int:
+    return (code & NUMBER_MASK) >> NUMBER_SHIFT
+
+
+def is_wild(code: int) -> bool:
+    return code & KIND_MASK >= CardKind.WILD
+
+
 class Card(ABC):
     id: int
+    kind: CardKind
     is_plus_card: bool
     added_cards: int
     color: Color
+    number = 0
+
+    @property
+    def code(self) -> int:
+        return encode_card(self.kind, self.color, self.number, self.id)
 
 
 class Wild(Card):
+    kind = CardKind.WILD
     is_plus_card = False
     added_cards = 0
     color = None
@@ -38,6 +98,7 @@ class Wild(Card):
 
 
 class WildPlus(Card):
+    kind = CardKind.WILD_PLUS
     is_plus_card = True
     added_cards = 4
     color = None
@@ -50,6 +111,7 @@ class WildPlus(Card):
 
 
 class Plus(Card):
+    kind = CardKind.PLUS
     is_plus_card = True
     added_cards = 2
 
@@ -62,6 +124,7 @@ class Plus(Card):
 
 
 class Number(Card):
+    kind = CardKind.NUMBER
     is_plus_card = False
     added_cards = 0
     number: int
@@ -76,6 +139,7 @@ class Number(Card):
 
 
 class Skip(Card):
+    kind = CardKind.SKIP
     is_plus_card = False
     added_cards = 0
 
@@ -88,6 +152,7 @@ class Skip(Card):
 
 
 class Reverse(Card):
+    kind = CardKind.REVERSE
     is_plus_card = False
     added_cards = 0
 
@@ -97,3 +162,62 @@ class Reverse(Card):
 
     def __str__(self):
         return f'{self.color} reverse'
+
+
+def card_view(code: int) -> Card:
+    kind = code & KIND_MASK
+    id = code >> ID_SHIFT
+    if kind == CardKind.WILD:
+        return Wild(id)
+    if kind == CardKind.WILD_PLUS:
+        return WildPlus(id)
+    color = card_color(code)
+    if kind == CardKind.PLUS:
+        return Plus(color, id)
+    if kind == CardKind.SKIP:
+        return Skip(color, id)
+    if kind == CardKind.REVERSE:
+        return Reverse(color, id)
+    return Number(color, card_number(code), id)
+
+
+def __build_labels__() -> tuple[str | None, ...]:
+    labels: list[str | None] = [None] * (FACE_MASK + 1)
+    for kind in (CardKind.WILD, CardKind.WILD_PLUS):
+        labels[encode_card(kind, None, 0, 0)] = str(card_view(kind))
+    for color in Color:
+        for kind in (CardKind.SKIP, CardKind.REVERSE, CardKind.PLUS):
+            face = encode_card(kind, color, 0, 0)
+            labels[face] = str(card_view(face))
+        for number in range(10):
+            face = encode_card(CardKind.NUMBER, color, number, 0)
+            labels[face] = str(card_view(face))
+    return tuple(labels)
+
+
+CARD_LABELS = __build_labels__()
+
+
+def card_label(code: int) -> str:
+    return CARD_LABELS[code & FACE_MASK]
+
+
+def __build_deck_template__() -> bytes:
+    faces = [encode_card(kind, None, 0, 0) for kind in (CardKind.WILD, CardKind.WILD_PLUS) for _ in range(4)]
+    for color in Color:
+        faces.append(encode_card(CardKind.NUMBER, color, 0, 0))
+        for _ in range(2):
+            faces += [encode_card(CardKind.NUMBER, color, number, 0) for number in range(1, 10)]
+            faces += [encode_card(kind, color, 0, 0) for kind in (CardKind.SKIP, CardKind.REVERSE, CardKind.PLUS)]
+    # every card of a deck gets its position in the template as a stable id
+    return array(CARD_TYPECODE, (face | id << ID_SHIFT for id, face in enumerate(faces))).tobytes()
+
+
+DECK_TEMPLATE = __build_deck_template__()
+DECK_SIZE = len(DECK_TEMPLATE) // array(CARD_TYPECODE).itemsize
+
+
+def new_deck() -> array:
+    deck = array(CARD_TYPECODE)
+    deck.frombytes(DECK_TEMPLATE)
+    return deck
@@ -0,0 +1,76 @@
+import argparse
+import os
+
+CONFIG_ENV = 'UNO_CONFIG'
+TOKEN_ENV = 'UNO_TOKEN'
+DEFAULT_TOKEN_FILE = 'token.txt'
+
+
+class Config:
+    # every setting can come from the command line, an UNO_* environment variable or a json config file,
+    # in that order of precedence
+    token_file: str
+    snapshot_dir: str
+    archive_dir: str
+    log_path: str
+    stats_path: str
+    channel_rules_path: str
+    metrics_host: str
+    metrics_port: int | None  # None picks a port per shard worker
+    ai_workers: int | None  # processes searching bot moves in each shard worker, None uses every core but one
+
+    def __init__(self, **settings):
+        self.token_file = DEFAULT_TOKEN_FILE
+        self.snapshot_dir = 'snapshots'
+        self.archive_dir = 'archive'
+        self.log_path = 'logs/games.unolog'
+        self.stats_path = 'stats.sqlite3'
+        self.channel_rules_path = 'channel_rules.json'
+        self.metrics_host = '127.0.0.1'
+        self.metrics_port = None
+        self.ai_workers = None
+        for name, value in settings.items():
+            if name not in SETTINGS:
+                raise RuntimeError(f'Config, unknown setting {name}')
+            setattr(self, name, value)
+
+    def token(self) -> str:
+        # read when the bot logs in, never kept on the config or read at import time
+        token = os.environ.get(TOKEN_ENV)
+        if token:
+            return token.strip()
+        try:
+            with open(self.token_file) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            raise RuntimeError(f'token, set {TOKEN_ENV} or put the bot token in {self.token_file}')
+
+
+SETTINGS: dict[str, type] = {name: str for name in Config.__annotations__}
+SETTINGS['metrics_port'] = int
+SETTINGS['ai_workers'] = int
+
+
+def env_name(setting: str) -> str:
+    return f'UNO_{setting.upper()}'
+
+
+def load_config(argv: list[str] | None = None, environ: dict[str, str] | None = None) -> Config:
+    environ = os.environ if environ is None else environ
+    parser = argparse.ArgumentParser(description='Runs the uno bot')
+    parser.add_argument('--config', default=environ.get(CONFIG_ENV), help='json file with any of the settings below')
+    for name, kind in SETTINGS.items():
+        parser.add_argument(f'--{name.replace("_", "-")}', type=kind, help=f'or {env_name(name)}')
+    args = parser.parse_args(argv)
+
+    settings = {}
+    if args.config is not None:
+        import json
+        with open(args.config) as f:
+            settings.update(json.load(f))
+    for name, kind in SETTINGS.items():
+        if environ.get(env_name(name)):
+            settings[name] = kind(environ[env_name(name)])
+        if getattr(args, name) is not None:
+            settings[name] = getattr(args, name)
+    return Config(**settings)
@@ -0,0 +1,68 @@
+import time
+from collections.abc import Awaitable, Callable
+
+import metrics
+
+Listener = Callable[[object], Awaitable[None]]
+
+
+class EventBus:
+    # listeners subscribe to event classes and get every event of that class or a subclass;
+    # one event is fanned out to all of its listeners concurrently
+    def __init__(self):
+        self.listeners: dict[type, list[Listener]] = {}
+        self.routes: dict[type, tuple[Listener, ...]] = {}  # event class -> listeners, rebuilt on subscribe
+        self.errors = 0
+
+    def subscribe(self, event_types: type | tuple[type, ...], listener: Listener) -> Listener:
+        # a listener subscribed to several related classes still runs once per event
+        for event_type in event_types if isinstance(event_types, tuple) else (event_types,):
+            listeners = self.listeners.setdefault(event_type, [])
+            if listener not in listeners:
+                listeners.append(listener)
+        self.routes.clear()
+        return listener
+
+    def unsubscribe(self, event_types: type | tuple[type, ...], listener: Listener):
+        for event_type in event_types if isinstance(event_types, tuple) else (event_types,):
+            listeners = self.listeners.get(event_type)
+            if listeners is not None and listener in listeners:
+                listeners.remove(listener)
+        self.routes.clear()
+
+    def listeners_of(self, event_type: type) -> tuple[Listener, ...]:
+        route = self.routes.get(event_type)
+        if route is None:
+            route = []
+            for cls in event_type.__mro__:
+                for listener in self.listeners.get(cls, ()):
+                    if listener not in route:
+                        route.append(listener)
+            route = self.routes[event_type] = tuple(route)
+        return route
+
+    async def publish(self, event: object, histogram: metrics.Histogram | None = None,
+                      weight: int = 1) -> list[BaseException]:
+        # a failing listener neither stops nor cancels the others, its error is logged and returned
+        listeners = self.listeners_of(type(event))
+        if not listeners:
+            return []
+        import asyncio  # only games driven by the bot publish, workers and simulations never load asyncio
+        results = await asyncio.gather(*(self.__notify__(listener, event, histogram, weight) for listener in listeners),
+                                       return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        for error in errors:
+            self.errors += 1
+            print(f'publish, listener of {type(event).__name__} failed: {error!r}')
+        return errors
+
+    @staticmethod
+    async def __notify__(listener: Listener, event: object, histogram: metrics.Histogram | None, weight: int):
+        if histogram is None:
+            await listener(event)
+            return
+        start = time.perf_counter_ns()
+        try:
+            await listener(event)
+        finally:
+            metrics.record_since(histogram, start, weight)
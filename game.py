@@ -1,6 +1,17 @@
-from typing import Callable, Awaitable
+from array import array
 from card import *
+from events import EventBus
+from gamelog import GameLog
+from rules import DEFAULT_RULES, HouseRule, RuleTable, compile_rules, rule_index
+import metrics
 import random
+import time
+
+APPLY_TURN_HISTOGRAM = metrics.registry.histogram('uno_apply_turn_seconds', 'Game logic time of process_turn')
+TURN_FANOUT_HISTOGRAM = metrics.registry.histogram('uno_turn_fanout_seconds',
+                                                   'Time to run all turn completed listeners')
+TURN_CALLBACK_HISTOGRAM = metrics.registry.histogram('uno_turn_callback_seconds',
+                                                     'Time of a single turn completed listener')
 
 
 class GameState(Enum):
@@ -21,6 +32,116 @@ class Player:
         self.nickname = nickname
 
 
+class Hand:
+    def __init__(self):
+        self.cards = array(CARD_TYPECODE)
+        self.slots: dict[int, int] = {}  # card id -> index in cards
+        self.color_counts = [0] * 5  # indexed by Color.value, 0 counts wild cards
+        self.number_counts = [0] * 10
+        self.kind_counts = [0] * len(CardKind)
+        self.faces: dict[int, list[int]] = {}  # face -> cards with that face, groups duplicates for display
+
+    def __len__(self) -> int:
+        return len(self.cards)
+
+    def __iter__(self):
+        return iter(self.cards)
+
+    def __contains__(self, card_id: int) -> bool:
+        return card_id in self.slots
+
+    def get(self, card_id: int) -> int | None:
+        slot = self.slots.get(card_id)
+        return None if slot is None else self.cards[slot]
+
+    def add(self, card: int):
+        self.slots[card >> ID_SHIFT] = len(self.cards)
+        self.cards.append(card)
+        self.__count__(card, 1)
+        group = self.faces.get(card & FACE_MASK)
+        if group is None:
+            self.faces[card & FACE_MASK] = [card]
+        else:
+            group.append(card)
+
+    def pop(self, card_id: int) -> int:
+        slot = self.slots.pop(card_id)
+        card = self.cards[slot]
+        last = self.cards.pop()
+        if last != card:
+            self.cards[slot] = last
+            self.slots[last >> ID_SHIFT] = slot
+        self.__count__(card, -1)
+        group = self.faces[card & FACE_MASK]
+        group.remove(card)
+        if not group:
+            del self.faces[card & FACE_MASK]
+        return card
+
+    def __count__(self, card: int, delta: int):
+        kind = card & KIND_MASK
+        self.kind_counts[kind] += delta
+        self.color_counts[(card & COLOR_MASK) >> COLOR_SHIFT] += delta
+        if kind == CardKind.NUMBER:
+            self.number_counts[(card & NUMBER_MASK) >> NUMBER_SHIFT] += delta
+
+
+class GameEvent:
+    game: 'Game'
+
+    def __init__(self, game: 'Game'):
+        self.game = game
+
+
+class PlayersChanged(GameEvent):
+    # a player joined, left or was kicked; the lobby state is already updated
+    player: Player
+    joined: bool
+
+    def __init__(self, game: 'Game', player: Player, joined: bool):
+        super().__init__(game)
+        self.player = player
+        self.joined = joined
+
+
+class SpectatorsChanged(GameEvent):
+    player: Player
+    joined: bool
+
+    def __init__(self, game: 'Game', player: Player, joined: bool):
+        super().__init__(game)
+        self.player = player
+        self.joined = joined
+
+
+class StateChanged(GameEvent):
+    state: GameState
+
+    def __init__(self, game: 'Game', state: GameState):
+        super().__init__(game)
+        self.state = state
+
+
+class TurnCompleted(GameEvent):
+    player: Player
+    card: int | None  # the card that was played, None when the player drew
+    next_player: Player
+
+    def __init__(self, game: 'Game', player: Player, card: int | None, next_player: Player):
+        super().__init__(game)
+        self.player = player
+        self.card = card
+        self.next_player = next_player
+
+
+class GameFinished(GameEvent):
+    winner: Player
+
+    def __init__(self, game: 'Game', winner: Player):
+        super().__init__(game)
+        self.winner = winner
+
+
 class Game:
 
 
@@ -28,232 +149,350 @@ class Game:
         if self.state != GameState.READY_TO_START:
             raise RuntimeError(f'start_game, incorrect state: {self.state}')
         self.state = GameState.STARTED
-        await self.__on_started__()
+        await self.__publish__(StateChanged(self, self.state))
+
+        self.deal()
+        await self.__publish__(StateChanged(self, self.state))
 
+    def deal(self):
+        if self.state != GameState.STARTED and self.state != GameState.READY_TO_START:
+            raise RuntimeError(f'deal, incorrect state: {self.state}')
+        self.__reindex_seats__()
+        self.current_seat = self.seats[self.admin.discord_tag]
         self.current_player = self.admin
         self.last_player = None
-        self.__refill_deck__()
+        self.playersToCards = {player: Hand() for player in self.players}
+        if self.log is not None:
+            self.log.start(self.seed, [player.discord_tag for player in self.players])
+            if self.rules != DEFAULT_RULES:
+                self.log.rules(self.rules)
+        self.__new_deck__()
         self.__put_first_card__()
         for player in self.players:
             self.__pick_up_cards__(player, 7)
 
         self.state = GameState.ONGOING
-        await self.__on_ongoing__()
 
     async def process_turn(self, discord_tag: str, card_id: int | None, wild_color: Color | None):
+        if next(metrics.sampler):
+            await self.__timed_process_turn__(discord_tag, card_id, wild_color)
+            return
+        player = self.get_player(discord_tag)
+        winner = self.apply_turn(discord_tag, card_id, wild_color)
+        if winner is not None:
+            await self.__publish__(GameFinished(self, winner))
+        else:
+            await self.__publish__(self.__turn_completed__(player, card_id))
+
+    async def __timed_process_turn__(self, discord_tag: str, card_id: int | None, wild_color: Color | None):
+        player = self.get_player(discord_tag)
+        start = time.perf_counter_ns()
+        winner = self.apply_turn(discord_tag, card_id, wild_color)
+        metrics.record_since(APPLY_TURN_HISTOGRAM, start, metrics.SAMPLE_EVERY)
+        if winner is not None:
+            await self.__publish__(GameFinished(self, winner))
+            return
+        fanout_start = time.perf_counter_ns()
+        try:
+            await self.__publish__(self.__turn_completed__(player, card_id), TURN_CALLBACK_HISTOGRAM)
+        finally:
+            metrics.record_since(TURN_FANOUT_HISTOGRAM, fanout_start, metrics.SAMPLE_EVERY)
+
+    def __turn_completed__(self, player: Player, card_id: int | None) -> TurnCompleted:
+        # a played card always ends up on top
+        return TurnCompleted(self, player, None if card_id is None else self.current_card, self.current_player)
+
+    def apply_turn(self, discord_tag: str, card_id: int | None, wild_color: Color | None) -> Player | None:
         if self.state != GameState.ONGOING:
             raise RuntimeError(f'process_turn, incorrect state: {self.state}')
-        player = next(player for player in self.players if player.discord_tag == discord_tag)
-        if player.discord_tag != self.current_player.discord_tag:
-            raise RuntimeError(
-                f'process_turn, incorrect player: {player.discord_tag}, expected {self.current_player.discord_tag}')
+        seat = self.seats.get(discord_tag)
+        if seat is None:
+            raise RuntimeError(f'process_turn, player {discord_tag} is not part of the game')
+        player = self.players[seat]
+        if seat != self.current_seat:
+            card = None if card_id is None else self.playersToCards[player].get(card_id)
+            if card is None or not self.jump_in_mask() >> (card & FACE_MASK) & 1:
+                raise RuntimeError(
+                    f'process_turn, incorrect player: {player.discord_tag}, expected {self.current_player.discord_tag}')
+        if self.log is not None:
+            self.log.turn(seat, card_id, wild_color)  # before anything changes, rejected turns are replayed too
+        self.last_action = (discord_tag, card_id, wild_color)
         p = 1
         if card_id is None:  # draw card button pressed
-            self.__pick_up_cards__(player, 1 + self.pickup_stack)
-            self.pickup_stack = 0
-            self.last_player = self.current_player
-            self.current_player = self.players[
-                (self.players.index(self.current_player) + p * self.is_reversed) % len(self.players)]
-            await self.__on_turn_completed__()
-            return
-        cards = self.playersToCards[player]
-        card = next(card for card in cards if card.id == card_id)
-        pickup_stack_exists = self.pickup_stack != 0
-        if not card.is_plus_card and pickup_stack_exists:
+            self.__draw__(player)
+            return None
+        hand = self.playersToCards[player]
+        card = hand.get(card_id)
+        if card is None:
+            raise RuntimeError(f'process_turn, player {discord_tag} does not hold card {card_id}')
+        face = card & FACE_MASK
+        if not self.playable_mask >> face & 1:
+            raise RuntimeError(f'process_turn, {card_label(card)} cannot be played on {card_label(self.current_card)}')
+        if seat != self.current_seat:
+            self.current_player = player  # a jump-in, play goes on from here
+            self.current_seat = seat
+        if self.pickup_stack and not self.table.stacking[self.rule_index] >> face & 1:
             self.__pick_up_cards__(player, self.pickup_stack)
             self.pickup_stack = 0
-        if not self.is_playable(card):
-            raise RuntimeError()
-        if isinstance(card, Reverse) and len(self.players) > 2:
+        kind = card & KIND_MASK
+        if kind == CardKind.REVERSE and len(self.players) > 2:
             self.is_reversed *= -1
-            if card.color != self.current_color:
-                self.current_color = card.color
-        elif isinstance(card, Skip) or (isinstance(card, Reverse) and len(self.players) == 2):
+            self.current_color = card_color(card)
+        elif kind == CardKind.SKIP or kind == CardKind.REVERSE:
             p += 1
-            if card.color != self.current_color:
-                self.current_color = card.color
-        elif isinstance(card, Plus):
+            self.current_color = card_color(card)
+        elif kind == CardKind.PLUS:
             self.pickup_stack += 2
-            if card.color != self.current_color:
-                self.current_color = card.color
-        elif isinstance(card, WildPlus):
+            self.current_color = card_color(card)
+        elif kind == CardKind.WILD_PLUS:
             self.pickup_stack += 4
             self.current_color = wild_color
-        elif isinstance(card, Wild):
+        elif kind == CardKind.WILD:
             self.current_color = wild_color
-        elif isinstance(card, Number):
-            if card.color != self.current_color:
-                self.current_color = card.color
+        else:
+            self.current_color = card_color(card)
 
-        self.last_player = self.current_player
-        self.current_player = self.players[
-            (self.players.index(self.current_player) + p * self.is_reversed) % len(self.players)]
+        self.__advance__(p)
+        self.discard.append(self.current_card)
         self.current_card = card
-        self.playersToCards[player].remove(card)
+        hand.pop(card_id)
+        self.__update_rule_index__()
         finished = self.__check_game_finished__(player)
         if finished:
             self.state = GameState.FINISHED
-            await self.__on_finished__(player)
-        else:
-            await self.__on_turn_completed__()
+            if self.log is not None:
+                self.log.end(seat)
+            return player
+        if kind == CardKind.NUMBER and self.table.seven_zero:
+            number = (card & NUMBER_MASK) >> NUMBER_SHIFT
+            if number == 7:
+                self.__swap_hands__(player, self.current_player)
+            elif number == 0:
+                self.__rotate_hands__()
+        return None
+
+    def __draw__(self, player: Player):
+        if self.pickup_stack:
+            self.__pick_up_cards__(player, self.pickup_stack + 1)
+            self.pickup_stack = 0
+            self.__update_rule_index__()
+            self.__advance__(1)
+            return
+        hand = self.playersToCards[player]
+        if self.table.forced_play and self.has_playable(player):
+            raise RuntimeError(f'process_turn, {player.nickname} has to play a card')
+        if not self.table.draw_until_playable:
+            self.__pick_up_cards__(player, 1)
+            self.__advance__(1)
+            return
+        while True:
+            held = len(hand)
+            self.__pick_up_cards__(player, 1)
+            if len(hand) == held:
+                break  # nothing left to draw
+            if self.playable_mask >> (hand.cards[-1] & FACE_MASK) & 1:
+                return  # the player keeps the turn to play what was drawn
+        self.__advance__(1)
+
+    def __swap_hands__(self, player: Player, other: Player):
+        hands = self.playersToCards
+        hands[player], hands[other] = hands[other], hands[player]
+
+    def __rotate_hands__(self):
+        # every hand moves to the next player in the direction of play
+        hands = [self.playersToCards[player] for player in self.players]
+        for seat, player in enumerate(self.players):
+            self.playersToCards[player] = hands[(seat - self.is_reversed) % len(hands)]
+
+    def __update_rule_index__(self):
+        self.rule_index = rule_index(self.current_card, self.current_color, self.pickup_stack)
+        self.playable_mask = self.table.playable[self.rule_index]
+
+    @property
+    def rules(self) -> HouseRule:
+        return self.table.rules
+
+    @rules.setter
+    def rules(self, rules: HouseRule):
+        self.table = compile_rules(rules)
+        if hasattr(self, 'current_card'):
+            self.__update_rule_index__()
+
+    def __advance__(self, p: int):
+        self.last_player = self.current_player
+        self.current_seat = (self.current_seat + p * self.is_reversed) % len(self.players)
+        self.current_player = self.players[self.current_seat]
+
+    def __reindex_seats__(self):
+        self.seats = {player.discord_tag: seat for seat, player in enumerate(self.players)}
+
+    def get_player(self, discord_tag: str) -> Player | None:
+        seat = self.seats.get(discord_tag)
+        return None if seat is None else self.players[seat]
 
     def __check_game_finished__(self, player: Player) -> bool:
         return len(self.playersToCards[player]) == 0
 
-    def is_playable(self, new_card: Card) -> bool:
-        if isinstance(new_card, Wild) or isinstance(new_card, WildPlus):
+    def is_playable(self, new_card: int) -> bool:
+        return self.playable_mask >> (new_card & FACE_MASK) & 1 == 1
+
+    def jump_in_mask(self) -> int:
+        return 0 if self.pickup_stack else self.table.jump_in[self.current_card & FACE_MASK]
+
+    def playable_cards(self, player: Player) -> list[int]:
+        mask = self.playable_mask
+        return [card for card in self.playersToCards[player] if mask >> (card & FACE_MASK) & 1]
+
+    def has_playable(self, player: Player) -> bool:
+        hand = self.playersToCards[player]
+        current_kind = self.current_card & KIND_MASK
+        if hand.kind_counts[CardKind.WILD] or hand.kind_counts[CardKind.WILD_PLUS]:
             return True
-        if new_card.color == self.current_color:
+        if self.current_color is not None and hand.color_counts[self.current_color.value]:
             return True
-        return (isinstance(new_card, Number) and isinstance(self.current_card,
-                                                            Number) and new_card.number == self.current_card.number) or (
-                       isinstance(new_card, Skip) and (isinstance(self.current_card, Skip))) or (
-                       isinstance(new_card, Plus) and isinstance(self.current_card, Plus)) or (
-                       isinstance(self.current_card, Reverse) and isinstance(new_card, Reverse))
+        if current_kind == CardKind.NUMBER:
+            return hand.number_counts[(self.current_card & NUMBER_MASK) >> NUMBER_SHIFT] > 0
+        return current_kind < CardKind.WILD and hand.kind_counts[current_kind] > 0
 
     def __put_first_card__(self):
-        first_card = next(card for card in self.deck if isinstance(card, Number))
-        self.current_card = first_card
-        self.current_color = first_card.color
-        self.deck.remove(first_card)
+        slot = next(i for i, code in enumerate(self.deck) if code & KIND_MASK == CardKind.NUMBER)
+        self.current_card = self.deck[slot]
+        self.current_color = card_color(self.current_card)
+        self.__update_rule_index__()
+        del self.deck[slot]
 
     def __pick_up_cards__(self, player: Player, count: int):
+        hand = self.playersToCards[player]
         for i in range(count):
             if len(self.deck) == 0:
-                self.__refill_deck__()
-            if not player in self.playersToCards:
-                self.playersToCards[player] = []
-            self.playersToCards[player].append(self.deck.pop())
-
-    def __refill_deck__(self):
-        for i in range(10):
-            self.deck += self.__create_number_cards__(i)
-            if i != 0:
-                self.deck += self.__create_number_cards__(i)
-        self.__create_plus_cards__()
-        self.__create_wild_cards__()
-        self.__create_reverse_cards__()
-        self.__create_skip_cards__()
-        random.shuffle(self.deck)
-
-    def __create_reverse_cards__(self):
-        for color in range(1, 5):
-            for i in range(2):
-                self.max_card_id += 1
-                self.deck.append(Reverse(Color(color), self.max_card_id))
-
-    def __create_skip_cards__(self):
-        for color in range(1, 5):
-            for i in range(2):
-                self.max_card_id += 1
-                self.deck.append(Skip(Color(color), self.max_card_id))
-
-    def __create_plus_cards__(self):
-        for color in range(1, 5):
-            for j in range(2):
-                self.max_card_id += 1
-                self.deck.append(Plus(Color(color), self.max_card_id))
-
-    def __create_wild_cards__(self):
-        for i in range(4):
-            self.max_card_id += 1
-            self.deck.append(WildPlus(self.max_card_id))
-            self.max_card_id += 1
-            self.deck.append(Wild(self.max_card_id))
-
-    def __create_number_cards__(self, number: int) -> list[Card]:
-        r = Number(Color.RED, number, self.max_card_id + 1)
-        b = Number(Color.GREEN, number, self.max_card_id + 2)
-        g = Number(Color.GREEN, number, self.max_card_id + 3)
-        y = Number(Color.YELLOW, number, self.max_card_id + 4)
-        self.max_card_id += 4
-        return [r, b, g, y]
-
-    def __init__(self, admin):
+                self.__reshuffle_discards__()
+                if len(self.deck) == 0:
+                    return  # every card is in someone's hand
+            hand.add(self.deck.pop())
+
+    def __new_deck__(self):
+        self.deck = new_deck()
+        self.discard = array(CARD_TYPECODE)
+        self.rng.shuffle(self.deck)
+        if self.log is not None:
+            self.log.shuffle(self.deck)
+
+    def __reshuffle_discards__(self):
+        self.deck, self.discard = self.discard, self.deck
+        self.rng.shuffle(self.deck)
+        if self.log is not None:
+            self.log.shuffle(self.deck)
+
+    def __init__(self, admin, rng: random.Random | None = None, rules: HouseRule = DEFAULT_RULES):
         self.state: GameState
         self.players: list[Player] = []
-        self.playersToCards: dict[Player, list[Card]] = {}
-        self.deck: list[Card] = []
-        self.current_card: Card
+        self.spectators: dict[str, Player] = {}  # discord tag -> spectator, they share one view of the game
+        self.reveal_hands = False  # spectators see every hand once the game is over
+        self.playersToCards: dict[Player, Hand] = {}
+        self.seats: dict[str, int] = {}
+        self.deck = array(CARD_TYPECODE)
+        self.discard = array(CARD_TYPECODE)
+        self.current_card: int
         self.current_color: Color
         self.admin: Player
         self.current_player: Player
+        self.current_seat = 0
         self.last_player: Player
+        self.table: RuleTable = compile_rules(rules)
+        self.rule_index = 0
+        self.playable_mask = 0
+        self.last_action: tuple[str, int | None, Color | None] | None = None
         self.pickup_stack = 0
-        self.max_card_id = -1
         self.is_reversed = 1  # -1 if reversed
-
-        self.on_ready_callbacks: list[Callable[[], Awaitable[None]]] = []
-        self.on_started_callbacks: list[Callable[[], Awaitable[None]]] = []
-        self.on_ongoing_callbacks: list[Callable[[], Awaitable[None]]] = []
-        self.on_finished_callbacks: list[Callable[[Player], Awaitable[None]]] = []
-        self.on_destroyed_callbacks: list[Callable[[], Awaitable[None]]] = []
-        self.on_initialized_callbacks: list[Callable[[], Awaitable[None]]] = []
-        self.on_player_count_changed_callbacks: list[Callable[[], Awaitable[None]]] = []
-        self.on_turn_completed_callbacks: list[Callable[[], Awaitable[None]]] = []
+        self.seed: int | None = None
+        if rng is None:
+            self.seed = random.randrange(1 << 63)
+            rng = random.Random(self.seed)
+        self.rng = rng
+        self.log: GameLog | None = None
+        self.events = EventBus()
         self.state = GameState.INITIALIZED
         self.admin = admin
         self.last_player = None
         self.players.append(admin)
+        self.__reindex_seats__()
 
     async def add_player(self, player: Player):
         if self.state != GameState.INITIALIZED and self.state != GameState.READY_TO_START:
             raise RuntimeError(f'add_player, incorrect state: {self.state}')
-        if next((p for p in self.players if player.discord_tag == p.discord_tag), None) is not None:
+        if player.discord_tag in self.seats:
             raise RuntimeError(f'add_player, cannot add already existing player {player.nickname}')
+        self.spectators.pop(player.discord_tag, None)  # a spectator may still join the lobby
         self.players.append(player)
-        await self.__on_player_count_changed__()
+        self.__reindex_seats__()
         if self.state == GameState.INITIALIZED and len(self.players) >= 2:
             self.state = GameState.READY_TO_START
-            await self.__on_ready__()
+        await self.__publish__(PlayersChanged(self, player, True))
 
     async def remove_player(self, player: Player):
         if self.state != GameState.INITIALIZED and self.state != GameState.READY_TO_START:
             raise RuntimeError(f'remove_player, incorrect state: {self.state}')
         if self.admin == player:
             raise RuntimeError(f'remove_player, cannot remove admin from game')
-        if next((p for p in self.players if p.discord_tag == player.discord_tag), None) is None:
+        if player.discord_tag not in self.seats:
             raise RuntimeError(f'remove_player, player is not part of the game')
         self.players.remove(player)
-        await self.__on_player_count_changed__()
+        self.__reindex_seats__()
         if self.state == GameState.READY_TO_START and len(self.players) < 2:
             self.state = GameState.INITIALIZED
-            await self.__on_initialized__()
-
-    async def __on_ready__(self):
-        if self.state == GameState.READY_TO_START:
-            for callback in self.on_ready_callbacks:
-                await callback()
-
-    async def __on_started__(self):
-        if self.state == GameState.STARTED:
-            for callback in self.on_started_callbacks:
-                await callback()
-
-    async def __on_ongoing__(self):
-        if self.state == GameState.ONGOING:
-            for callback in self.on_ongoing_callbacks:
-                await callback()
-
-    async def __on_finished__(self, winner: Player):
-        if self.state == GameState.FINISHED:
-            for callback in self.on_finished_callbacks:
-                await callback(winner)
-
-    async def __on_destroyed__(self):
-        if self.state == GameState.DESTROYED:
-            for callback in self.on_destroyed_callbacks:
-                await callback()
-
-    async def __on_initialized__(self):
-        if self.state == GameState.INITIALIZED:
-            for callback in self.on_initialized_callbacks:
-                await callback()
-
-    async def __on_player_count_changed__(self):
-        for callback in self.on_player_count_changed_callbacks:
-            await callback()
-
-    async def __on_turn_completed__(self):
-        for callback in self.on_turn_completed_callbacks:
-            await callback()
+        await self.__publish__(PlayersChanged(self, player, False))
+
+    async def add_spectator(self, player: Player):
+        if self.state == GameState.FINISHED or self.state == GameState.DESTROYED:
+            raise RuntimeError(f'add_spectator, incorrect state: {self.state}')
+        if player.discord_tag in self.seats:
+            raise RuntimeError(f'add_spectator, {player.nickname} is playing in this game')
+        if player.discord_tag in self.spectators:
+            raise RuntimeError(f'add_spectator, {player.nickname} is already watching')
+        self.spectators[player.discord_tag] = player
+        await self.__publish__(SpectatorsChanged(self, player, True))
+
+    async def remove_spectator(self, player: Player):
+        if self.spectators.pop(player.discord_tag, None) is None:
+            raise RuntimeError(f'remove_spectator, {player.nickname} is not watching')
+        await self.__publish__(SpectatorsChanged(self, player, False))
+
+    async def kick_player(self, player: Player):
+        winner = self.apply_kick(player)
+        await self.__publish__(PlayersChanged(self, player, False))
+        if winner is not None:
+            await self.__publish__(GameFinished(self, winner))
+
+    def apply_kick(self, player: Player) -> Player | None:
+        if self.state != GameState.ONGOING:
+            raise RuntimeError(f'kick_player, incorrect state: {self.state}')
+        seat = self.seats.get(player.discord_tag)
+        if seat is None:
+            raise RuntimeError(f'kick_player, player is not part of the game')
+        if self.log is not None:
+            self.log.kick(seat)
+        # the hand goes under the deck so that the card ids stay unique
+        self.deck[0:0] = self.playersToCards.pop(player).cards
+        self.players.pop(seat)
+        self.__reindex_seats__()
+        if self.last_player is player:
+            self.last_player = None
+        if seat == self.current_seat:
+            self.pickup_stack = 0  # nobody else inherits what the kicked player had to draw
+            self.__update_rule_index__()
+        if seat < self.current_seat or (seat == self.current_seat and self.is_reversed < 0):
+            self.current_seat -= 1
+        self.current_seat %= len(self.players)
+        self.current_player = self.players[self.current_seat]
+        if len(self.players) == 1:
+            self.state = GameState.FINISHED
+            if self.log is not None:
+                self.log.end(0)
+            return self.players[0]
+        return None
+
+    async def __publish__(self, event: GameEvent, histogram: metrics.Histogram | None = None):
+        # every listener runs even if one fails, the caller still hears about the first failure
+        errors = await self.events.publish(event, histogram, metrics.SAMPLE_EVERY)
+        if errors:
+            raise errors[0]
@@ -0,0 +1,71 @@
+import os
+import struct
+from enum import IntEnum
+
+from card import *
+
+MAGIC = b'UNL\x01'
+LENGTH = struct.Struct('<I')  # every game in an archive is prefixed with its length
+START = struct.Struct('<4sqB')  # magic, seed (-1 when unknown), player count, followed by the discord tags
+TAG = struct.Struct('<q')
+TURN = struct.Struct('<BBbB')  # record, seat, card id (-1 for draw), wild color (0 for none)
+SEAT = struct.Struct('<BB')  # record, seat
+SHUFFLE = struct.Struct('<BB')  # record, pile length, followed by one card id per byte
+RULES = struct.Struct('<BB')  # record, house rule flags; only written for games that are not on the default rules
+NO_SEAT = 255
+
+
+class Record(IntEnum):
+    TURN = 1
+    SHUFFLE = 2
+    KICK = 3
+    END = 4
+    RULES = 5
+
+
+class GameLog:
+    # append-only: a game is a header, then turns, shuffles and kicks in the order they happened
+    def __init__(self):
+        self.data = bytearray()
+
+    def start(self, seed: int | None, discord_tags: list[str]):
+        self.data += START.pack(MAGIC, -1 if seed is None else seed, len(discord_tags))
+        for discord_tag in discord_tags:
+            self.data += TAG.pack(discord_tag)
+
+    def rules(self, rules: int):
+        self.data += RULES.pack(Record.RULES, rules)
+
+    def turn(self, seat: int, card_id: int | None, wild_color: Color | None):
+        self.data += TURN.pack(Record.TURN, seat, -1 if card_id is None else card_id,
+                               0 if wild_color is None else wild_color.value)
+
+    def shuffle(self, pile: array):
+        self.data += SHUFFLE.pack(Record.SHUFFLE, len(pile))
+        self.data += bytes(code >> ID_SHIFT for code in pile)
+
+    def kick(self, seat: int):
+        self.data += SEAT.pack(Record.KICK, seat)
+
+    def end(self, seat: int | None):
+        self.data += SEAT.pack(Record.END, NO_SEAT if seat is None else seat)
+
+
+class LogArchive:
+    # finished games are appended to one file from a single writer thread
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        from concurrent.futures import ThreadPoolExecutor  # the engine imports this module, only the bot archives
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gamelog')
+
+    def append(self, log: GameLog) -> 'Future':
+        data = LENGTH.pack(len(log.data)) + log.data
+        return self.executor.submit(self.__write__, data)
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __write__(self, data: bytes):
+        with open(self.path, 'ab') as archive:
+            archive.write(data)
@@ -0,0 +1,242 @@
+import asyncio
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from card import *
+
+CARD_WIDTH = 64
+CARD_HEIGHT = 96
+GAP = 8
+HAND_COLUMNS = 8
+LABEL_SCALE = 3  # the built-in bitmap font is scaled up instead of depending on a font file
+COLOR_RGB = {None: (40, 40, 40), Color.RED: (215, 38, 56), Color.BLUE: (9, 86, 191), Color.YELLOW: (236, 212, 7),
+             Color.GREEN: (55, 151, 17)}
+KIND_LABELS = {CardKind.SKIP: 'S', CardKind.REVERSE: 'R', CardKind.PLUS: '+2', CardKind.WILD: 'W',
+               CardKind.WILD_PLUS: '+4'}
+BACKGROUND = (54, 57, 63, 255)  # the discord dark theme
+STACK_RGB = (255, 80, 80)
+
+HandFaces = tuple[tuple[int, int, bool], ...]  # face, how many the player holds, playable
+
+
+def __pillow__():
+    # Pillow is optional, without it the bot keeps the text only messages
+    try:
+        from PIL import Image, ImageDraw, ImageFont
+    except ImportError:
+        raise RuntimeError('images, Pillow is not installed')
+    return Image, ImageDraw, ImageFont
+
+
+def images_available() -> bool:
+    try:
+        __pillow__()
+    except RuntimeError:
+        return False
+    return True
+
+
+def card_faces() -> list[int]:
+    faces = [encode_card(kind, None, 0, 0) for kind in (CardKind.WILD, CardKind.WILD_PLUS)]
+    for color in Color:
+        faces += [encode_card(CardKind.NUMBER, color, number, 0) for number in range(10)]
+        faces += [encode_card(kind, color, 0, 0) for kind in (CardKind.SKIP, CardKind.REVERSE, CardKind.PLUS)]
+    return faces
+
+
+class SpriteAtlas:
+    # the 54 faces are drawn once into one sheet and reduced to a shared 256 color palette; every render
+    # pastes palette indices from it, which keeps composition cheap and the PNG encoding small
+    def __init__(self):
+        Image, ImageDraw, ImageFont = __pillow__()
+        self.font = ImageFont.load_default()
+        faces = card_faces()
+        columns = 13
+        rows = -(-len(faces) // columns)
+        sheet = Image.new('RGB', (columns * CARD_WIDTH, rows * CARD_HEIGHT * 2), BACKGROUND[:3])
+        shade = Image.new('RGBA', (CARD_WIDTH, CARD_HEIGHT), (0, 0, 0, 140))
+        boxes = {}
+        for index, face in enumerate(faces):
+            x, y = index % columns * CARD_WIDTH, index // columns * CARD_HEIGHT
+            sprite = self.__draw_face__(face)
+            sheet.paste(sprite.convert('RGB'), (x, y))
+            # unplayable cards are shown dimmed, the dimmed copies live in the lower half of the sheet
+            sheet.paste(Image.alpha_composite(sprite, shade).convert('RGB'), (x, y + rows * CARD_HEIGHT))
+            boxes[face] = x, y
+        # the label colors are drawn into an empty corner so they get exact palette entries
+        sheet.paste((255, 255, 255), (sheet.width - 16, sheet.height - 16, sheet.width - 8, sheet.height - 8))
+        sheet.paste(STACK_RGB, (sheet.width - 8, sheet.height - 16, sheet.width, sheet.height - 8))
+        self.palette = sheet.quantize(256, dither=Image.Dither.NONE)
+        self.sheet = self.__to_palette__(sheet)
+        self.background = self.__to_palette__(Image.new('RGB', (1, 1), BACKGROUND[:3])).getpixel((0, 0))
+        self.sprites: dict[int, Any] = {}
+        self.dimmed: dict[int, Any] = {}
+        for face, (x, y) in boxes.items():
+            self.sprites[face] = self.sheet.crop((x, y, x + CARD_WIDTH, y + CARD_HEIGHT))
+            y += rows * CARD_HEIGHT
+            self.dimmed[face] = self.sheet.crop((x, y, x + CARD_WIDTH, y + CARD_HEIGHT))
+        self.rings = {color: self.__draw_ring__(color) for color in COLOR_RGB}
+        self.labels: dict[tuple[str, tuple], tuple[Any, Any]] = {}
+
+    def new_image(self, width: int, height: int):
+        Image, _, _ = __pillow__()
+        image = Image.new('P', (width, height), self.background)
+        image.putpalette(self.palette.getpalette())
+        return image
+
+    def label(self, text: str, fill=(255, 255, 255)) -> tuple[Any, Any]:
+        # a label is pasted through its own mask, so it can sit on top of a card
+        label = self.labels.get((text, fill))
+        if label is None:
+            label = self.labels[text, fill] = self.__draw_label__(text, fill)
+        return label
+
+    def __to_palette__(self, image):
+        Image, _, _ = __pillow__()
+        return image.convert('RGB').quantize(palette=self.palette, dither=Image.Dither.NONE)
+
+    def __draw_label__(self, text: str, fill: tuple) -> tuple[Any, Any]:
+        Image, ImageDraw, _ = __pillow__()
+        left, top, right, bottom = ImageDraw.Draw(Image.new('L', (1, 1))).textbbox((0, 0), text, font=self.font)
+        mask = Image.new('L', (right - left + 2, bottom - top + 2), 0)
+        ImageDraw.Draw(mask).text((1 - left, 1 - top), text, font=self.font, fill=255)
+        mask = mask.resize((mask.width * LABEL_SCALE, mask.height * LABEL_SCALE), Image.NEAREST)
+        # palette indices cannot be blended, a pixel is either the label or what is below it
+        mask = mask.point(lambda value: 255 if value >= 96 else 0)
+        return self.__to_palette__(Image.new('RGB', mask.size, fill)), mask
+
+    def __draw_ring__(self, color: Color | None):
+        # the border around the top card in the current color, which for a wild card is the one chosen
+        Image, ImageDraw, _ = __pillow__()
+        ring = Image.new('RGB', (CARD_WIDTH + GAP, CARD_HEIGHT + GAP), BACKGROUND[:3])
+        ImageDraw.Draw(ring).rounded_rectangle((0, 0, ring.width - 1, ring.height - 1), radius=10,
+                                               fill=COLOR_RGB[color])
+        return self.__to_palette__(ring)
+
+    def __draw_face__(self, face: int):
+        Image, ImageDraw, _ = __pillow__()
+        sprite = Image.new('RGBA', (CARD_WIDTH, CARD_HEIGHT), BACKGROUND)
+        draw = ImageDraw.Draw(sprite)
+        draw.rounded_rectangle((0, 0, CARD_WIDTH - 1, CARD_HEIGHT - 1), radius=8, fill=(255, 255, 255, 255))
+        draw.rounded_rectangle((4, 4, CARD_WIDTH - 5, CARD_HEIGHT - 5), radius=6,
+                               fill=COLOR_RGB[card_color(face)] + (255,))
+        if is_wild(face):
+            # the four colors in the corners mark a wild card
+            half_w, half_h = CARD_WIDTH // 2, CARD_HEIGHT // 2
+            for (x, y), color in zip(((8, 8), (half_w, 8), (8, half_h), (half_w, half_h)), Color):
+                draw.rectangle((x, y, x + half_w - 9, y + half_h - 9), fill=COLOR_RGB[color] + (255,))
+        draw.ellipse((10, 22, CARD_WIDTH - 11, CARD_HEIGHT - 23), fill=(255, 255, 255, 255))
+        kind = card_kind(face)
+        text = str(card_number(face)) if kind == CardKind.NUMBER else KIND_LABELS[kind]
+        left, top, right, bottom = draw.textbbox((0, 0), text, font=self.font)
+        small = Image.new('L', (right - left + 2, bottom - top + 2), 0)
+        ImageDraw.Draw(small).text((1 - left, 1 - top), text, font=self.font, fill=255)
+        mask = small.resize((small.width * LABEL_SCALE, small.height * LABEL_SCALE), Image.NEAREST)
+        sprite.paste((20, 20, 20, 255), ((CARD_WIDTH - mask.width) // 2, (CARD_HEIGHT - mask.height) // 2), mask)
+        return sprite
+
+
+def hand_faces(hand_groups: dict[int, list[int]], playable_mask: int) -> HandFaces:
+    # playable faces first, in the same order as the hand buttons
+    faces = sorted(hand_groups, key=lambda face: (not playable_mask >> face & 1, face))
+    return tuple((face, len(hand_groups[face]), bool(playable_mask >> face & 1)) for face in faces)
+
+
+def draw_hand(atlas: SpriteAtlas, faces: HandFaces) -> bytes:
+    columns = max(1, min(HAND_COLUMNS, len(faces)))
+    rows = max(1, -(-len(faces) // columns))
+    image = atlas.new_image(columns * (CARD_WIDTH + GAP) + GAP, rows * (CARD_HEIGHT + GAP) + GAP)
+    for index, (face, count, playable) in enumerate(faces):
+        x = GAP + index % columns * (CARD_WIDTH + GAP)
+        y = GAP + index // columns * (CARD_HEIGHT + GAP)
+        image.paste(atlas.sprites[face] if playable else atlas.dimmed[face], (x, y))
+        if count > 1:
+            badge, mask = atlas.label(f'x{count}')
+            image.paste(badge, (x + CARD_WIDTH - badge.width, y + CARD_HEIGHT - badge.height), mask)
+    return encode_png(image)
+
+
+def draw_board(atlas: SpriteAtlas, face: int, color: Color | None, pickup_stack: int, is_reversed: int) -> bytes:
+    image = atlas.new_image(CARD_WIDTH * 3, CARD_HEIGHT + 2 * GAP)
+    image.paste(atlas.rings[color], (GAP // 2, GAP // 2))
+    image.paste(atlas.sprites[face], (GAP, GAP))
+    x = CARD_WIDTH + 3 * GAP
+    arrow, mask = atlas.label('<<' if is_reversed < 0 else '>>')
+    image.paste(arrow, (x, GAP), mask)
+    if pickup_stack:
+        stack, mask = atlas.label(f'+{pickup_stack}', STACK_RGB)
+        image.paste(stack, (x, CARD_HEIGHT + GAP - stack.height), mask)
+    return encode_png(image)
+
+
+def encode_png(image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', compress_level=1)  # a fast level, the images are small and short lived
+    return buffer.getvalue()
+
+
+class CardRenderer:
+    # renders are cached by a hash of what they show, so identical hands and boards are drawn once;
+    # drawing happens on worker threads, the event loop only waits for the result
+    def __init__(self, cache_size: int = 2048, workers: int = 2):
+        self.cache_size = cache_size
+        self.cache: OrderedDict[bytes, bytes] = OrderedDict()
+        self.inflight: dict[bytes, asyncio.Future] = {}
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='images')
+        self.atlas: SpriteAtlas | None = None
+        self.atlas_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def hand(self, hand_groups: dict[int, list[int]], playable_mask: int) -> bytes:
+        faces = hand_faces(hand_groups, playable_mask)
+        key = hashlib.blake2b(repr(('hand', faces)).encode(), digest_size=16).digest()
+        return await self.__render__(key, draw_hand, faces)
+
+    async def board(self, face: int, color: Color | None, pickup_stack: int, is_reversed: int) -> bytes:
+        face &= FACE_MASK
+        key = hashlib.blake2b(repr(('board', face, color, pickup_stack, is_reversed)).encode(),
+                              digest_size=16).digest()
+        return await self.__render__(key, draw_board, face, color, pickup_stack, is_reversed)
+
+    async def preload(self):
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.__load_atlas__)
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+    async def __render__(self, key: bytes, draw: Callable[..., bytes], *args) -> bytes:
+        png = self.cache.get(key)
+        if png is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return png
+        inflight = self.inflight.get(key)
+        if inflight is not None:
+            # the same image is already being drawn for another message
+            self.hits += 1
+            return await inflight
+        self.misses += 1
+        future = self.inflight[key] = asyncio.get_running_loop().run_in_executor(
+            self.executor, self.__draw__, draw, args)
+        try:
+            png = await future
+        finally:
+            del self.inflight[key]
+        self.cache[key] = png
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return png
+
+    def __draw__(self, draw: Callable[..., bytes], args: tuple) -> bytes:
+        return draw(self.__load_atlas__(), *args)
+
+    def __load_atlas__(self) -> SpriteAtlas:
+        with self.atlas_lock:
+            if self.atlas is None:
+                self.atlas = SpriteAtlas()
+            return self.atlas
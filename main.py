@@ -1,237 +1,901 @@
+import asyncio
+import io
+import os
+import time
+from typing import Hashable
+
+STARTED_AT = time.time()  # the imports below are part of the cold start
+
 import discord
-from discord.ext import commands
-from discord.ui import View, Button
+from discord import app_commands
+from discord.ui import View
+
+from card import Color, card_label
+from game import (Game, GameEvent, GameFinished, GameState, Player, PlayersChanged, SpectatorsChanged, StateChanged,
+                  TurnCompleted)
+from gamelog import GameLog, LogArchive
+from images import CardRenderer, images_available
+from ai import AIRunner, is_ai
+from actor import ActorBusy, DuplicateAction, GameActor
+from broadcast import Broadcast
+from config import Config, load_config
+from events import EventBus
+import metrics
+from reaper import Reaper
+from render import RenderScheduler
+from routing import (TOURNAMENT_ACTIONS, Action, Reply, Router, build_view, color_buttons, decode_custom_id, hand_page,
+                     in_game_buttons, lobby_buttons, spectator_buttons, table_buttons, tournament_buttons)
+from rules import DEFAULT_RULES, HouseRule, describe_rules, load_channel_rules, update_channel_rules
+from shard import LAUNCHED_AT_ENV, shards_from_env, worker_index
+from slash import GATEWAY_INTENTS, sync_tree
+from snapshot import SnapshotStore
+from stats import StatsStore
+from store import GameStore, StoredGame, VersionConflict, store_from_env
+from tournament import Table, TableScheduler, Tournament, TournamentMode, create_table_game
+
+
+class HandMessage:
+    message: discord.Message | None
+    page: int
+
+    def __init__(self):
+        self.message = None
+        self.page = 0
+
+
+game_actors: dict[int, GameActor] = {}
+tournaments: dict[int, tuple[Tournament, discord.Message]] = {}
+table_games: dict[int, tuple[int, Tournament, Table]] = {}  # thread id to tournament channel id, tournament, table
+
+METRICS_PORT = 9464
+AI_RETRY_DELAY = 1.0  # seconds before a bot whose move was rejected looks at the game again
+INTERACTION_HISTOGRAM = metrics.registry.histogram('uno_interaction_seconds',
+                                                   'Time from receiving a component interaction to handling it')
+COLD_START_HISTOGRAM = metrics.registry.histogram('uno_cold_start_seconds',
+                                                  'Time from launching the process to the first ready event')
+metrics_server: asyncio.AbstractServer | None = None
+reaper_task: asyncio.Task | None = None
+
+render_scheduler = RenderScheduler()
+table_scheduler = TableScheduler()
+card_images = CardRenderer() if images_available() else None
+ai_turns: set[int] = set()
+# these touch the disk or the network, main() opens them once the config is loaded
+config: Config | None = None
+snapshot_store: SnapshotStore | None = None
+game_store: GameStore | None = None
+log_archive: LogArchive | None = None
+channel_rules: dict[int, HouseRule] = {}
+stats_store: StatsStore | None = None
+reaper: Reaper | None = None
+ai_runner: AIRunner | None = None
+cold_start: dict[str, float] = {}  # phase -> seconds since launch
+
+shard_ids, shard_count = shards_from_env()
+intents = discord.Intents(**{name: True for name in GATEWAY_INTENTS})
+if shard_count is None:
+    bot = discord.Client(intents=intents)
+else:
+    bot = discord.AutoShardedClient(intents=intents, shard_ids=shard_ids, shard_count=shard_count)
+tree = app_commands.CommandTree(bot)
+uno_commands = app_commands.Group(name='uno', description='Plays uno in this channel', guild_only=True)
+
+
+def close_game(message: discord.Message, content: str, winner: Player | None = None):
+    entry = game_store[message.channel.id]
+    hands = entry.hands
+    table_game = table_games.pop(message.channel.id, None)
+    if table_game is not None:
+        # however a table ends, the round has to learn about it
+        finish_table(*table_game, winner, entry.game.players)
+        if winner is None:
+            content = f'{content}\n{table_game[2].winner.nickname} advances by forfeit'
+    if entry.game.log is not None and entry.game.log.data:
+        log_archive.append(entry.game.log)
+    game_store.delete(message.channel.id)
+    game_actors.pop(message.channel.id).close()
+    reaper.forget(message.channel.id)
+    snapshot_store.delete(message.channel.id)
+    done = render_scheduler.schedule(message.channel.id, message.id, message,
+                                     lambda: dict(content=content, view=View(timeout=None), attachments=[]))
+    buckets = [h.message.id for h in hands.values() if h.message is not None]
+    spectator_message = entry.broadcast.message if entry.broadcast is not None else None
+    if spectator_message is not None:
+        final = dict(content=entry.broadcast.final(content), view=View(timeout=None))
+        done = render_scheduler.schedule(message.channel.id, spectator_message.id, spectator_message, lambda: final,
+                                         bucket=spectator_message.id)
+        buckets.append(spectator_message.id)
+    render_scheduler.forget(message.channel.id, *buckets, after=done)
+
+
+def evict_game(channel_id: int, entry: StoredGame):
+    # the game stays in the shared store, the next interaction in the channel loads it again;
+    # the reaper keeps tracking it and loads it back itself to expire or archive it
+    actor = game_actors.pop(channel_id, None)
+    if actor is not None:
+        actor.close()
+
+
+async def reap_game(channel_id: int, content: str):
+    entry = game_store.get(channel_id)
+    if entry is None:
+        game_store.delete(channel_id)  # nothing left to show the players, only the stored copy
+        return
+    close_game(entry.message, content)
 
-from game import *
 
-f = open('token.txt', 'r')
-TOKEN = f.read()
+async def finish_game(message: discord.Message, winner: Player):
+    close_game(message, f'The game is finished. The winner is {winner.nickname}', winner)
 
-channel_to_game: dict[int, tuple[Game, discord.Message]] = {}
-game_to_player_cards: dict[Game, dict[Player, discord.Message | None]] = {}
 
-bot = commands.Bot(case_insensitive=True, intents=discord.Intents.all(), command_prefix='/')
+async def abort_game(message: discord.Message):
+    close_game(message, 'The game is aborted.')
 
 
-async def finish_game(message: discord.Message, winner: Player):
-    await message.edit(content=f'The game is finished. The winner is {winner.nickname}', view=View(timeout=None))
-    (g, _) = channel_to_game.pop(message.channel.id, None)
-    game_to_player_cards.pop(g, None)
+router = Router()
 
 
-async def abort_game(message: discord.Message):
-    await message.edit(content=f'The game is aborted.', view=View(timeout=None))
-    (g, _) = channel_to_game.pop(message.channel.id, None)
-    game_to_player_cards.pop(g)
+async def answer(interaction: discord.Interaction, content: str):
+    # before the click is acknowledged the answer is its response, after that a followup
+    if interaction.response.is_done():
+        await interaction.followup.send(content=content, ephemeral=True)
+    else:
+        await interaction.response.send_message(content=content, ephemeral=True)
+
+
+def tell(interaction: discord.Interaction, content: str) -> Reply:
+    return lambda: answer(interaction, content)
+
+
+def show(interaction: discord.Interaction, message: dict) -> Reply:
+    # edits the message the clicked button is on, the player's hand
+    return lambda: interaction.edit_original_response(**message)
 
 
-async def join_game_callback(interaction: discord.Interaction):
-    g, _ = channel_to_game[interaction.channel.id]
+@router.route(Action.JOIN)
+async def join_game_callback(interaction: discord.Interaction, channel_id: int, arg: str) -> Reply | None:
+    g = game_store[channel_id].game
     player = Player(interaction.user.id, interaction.user.display_name)
     try:
         await g.add_player(player)
-        await interaction.response.defer()
     except RuntimeError as re:
         print(re)
-        await interaction.response.send_message(content='You cannot join a game twice', ephemeral=True)
+        return tell(interaction, 'You cannot join a game twice')
 
 
-async def leave_button_callback(interaction: discord.Interaction):
-    g, _ = channel_to_game[interaction.channel.id]
-    player = next((player for player in g.players if player.discord_tag == interaction.user.id), None)
+@router.route(Action.LEAVE)
+async def leave_button_callback(interaction: discord.Interaction, channel_id: int, arg: str) -> Reply | None:
+    g = game_store[channel_id].game
+    player = g.get_player(interaction.user.id)
     if player is None:
-        await interaction.response.send_message(content='You are not part of the current game', ephemeral=True)
+        return tell(interaction, 'You are not part of the current game')
     try:
         await g.remove_player(player)
-        await interaction.response.defer()
     except RuntimeError:
-        await interaction.response.send_message(content='You cannot leave if you are an admin', ephemeral=True)
+        return tell(interaction, 'You cannot leave if you are an admin')
 
 
-async def abort_button_callback(interaction: discord.Interaction):
-    g, _ = channel_to_game[interaction.channel.id]
-    if g.admin.discord_tag != interaction.user.id:
-        await interaction.response.send_message(content='Only an admin can abort the game', ephemeral=True)
-    else:
-        await interaction.response.send_message(content='The game is successfully aborted', ephemeral=True)
-        await abort_game(interaction.message)
+@router.route(Action.ABORT)
+async def abort_button_callback(interaction: discord.Interaction, channel_id: int, arg: str) -> Reply | None:
+    entry = game_store[channel_id]
+    if channel_id in table_games:
+        return tell(interaction, 'A tournament table cannot be aborted')
+    if entry.game.admin.discord_tag != interaction.user.id:
+        return tell(interaction, 'Only an admin can abort the game')
+    await abort_game(entry.message)
+    return tell(interaction, 'The game is successfully aborted')
 
 
-async def start_game_callback(interaction: discord.Interaction):
-    g, _ = channel_to_game[interaction.channel.id]
+@router.route(Action.START)
+async def start_game_callback(interaction: discord.Interaction, channel_id: int, arg: str) -> Reply | None:
+    g = game_store[channel_id].game
     if interaction.user.id != g.admin.discord_tag:
-        await interaction.response.send_message(content='Only an admin can start the game', ephemeral=True)
+        return tell(interaction, 'Only an admin can start the game')
     try:
-        game_to_player_cards[g] = {}
-        for player in g.players:
-            game_to_player_cards[g][player] = None
+        game_store[channel_id].hands = {player: HandMessage() for player in g.players}
         await g.start_game()
-        await interaction.response.defer()
     except RuntimeError:
-        await interaction.response.send_message(content='Cannot start game right now', ephemeral=True)
+        return tell(interaction, 'Cannot start game right now')
+
 
+@router.route(Action.ADD_BOT)
+async def add_bot_callback(interaction: discord.Interaction, channel_id: int, arg: str) -> Reply | None:
+    g = game_store[channel_id].game
+    if interaction.user.id != g.admin.discord_tag:
+        return tell(interaction, 'Only an admin can add bots')
+    await g.add_player(ai_runner.create_player(g))
+
+
+def create_hand_message(channel_id: int, game: Game, player: Player) -> dict:
+    hand_message = game_store[channel_id].hands[player]
+    buttons, hand_message.page, page_count = hand_page(channel_id, game, player, hand_message.page)
+    content = 'Your hand' if page_count == 1 else f'Your hand (page {hand_message.page + 1}/{page_count})'
+    return dict(content=content, view=build_view(buttons))
+
+
+async def hand_files(game: Game, player: Player) -> list[discord.File]:
+    if card_images is None:
+        return []
+    mask = game.playable_mask if game.current_player is player else game.jump_in_mask()
+    png = await card_images.hand(game.playersToCards[player].faces, mask)
+    return [discord.File(io.BytesIO(png), 'hand.png')]
+
+
+def get_hand_player(interaction: discord.Interaction, channel_id: int) -> tuple[Game, Player]:
+    g = game_store[channel_id].game
+    return g, g.get_player(interaction.user.id)
+
+
+async def post_broadcast(entry: StoredGame) -> discord.Message:
+    # posted once for all spectators, after a restart the first new spectator posts it again;
+    # spectators who click while it is being posted wait for the same message
+    broadcast = entry.broadcast
+    if broadcast.message is None:
+        if broadcast.posting is None:
+            broadcast.posting = asyncio.ensure_future(entry.message.channel.send(**broadcast.render()))
+        posting = broadcast.posting
+        try:
+            broadcast.message = await posting
+        finally:
+            if broadcast.posting is posting:
+                broadcast.posting = None
+    return broadcast.message
+
+
+@router.route(Action.SPECTATE)
+async def spectate_button_callback(interaction: discord.Interaction, channel_id: int, arg: str) -> Reply | None:
+    entry = game_store[channel_id]
+    g = entry.game
+    spectator = g.spectators.get(interaction.user.id)
+    if spectator is not None:
+        await g.remove_spectator(spectator)
+        return tell(interaction, 'You stopped watching this game.')
+    await g.add_spectator(Player(interaction.user.id, interaction.user.display_name))
+
+    async def send():
+        message = await post_broadcast(entry)
+        await answer(interaction, f'You are watching this game: {message.jump_url}')
+
+    return send
+
+
+@router.route(Action.REVEAL)
+async def reveal_button_callback(interaction: discord.Interaction, channel_id: int, arg: str) -> Reply | None:
+    entry = game_store[channel_id]
+    g = entry.game
+    if interaction.user.id != g.admin.discord_tag:
+        return tell(interaction, 'Only an admin can choose this.')
+    g.reveal_hands = not g.reveal_hands
+    await game_store.commit(channel_id)
+    save_game(channel_id)
+    entry.broadcast.changed()
+    schedule_broadcast(channel_id)
 
-def create_init_buttons(start_active: bool) -> list[Button]:
-    join_button = Button(label='Join game')
-    join_button.callback = join_game_callback
-    leave_button = Button(label='Leave game')
-    leave_button.callback = leave_button_callback
-    abort_button = Button(label='Abort game')
-    abort_button.callback = abort_button_callback
-    start_button = Button(label='Start game', disabled=not start_active)
-    start_button.callback = start_game_callback
-    return [join_button, leave_button, abort_button, start_button]
 
+@router.route(Action.HAND)
+async def view_cards_button_callback(interaction: discord.Interaction, channel_id: int, arg: str) -> Reply | None:
+    g, p = get_hand_player(interaction, channel_id)
+    if p is None:
+        return tell(interaction, 'You are not participating in this game.')
+    hand_message = game_store[channel_id].hands[p]
+    message = create_hand_message(channel_id, g, p)
+    files = await hand_files(g, p)
 
-def create_wild_pick_color_view(game: Game, player: Player, card_id: int) -> View:
-    color_buttons = []
-    for color in Color:
-        async def color_button_callback(interaction: discord.Interaction):
-            await game.process_turn(discord_tag=player.discord_tag, card_id=card_id,
-                                    wild_color=Color(int(interaction.data['custom_id'])))
+    async def send():
+        hand_message.message = await interaction.followup.send(**message, files=files, ephemeral=True, wait=True)
 
-            await interaction.response.edit_message(content='Your hand', view=create_view_card_view(game, player))
+    return send
 
-        color_buttons.append(Button(custom_id=str(color.value), label=f'{color}'))
-        color_buttons[-1].callback = color_button_callback
 
-    async def return_color_button_callback(interaction: discord.Interaction):
-        # await game.process_turn(discord_tag=player.discord_tag, card_id=card_id,
-        #                         wild_color=None)
+@router.route(Action.PLAY)
+async def regular_card_callback(interaction: discord.Interaction, channel_id: int, arg: str) -> Reply | None:
+    g, p = get_hand_player(interaction, channel_id)
+    if p is None:
+        return tell(interaction, 'You are not participating in this game.')
+    await g.process_turn(p.discord_tag, int(arg), None)
 
-        await interaction.response.edit_message(content='Your hand', view=create_view_card_view(game, player))
 
-    color_buttons.append(Button(label='Back'))
-    color_buttons[-1].callback = return_color_button_callback
-    v = View(timeout=None)
-    for i in color_buttons:
-        v.add_item(i)
-    return v
+@router.route(Action.DRAW)
+async def draw_card_callback(interaction: discord.Interaction, channel_id: int, arg: str) -> Reply | None:
+    g, p = get_hand_player(interaction, channel_id)
+    if p is None:
+        return tell(interaction, 'You are not participating in this game.')
+    await g.process_turn(p.discord_tag, None, None)
 
 
-def create_view_card_view(game: Game, player: Player) -> View:
-    async def draw_card_callback(interaction: discord.Interaction):
-        await game.process_turn(player.discord_tag, None, None)
-        await interaction.response.defer()
-        pass
-
-    buttons = []
-    for card in game.playersToCards[player]:
-        async def regular_card_callback(interaction: discord.Interaction):
-            await game.process_turn(player.discord_tag, int(interaction.data['custom_id']), None)
-            await interaction.response.defer()
-
-        async def wild_card_callback(interaction: discord.Interaction):
-            await interaction.response.edit_message(content='Your hand',
-                                                    view=create_wild_pick_color_view(game, player, int(
-                                                        interaction.data['custom_id'])))
-
-        buttons.append(Button(label=f'{card}', custom_id=str(card.id), disabled=(
-                not game.is_playable(card) or game.current_player.discord_tag != player.discord_tag)))
-        if isinstance(card, Wild) or isinstance(card, WildPlus):
-            buttons[-1].callback = wild_card_callback
-        else:
-            buttons[-1].callback = regular_card_callback
-    buttons.append(Button(label='Draw a card', disabled=game.current_player.discord_tag != player.discord_tag))
-    buttons[-1].callback = draw_card_callback
-    v = View(timeout=None)
-    for button in buttons:
-        v.add_item(button)
-    return v
-
-
-async def view_cards_button_callback(interaction: discord.Interaction):
-    (g, _) = channel_to_game[interaction.channel.id]
-    p = next((player for player in g.players if player.discord_tag == interaction.user.id), None)
+@router.route(Action.WILD)
+async def wild_card_callback(interaction: discord.Interaction, channel_id: int, arg: str) -> Reply | None:
+    return show(interaction, dict(content='Your hand', view=build_view(color_buttons(channel_id, int(arg)))))
+
+
+@router.route(Action.COLOR)
+async def color_button_callback(interaction: discord.Interaction, channel_id: int, arg: str) -> Reply | None:
+    g, p = get_hand_player(interaction, channel_id)
     if p is None:
-        await interaction.response.send_message(content='You are not participating in this game.', ephemeral=True)
-    await interaction.response.send_message(content='Your hand', view=create_view_card_view(g, p), ephemeral=True)
-    msg = await interaction.original_response()
-    game_to_player_cards[g][p] = msg
+        return tell(interaction, 'You are not participating in this game.')
+    card, color = arg.split('.')
+    await g.process_turn(discord_tag=p.discord_tag, card_id=int(card), wild_color=Color(int(color)))
+    if g.state != GameState.ONGOING:
+        return None  # the wild was the last card, the game is closed and its hands with it
+    return show(interaction, create_hand_message(channel_id, g, p))
+
 
+@router.route(Action.BACK)
+async def return_color_button_callback(interaction: discord.Interaction, channel_id: int, arg: str) -> Reply | None:
+    g, p = get_hand_player(interaction, channel_id)
+    if p is None:
+        return tell(interaction, 'You are not participating in this game.')
+    return show(interaction, create_hand_message(channel_id, g, p))
 
-def create_in_game_buttons() -> list[Button]:
-    view_cards_button = Button(label='View cards')
-    view_cards_button.callback = view_cards_button_callback
-    abort_button = Button(label='Abort game')
-    abort_button.callback = abort_button_callback
 
-    return [view_cards_button, abort_button]
+@router.route(Action.PAGE)
+async def page_button_callback(interaction: discord.Interaction, channel_id: int, arg: str) -> Reply | None:
+    g, p = get_hand_player(interaction, channel_id)
+    if p is None:
+        return tell(interaction, 'You are not participating in this game.')
+    game_store[channel_id].hands[p].page = int(arg)
+    return show(interaction, create_hand_message(channel_id, g, p))
 
 
-async def reformat_game_message(channel_id: int):
-    game, game_message = channel_to_game[channel_id]
-    v = View(timeout=None)
+@router.route(Action.TOURNAMENT_JOIN)
+async def join_tournament_callback(interaction: discord.Interaction, channel_id: int, arg: str) -> Reply | None:
+    t, _ = tournaments[channel_id]
+    try:
+        t.add_entrant(Player(interaction.user.id, interaction.user.display_name))
+        reformat_tournament_message(channel_id)
+    except RuntimeError:
+        return tell(interaction, 'You cannot join this tournament')
+
+
+@router.route(Action.TOURNAMENT_LEAVE)
+async def leave_tournament_callback(interaction: discord.Interaction, channel_id: int, arg: str) -> Reply | None:
+    t, _ = tournaments[channel_id]
+    player = t.seats.get(interaction.user.id)
+    if player is None:
+        return tell(interaction, 'You are not part of this tournament')
+    try:
+        t.remove_entrant(player)
+        reformat_tournament_message(channel_id)
+    except RuntimeError:
+        return tell(interaction, 'You cannot leave this tournament')
+
+
+@router.route(Action.TOURNAMENT_START)
+async def start_tournament_callback(interaction: discord.Interaction, channel_id: int, arg: str) -> Reply | None:
+    t, _ = tournaments[channel_id]
+    if interaction.user.id != t.admin.discord_tag:
+        return tell(interaction, 'Only an admin can start the tournament')
+    try:
+        tables = t.start()
+    except RuntimeError:
+        return tell(interaction, 'Cannot start the tournament right now')
+    reformat_tournament_message(channel_id)
+    schedule_tables(channel_id, tables)
+
+
+@bot.event
+async def on_interaction(interaction: discord.Interaction):
+    if interaction.type != discord.InteractionType.component:
+        return
+    decoded = decode_custom_id(interaction.data.get('custom_id', ''))
+    if decoded is None:
+        return
+    if decoded[1] in TOURNAMENT_ACTIONS:
+        if decoded[0] not in tournaments:
+            await interaction.response.send_message(content='This tournament is over.', ephemeral=True)
+        else:
+            await acknowledge(interaction)
+            await deliver(await router.dispatch(interaction, *decoded))
+        return
+    if decoded[0] not in game_store and not await load_stored_game(decoded[0]):
+        await interaction.response.send_message(content='This game is over.', ephemeral=True)
+        return
+    start = time.perf_counter_ns()
+    try:
+        if await submit_interaction(interaction, (interaction.user.id, interaction.data['custom_id']), *decoded):
+            reaper.touch(decoded[0], interaction.user.id)
+    finally:
+        metrics.record_since(INTERACTION_HISTOGRAM, start)
+
+
+async def submit_interaction(interaction: discord.Interaction, key: Hashable | None, channel_id: int, action: Action,
+                             arg: str) -> bool:
+    # runs the handler on the game's actor, a move that cannot be made is answered instead of raised;
+    # the click is acknowledged before it waits behind the others and answered after it left the actor,
+    # so no discord call is made while the game is held
+    try:
+        done = game_actors[channel_id].enqueue(key, lambda: router.dispatch(interaction, channel_id, action, arg))
+    except DuplicateAction:
+        await acknowledge(interaction)
+        return False
+    except ActorBusy:
+        await answer(interaction, 'The game is busy, try again.')
+        return False
+    except RuntimeError:
+        await answer(interaction, 'You cannot do this right now.')
+        return False
+    await acknowledge(interaction)
+    try:
+        reply = await done
+    except VersionConflict:
+        await deliver(tell(interaction, 'The game has changed, try again.'))
+        return False
+    except RuntimeError:
+        await deliver(tell(interaction, 'You cannot do this right now.'))
+        return False
+    await deliver(reply)
+    return True
+
+
+async def acknowledge(interaction: discord.Interaction):
+    # discord drops a click that is not answered within 3 seconds, the real answer may follow later
+    if interaction.response.is_done():
+        return
+    try:
+        await interaction.response.defer()
+    except discord.HTTPException as e:
+        print(f'acknowledge, the click in channel {interaction.channel_id} could not be acknowledged: {e!r}')
+
+
+async def deliver(reply: Reply | None):
+    if reply is None:
+        return
+    try:
+        await reply()
+    except discord.HTTPException as e:
+        print(f'deliver, the answer could not be sent: {e!r}')
+
+
+def render_game_message(channel_id: int) -> dict | None:
+    entry = game_store.get(channel_id)
+    if entry is None:
+        return None
+    game = entry.game
     if game.state == GameState.INITIALIZED or game.state == GameState.READY_TO_START:
-        for button in create_init_buttons(game.state == GameState.READY_TO_START):
-            v.add_item(button)
+        v = build_view(lobby_buttons(channel_id, game.state == GameState.READY_TO_START))
         players_str = '\n'.join(list(map(lambda p: p.nickname, game.players)))
-        msg = f'Initialized a new game\nCurrently in game:\n{players_str}'
-        await game_message.edit(content=msg, view=v)
+        msg = f'Initialized a new game\nHouse rules: {describe_rules(game.rules)}\nCurrently in game:\n{players_str}'
+        return dict(content=msg, view=v)
     if game.state == GameState.ONGOING:
-        for button in create_in_game_buttons():
-            v.add_item(button)
+        v = build_view(table_buttons(channel_id) if channel_id in table_games else in_game_buttons(channel_id))
         players_str = '\n'.join(
             list(map(lambda p: f'{p.nickname} – {len(game.playersToCards[p])} cards', game.players)))
 
-        msg = f'The game is ongoing\nIt is {game.current_player.nickname}\'s turn\nCurrent pickup stack is {game.pickup_stack}\nCurrent color is {game.current_color}\nLast card was {game.current_card}\n{players_str}\n'
-        await game_message.edit(content=msg, view=v)
+        msg = f'The game is ongoing\nIt is {game.current_player.nickname}\'s turn\nCurrent pickup stack is {game.pickup_stack}\nCurrent color is {game.current_color}\nLast card was {card_label(game.current_card)}\n{players_str}\n'
+        return dict(content=msg, view=v)
+    return None
+
+
+def render_hand_message(channel_id: int, game: Game, player: Player) -> dict | None:
+    if game.state != GameState.ONGOING:
+        return None
+    return create_hand_message(channel_id, game, player)
+
+
+async def render_game_image(channel_id: int) -> dict | None:
+    kwargs = render_game_message(channel_id)
+    entry = game_store.get(channel_id)
+    if kwargs is None or entry.game.state != GameState.ONGOING:
+        return kwargs
+    game = entry.game
+    png = await card_images.board(game.current_card, game.current_color, game.pickup_stack, game.is_reversed)
+    kwargs['attachments'] = [discord.File(io.BytesIO(png), 'board.png')]
+    return kwargs
+
+
+async def render_hand_image(channel_id: int, game: Game, player: Player) -> dict | None:
+    kwargs = render_hand_message(channel_id, game, player)
+    if kwargs is not None:
+        kwargs['attachments'] = await hand_files(game, player)
+    return kwargs
 
-        if game_to_player_cards[game][game.current_player]:
-            message = game_to_player_cards[game][game.current_player]
-            await message.edit(content='Your hand', view=create_view_card_view(game, game.current_player))
 
-        if game_to_player_cards[game][game.last_player]:
-            message = game_to_player_cards[game][game.last_player]
-            await message.edit(content='Your hand', view=create_view_card_view(game, game.last_player))
+async def reformat_game_message(channel_id: int):
+    entry = game_store[channel_id]
+    game = entry.game
+    # with images the drawing is left to the render scheduler, this only queues the edits
+    render_game = render_game_message if card_images is None else render_game_image
+    render_hand = render_hand_message if card_images is None else render_hand_image
+    render_scheduler.schedule(channel_id, entry.message_id, entry.message, lambda: render_game(channel_id))
+    if game.state != GameState.ONGOING:
+        return
+    hands = entry.hands
+    # with jump-in anyone may get a playable card and with 7-0 hands change owners, so every hand is redrawn
+    players = game.players if game.rules & (HouseRule.JUMP_IN | HouseRule.SEVEN_ZERO) else (
+        game.current_player, game.last_player)
+    for player in players:
+        hand_message = hands.get(player)
+        if hand_message is not None and hand_message.message is not None:
+            message = hand_message.message
+            render_scheduler.schedule(channel_id, message.id, message,
+                                      lambda p=player: render_hand(channel_id, game, p), bucket=message.id)
+
+
+def save_game(channel_id: int):
+    entry = game_store[channel_id]
+    snapshot_store.save(channel_id, entry.message_id, entry.game)
+
+
+def journal_turn(channel_id: int):
+    entry = game_store[channel_id]
+    snapshot_store.append_turn(channel_id, entry.message_id, entry.game, *entry.game.last_action)
 
 
-@bot.command(name='uno', description='Starts a new uno game')
-@commands.guild_only()
-async def uno(ctx: commands.Context):
-    admin = Player(ctx.message.author.id, ctx.message.author.display_name)
-    if ctx.channel.id in channel_to_game:
-        game, _ = channel_to_game[ctx.channel.id]
-        await ctx.send(
-            content=f'There is already a game in progress hosted by {game.admin.nickname}', ephemeral=True)
+def schedule_ai_turn(channel_id: int):
+    game = game_store[channel_id].game
+    if game.state == GameState.ONGOING and is_ai(game.current_player) and channel_id not in ai_turns:
+        ai_turns.add(channel_id)
+        asyncio.create_task(play_ai_turn(channel_id, game, game.current_player))
+
+
+async def play_ai_turn(channel_id: int, game: Game, player: Player):
+    # the move is searched in a worker process, only applying it goes through the game actor
+    try:
+        card_id, wild_color = await ai_runner.choose(game, player)
+    finally:
+        ai_turns.discard(channel_id)
+    try:
+        await game_actors[channel_id].submit((player.discord_tag, 'ai'),
+                                             lambda: game.process_turn(player.discord_tag, card_id, wild_color))
+    except KeyError:
+        return  # the game was closed while the bot was thinking
+    except RuntimeError as e:
+        print(f'play_ai_turn, {player.nickname} cannot play in channel {channel_id}: {e!r}')
+        # the move went stale while it was searched, the turns made meanwhile did not schedule the bot again
+        asyncio.get_running_loop().call_later(AI_RETRY_DELAY, retry_ai_turn, channel_id, game)
+
+
+def retry_ai_turn(channel_id: int, game: Game):
+    entry = game_store.get(channel_id)
+    if entry is not None and entry.game is game:
+        schedule_ai_turn(channel_id)
+
+
+def schedule_broadcast(channel_id: int):
+    # one edit of one message however many are watching, and the scheduler folds the edits of quick turns together
+    broadcast = game_store[channel_id].broadcast
+    if broadcast.message is not None:
+        render_scheduler.schedule(channel_id, broadcast.message.id, broadcast.message, broadcast.render,
+                                  bucket=broadcast.message.id)
+
+
+def attach_game(channel_id: int, entry: StoredGame):
+    async def persist(event: GameEvent):
+        # the commit has to succeed before anything is written locally or shown to anyone,
+        # a change that lost the race with another process is never rendered or played on
+        if event.game.state != GameState.STARTED:  # the cards are dealt right after, nothing worth keeping yet
+            await game_store.commit(channel_id)
+            if isinstance(event, TurnCompleted):
+                journal_turn(channel_id)
+            else:
+                save_game(channel_id)
+            reaper.touch(channel_id)
+        errors = await committed.publish(event)
+        if errors:
+            raise errors[0]
+
+    async def render(event: GameEvent):
+        if event.game.state != GameState.STARTED:
+            await reformat_game_message(channel_id)
+
+    async def play_next(event: StateChanged | TurnCompleted):
+        schedule_ai_turn(channel_id)
+
+    async def finish(event: GameFinished):
+        stats_store.record(entry.message.guild.id, channel_id, event.game, event.winner)
+        await finish_game(entry.message, event.winner)
+
+    async def broadcast(event: GameEvent):
+        entry.broadcast.changed(event)
+        schedule_broadcast(channel_id)
+
+    g = entry.game
+    game_actors[channel_id] = GameActor()
+    entry.broadcast = Broadcast(g, lambda: build_view(spectator_buttons(channel_id, g.reveal_hands)))
+    committed = EventBus()
+    committed.subscribe((PlayersChanged, SpectatorsChanged, StateChanged, TurnCompleted), broadcast)
+    committed.subscribe((PlayersChanged, StateChanged, TurnCompleted), render)
+    committed.subscribe((StateChanged, TurnCompleted), play_next)
+    g.events.subscribe((PlayersChanged, SpectatorsChanged, StateChanged, TurnCompleted), persist)
+    g.events.subscribe(GameFinished, finish)
+
+
+@uno_commands.command(name='start', description='Starts a new uno game')
+async def uno_start(interaction: discord.Interaction):
+    # the game message is a regular message, interaction responses can only be edited for 15 minutes
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    channel_id = interaction.channel_id
+    entry = await game_store.load(channel_id)
+    if entry is not None:
+        await interaction.followup.send(
+            content=f'There is already a game in progress hosted by {entry.game.admin.nickname}', ephemeral=True)
         return
-    g = Game(admin)
+    admin = Player(interaction.user.id, interaction.user.display_name)
+    g = Game(admin, rules=channel_rules.get(channel_id, DEFAULT_RULES))
+    g.log = GameLog()
     msg = f'Initialized a new game\nCurrently in game:\n{admin.nickname}'
-    v = View(timeout=None)
-
-    for button in create_init_buttons(False):
-        v.add_item(button)
-    game_message = await ctx.send(content=msg, view=v)
-    channel_to_game[ctx.channel.id] = g, game_message
-    g.on_ready_callbacks.append(lambda: reformat_game_message(ctx.channel.id))
-    g.on_initialized_callbacks.append(lambda: reformat_game_message(ctx.channel.id))
-    g.on_ongoing_callbacks.append(lambda: reformat_game_message(ctx.channel.id))
-    g.on_finished_callbacks.append(lambda p: finish_game(game_message, p))
-    g.on_player_count_changed_callbacks.append(lambda: reformat_game_message(ctx.channel.id))
-    g.on_turn_completed_callbacks.append(lambda: reformat_game_message(ctx.channel.id))
-
-
-# @bot.event
-# async def on_guild_available(guild: discord.Guild):
-#     print('on_guild_available is called')
-#     _ = await bot.tree.sync(guild=guild)
-#     print(_)
-
-
-# bot.add_command(uno)
-bot.run(token=TOKEN)
-
-# if __name__ == '__main__':
-#     a = Player("a", "a")
-#     b = Player("b", "b")
-#     c = Player('c', 'c')
-#     g = Game(admin=a)
-#     g.add_player(b)
-#     g.add_player(c)
-#     g.start_game()
-#     print(g)
-#     g.process_turn(a.discord_tag, None, None)
-#     g.process_turn(c.discord_tag, None, None)
-#     g.process_turn(b.discord_tag, None, None)
-#     g.process_turn(a.discord_tag, None, None)
-#     print(g)
+    game_message = await interaction.channel.send(content=msg, view=build_view(lobby_buttons(channel_id, False)))
+    attach_game(channel_id, game_store.add(channel_id, g, game_message))
+    await game_store.commit(channel_id)
+    save_game(channel_id)
+    await reaper.admit(channel_id)
+    await interaction.followup.send(content='The game is created, waiting for players to join', ephemeral=True)
+
+
+@uno_commands.command(name='hand', description='Shows your cards in the game of this channel')
+async def uno_hand(interaction: discord.Interaction):
+    channel_id = interaction.channel_id
+    if channel_id not in game_store and not await load_stored_game(channel_id):
+        await interaction.response.send_message(content='There is no game in this channel.', ephemeral=True)
+        return
+    g, p = get_hand_player(interaction, channel_id)
+    if p is None or g.state != GameState.ONGOING:
+        await interaction.response.send_message(content='You are not playing in this game.', ephemeral=True)
+        return
+    await interaction.response.send_message(**create_hand_message(channel_id, g, p), files=await hand_files(g, p),
+                                            ephemeral=True)
+    game_store[channel_id].hands[p].message = await interaction.original_response()
+
+
+@uno_commands.command(name='abort', description='Aborts the game of this channel')
+async def uno_abort(interaction: discord.Interaction):
+    channel_id = interaction.channel_id
+    if channel_id not in game_store and not await load_stored_game(channel_id):
+        await interaction.response.send_message(content='There is no game in this channel.', ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True, thinking=True)  # the answer comes from the game's actor
+    await submit_interaction(interaction, None, channel_id, Action.ABORT, '')
+
+
+def render_tournament_message(channel_id: int) -> dict | None:
+    if channel_id not in tournaments:
+        return None
+    t, _ = tournaments[channel_id]
+    if not t.started:
+        players_str = '\n'.join(p.nickname for p in t.entrants)
+        return dict(content=f'Initialized a new {t.mode.value} tournament\n{len(t.entrants)} entrants:\n{players_str}'[:2000],
+                    view=build_view(tournament_buttons(channel_id)))
+    finished = sum(table.winner is not None for table in t.tables)
+    return dict(content=f'The tournament is ongoing\nRound {t.round}: {finished}/{len(t.tables)} tables finished',
+                view=View(timeout=None))
+
+
+def reformat_tournament_message(channel_id: int):
+    _, tournament_message = tournaments[channel_id]
+    render_scheduler.schedule(channel_id, tournament_message.id, tournament_message,
+                              lambda: render_tournament_message(channel_id))
+
+
+def schedule_tables(channel_id: int, tables: list[Table]):
+    # threads are opened in the background so that a 500 player round never holds up the event loop
+    t, tournament_message = tournaments[channel_id]
+    asyncio.create_task(table_scheduler.open_tables(
+        tables, lambda table: open_table(tournament_message.channel, channel_id, t, table),
+        lambda table: table_failed(channel_id, t, table)))
+
+
+def table_failed(channel_id: int, t: Tournament, table: Table):
+    # no thread or no game message, the players cannot play the table, so it is forfeited
+    thread_id = next((thread_id for thread_id, (_, _, seated) in table_games.items() if seated is table), None)
+    if thread_id is not None:
+        close_game(game_store[thread_id].message, 'The table could not be started.')
+    elif table.winner is None:
+        finish_table(channel_id, t, table, None, table.players)
+
+
+async def open_table(channel: discord.TextChannel, channel_id: int, t: Tournament, table: Table):
+    thread = await channel.create_thread(name=f'UNO round {table.round} table {table.id}',
+                                         type=discord.ChannelType.public_thread)
+    g = create_table_game(table)
+    g.log = GameLog()
+    game_message = await thread.send(content=f'Table {table.id} is starting',
+                                     view=build_view(table_buttons(thread.id)))
+    entry = game_store.add(thread.id, g, game_message)
+    table_games[thread.id] = channel_id, t, table
+    attach_game(thread.id, entry)
+    entry.hands = {player: HandMessage() for player in g.players}
+    await reaper.admit(thread.id)
+    await g.start_game()
+
+
+def finish_table(channel_id: int, t: Tournament, table: Table, winner: Player | None, seated: list[Player]):
+    tables = t.record_winner(table, winner) if winner is not None else t.record_forfeit(table, seated)
+    if tables is None:
+        reformat_tournament_message(channel_id)
+        return
+    _, tournament_message = tournaments[channel_id]
+    if t.finished:
+        tournaments.pop(channel_id)
+        render_scheduler.schedule(channel_id, tournament_message.id, tournament_message,
+                                  lambda: dict(content=f'The tournament is finished. The champion is {t.champion.nickname}',
+                                               view=View(timeout=None)))
+        return
+    reformat_tournament_message(channel_id)
+    schedule_tables(channel_id, tables)
+
+
+@uno_commands.command(name='tournament', description='Starts a new uno tournament')
+@app_commands.describe(mode='bracket eliminates table losers, swiss plays every round',
+                       table_size='players per table')
+async def uno_tournament(interaction: discord.Interaction, mode: TournamentMode = TournamentMode.BRACKET,
+                         table_size: app_commands.Range[int, 2, 10] = 4):
+    channel_id = interaction.channel_id
+    if channel_id in tournaments:
+        await interaction.response.send_message(content='There is already a tournament in this channel',
+                                                ephemeral=True)
+        return
+    t = Tournament(Player(interaction.user.id, interaction.user.display_name), mode, table_size)
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    tournament_message = await interaction.channel.send(content=f'Initialized a new {mode.value} tournament',
+                                                        view=build_view(tournament_buttons(channel_id)))
+    tournaments[channel_id] = t, tournament_message
+    reformat_tournament_message(channel_id)
+    await interaction.followup.send(content='The tournament is created, waiting for entrants', ephemeral=True)
+
+
+async def restore_games():
+    loop = asyncio.get_running_loop()
+    for channel_id, message_id, g in await loop.run_in_executor(None, snapshot_store.load_all):
+        channel = bot.get_channel(channel_id)
+        if channel is None and shard_count is not None:
+            continue  # the guild belongs to another worker
+        if await load_stored_game(channel_id):
+            continue  # the shared store has a newer copy than the local snapshot
+        try:
+            channel = channel or await bot.fetch_channel(channel_id)
+            game_message = await channel.fetch_message(message_id)
+        except discord.HTTPException as e:
+            print(f'restore_games, cannot reattach game in channel {channel_id}: {e}')
+            snapshot_store.delete(channel_id)
+            continue
+        entry = game_store.add(channel_id, g, game_message)
+        attach_game(channel_id, entry)
+        if g.state == GameState.ONGOING:
+            # ephemeral hand messages do not survive a restart, players reopen them with "View cards"
+            entry.hands = {player: HandMessage() for player in g.players}
+        await reaper.admit(channel_id)
+        await reformat_game_message(channel_id)
+        schedule_ai_turn(channel_id)
+
+
+async def load_stored_game(channel_id: int) -> bool:
+    # the game was started by another process or evicted from the local cache
+    cached = channel_id in game_store
+    if await attach_stored_game(channel_id) is None:
+        return False
+    if not cached:
+        await reaper.admit(channel_id)
+    return True
+
+
+async def attach_stored_game(channel_id: int) -> StoredGame | None:
+    entry = await game_store.load(channel_id)
+    if entry is not None and entry.message is None:
+        channel = bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+        entry.message = channel.get_partial_message(entry.message_id)
+        attach_game(channel_id, entry)
+        if entry.game.state == GameState.ONGOING:
+            entry.hands = {player: HandMessage() for player in entry.game.players}
+    return entry
+
+
+@bot.event
+async def on_ready():
+    global metrics_server, reaper_task
+    if metrics_server is None:
+        port = METRICS_PORT + worker_index() if config.metrics_port is None else config.metrics_port
+        metrics_server = await metrics.serve_prometheus(config.metrics_host, port)
+    if reaper_task is None:
+        reaper_task = asyncio.create_task(reaper.run())
+        if card_images is not None:
+            await card_images.preload()
+    if len(game_store) == 0:
+        await restore_games()
+    if 'ready' not in cold_start:
+        # on_ready comes again after every reconnect, only the first one ends the cold start
+        cold_start['ready'] = time.time() - launched_at()
+        COLD_START_HISTOGRAM.record(int(cold_start['ready'] * 1e9))
+        print('on_ready, cold start ' + ', '.join(f'{phase} {seconds:.3f}s' for phase, seconds in cold_start.items()))
+
+
+@uno_commands.command(name='stats', description='Shows latency statistics of the bot')
+async def uno_stats(interaction: discord.Interaction):
+    # permissions can only be set on the whole /uno group, so this one is checked here
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message(content='Only administrators can see the statistics', ephemeral=True)
+        return
+    await interaction.response.send_message(content=f'```\n{metrics.registry.render_summary()}\n```',
+                                            ephemeral=True)
+
+
+@uno_commands.command(name='leaderboard', description='Shows the best players of this server')
+async def uno_leaderboard(interaction: discord.Interaction):
+    rows = await stats_store.leaderboard(interaction.guild_id)
+    if not rows:
+        await interaction.response.send_message(content='Nobody has finished a game on this server yet',
+                                                ephemeral=True)
+        return
+    lines = [f'{rank}. {row.nickname} – {row.rating:.0f} ({row.wins} wins in {row.games} games)'
+             for rank, row in enumerate(rows, 1)]
+    if all(row.discord_tag != interaction.user.id for row in rows):
+        ranked = await stats_store.player(interaction.guild_id, interaction.user.id)
+        if ranked is not None:
+            rank, row = ranked
+            lines.append(f'…\n{rank}. {row.nickname} – {row.rating:.0f} ({row.wins} wins in {row.games} games)')
+    await interaction.response.send_message(content='\n'.join(lines))
+
+
+@uno_commands.command(name='rules', description='Sets the house rules of games in this channel')
+@app_commands.describe(stack_plus4_on_plus2='a +4 adds to a pending +2 stack',
+                       jump_in='a card identical to the top card may be played out of turn',
+                       seven_zero='a 7 swaps hands with the next player, a 0 passes every hand on',
+                       draw_until_playable='drawing goes on until a playable card comes up',
+                       forced_play='a player holding a playable card may not draw')
+async def uno_rules(interaction: discord.Interaction, stack_plus4_on_plus2: bool | None = None,
+                    jump_in: bool | None = None, seven_zero: bool | None = None,
+                    draw_until_playable: bool | None = None, forced_play: bool | None = None):
+    channel_id = interaction.channel_id
+    rules = channel_rules.get(channel_id, DEFAULT_RULES)
+    changes = dict(stack_plus4_on_plus2=stack_plus4_on_plus2, jump_in=jump_in, seven_zero=seven_zero,
+                   draw_until_playable=draw_until_playable, forced_play=forced_play)
+    if all(enabled is None for enabled in changes.values()):
+        await interaction.response.send_message(content=f'House rules: {describe_rules(rules)}', ephemeral=True)
+        return
+    if not interaction.user.guild_permissions.manage_channels:
+        await interaction.response.send_message(content='Only channel managers can change the house rules',
+                                                ephemeral=True)
+        return
+    for name, enabled in changes.items():
+        if enabled is not None:
+            rules = rules | HouseRule[name.upper()] if enabled else rules & ~HouseRule[name.upper()]
+    channel_rules.update(update_channel_rules(channel_id, rules, config.channel_rules_path))
+    # a game still in the lobby is played by the new rules, a running one keeps the rules it was dealt with
+    entry = game_store.get(channel_id)
+    if entry is not None and entry.game.state in (GameState.INITIALIZED, GameState.READY_TO_START):
+        entry.game.rules = rules
+        await game_store.commit(channel_id)
+        save_game(channel_id)
+        await reformat_game_message(channel_id)
+    await interaction.response.send_message(content=f'House rules: {describe_rules(rules)}', ephemeral=True)
+
+
+tree.add_command(uno_commands)
+
+
+def launched_at() -> float:
+    # a shard supervisor stamps the launch, so the interpreter start is counted as well
+    return float(os.environ.get(LAUNCHED_AT_ENV, STARTED_AT))
+
+
+def open_stores(settings: Config):
+    global config, snapshot_store, game_store, log_archive, channel_rules, stats_store, reaper, ai_runner
+    config = settings
+    snapshot_store = SnapshotStore(config.snapshot_dir)
+    game_store = store_from_env()
+    game_store.on_evicted = evict_game
+    log_archive = LogArchive(config.log_path)
+    channel_rules = load_channel_rules(config.channel_rules_path)
+    stats_store = StatsStore(config.stats_path)
+    ai_runner = AIRunner(config.ai_workers)
+    reaper = Reaper(game_store, reap_game,
+                    submit=lambda channel_id, action: game_actors[channel_id].submit(None, action),
+                    load=attach_stored_game,
+                    archive=SnapshotStore(config.archive_dir))
+
+
+@bot.event
+async def setup_hook():
+    cold_start.setdefault('login', time.time() - launched_at())
+    if await sync_tree(tree, bot.application_id):
+        print('setup_hook, the command tree changed and was synced')
+
+
+def main(argv: list[str] | None = None):
+    cold_start['imports'] = time.time() - launched_at()
+    open_stores(load_config(argv))
+    cold_start['stores'] = time.time() - launched_at()
+    bot.run(token=config.token())
+
+
+if __name__ == '__main__':
+    main()
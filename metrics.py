@@ -0,0 +1,137 @@
+import itertools
+import time
+from collections.abc import Callable
+
+TYPE_CHECKING = False  # type checkers take this as typing.TYPE_CHECKING, without importing typing
+if TYPE_CHECKING:
+    import asyncio
+
+PRECISION_BITS = 5  # values are kept within 1 / 2 ** (PRECISION_BITS - 1) relative error
+SUB_BUCKETS = 1 << PRECISION_BITS
+HALF_SUB_BUCKETS = SUB_BUCKETS >> 1
+MAX_SHIFT = 40
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+SAMPLE_EVERY = 64  # hot paths are timed on one call in SAMPLE_EVERY and recorded with that weight
+
+enabled = True
+# next(sampler) is True once every SAMPLE_EVERY calls, cheap enough to ask on every turn
+sampler = itertools.cycle([False] * (SAMPLE_EVERY - 1) + [True])
+
+
+def bucket_index(value: int) -> int:
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - PRECISION_BITS
+    return SUB_BUCKETS + (shift - 1) * HALF_SUB_BUCKETS + (value >> shift) - HALF_SUB_BUCKETS
+
+
+def bucket_upper_bound(index: int) -> int:
+    if index < SUB_BUCKETS:
+        return index
+    shift = (index - SUB_BUCKETS) // HALF_SUB_BUCKETS + 1
+    top = (index - SUB_BUCKETS) % HALF_SUB_BUCKETS + HALF_SUB_BUCKETS
+    return ((top + 1) << shift) - 1
+
+
+class Histogram:
+    # log-linear buckets over integer nanoseconds, in the spirit of HdrHistogram
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.counts = [0] * (SUB_BUCKETS + MAX_SHIFT * HALF_SUB_BUCKETS)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value: int, weight: int = 1):
+        if value < SUB_BUCKETS:
+            self.counts[value] += weight
+        else:
+            shift = value.bit_length() - PRECISION_BITS
+            if shift > MAX_SHIFT:
+                shift = MAX_SHIFT
+                value = (1 << (MAX_SHIFT + PRECISION_BITS)) - 1
+            self.counts[SUB_BUCKETS + (shift - 1) * HALF_SUB_BUCKETS + (value >> shift) - HALF_SUB_BUCKETS] += weight
+        self.count += weight
+        self.total += value * weight
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> int:
+        if self.count == 0:
+            return 0
+        rank = max(1, int(q * self.count + 0.5))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bucket_upper_bound(index), self.max)
+        return self.max
+
+
+class Registry:
+    def __init__(self):
+        self.histograms: dict[str, Histogram] = {}
+
+    def histogram(self, name: str, help: str = '') -> Histogram:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(name, help)
+        return histogram
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for histogram in self.histograms.values():
+            lines.append(f'# HELP {histogram.name} {histogram.help}')
+            lines.append(f'# TYPE {histogram.name} summary')
+            for q in QUANTILES:
+                lines.append(f'{histogram.name}{{quantile="{q}"}} {histogram.quantile(q) / 1e9:.9f}')
+            lines.append(f'{histogram.name}_sum {histogram.total / 1e9:.9f}')
+            lines.append(f'{histogram.name}_count {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def render_summary(self) -> str:
+        lines = []
+        for histogram in sorted(self.histograms.values(), key=lambda h: h.name):
+            lines.append(f'{histogram.name}: n={histogram.count} p50={histogram.quantile(0.5) / 1e6:.3f}ms '
+                         f'p99={histogram.quantile(0.99) / 1e6:.3f}ms max={histogram.max / 1e6:.3f}ms')
+        return '\n'.join(lines) if lines else 'No metrics recorded yet'
+
+
+registry = Registry()
+
+
+def record_since(histogram: Histogram, start: int, weight: int = 1):
+    if enabled:
+        histogram.record(time.perf_counter_ns() - start, weight)
+
+
+def set_enabled(value: bool):
+    global enabled, sampler
+    enabled = value
+    sampler = itertools.cycle([False] * (SAMPLE_EVERY - 1) + [True]) if value else itertools.repeat(False)
+
+
+async def serve_prometheus(host: str = '127.0.0.1', port: int = 9464,
+                           render: Callable[[], str] = registry.render_prometheus) -> 'asyncio.AbstractServer':
+    import asyncio
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            if request.split(b' ')[1:2] == [b'/metrics']:
+                body = render().encode()
+                status = b'200 OK'
+            else:
+                body = b'not found\n'
+                status = b'404 Not Found'
+            writer.write(b'HTTP/1.1 ' + status + b'\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                         + f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,183 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+from game import *
+from simulation import first_playable_policy
+from snapshot import SnapshotStore
+from store import GameStore, StoredGame
+
+LOBBY_TIMEOUT = 15 * 60.0
+TURN_TIMEOUT = 2 * 60.0
+KICK_AFTER = 3  # missed turns in a row before a player is removed from the game
+MAX_GAMES = 5000
+
+
+class TimerWheel:
+    # hashed timer wheel: scheduling and cancelling are O(1), advancing costs one slot per tick
+    def __init__(self, tick: float = 1.0, slots: int = 512):
+        self.tick = tick
+        self.slots: list[set[Hashable]] = [set() for _ in range(slots)]
+        self.deadlines: dict[Hashable, int] = {}
+        self.current: int | None = None
+
+    def __len__(self) -> int:
+        return len(self.deadlines)
+
+    def schedule(self, key: Hashable, deadline: float):
+        self.cancel(key)
+        at = math.ceil(deadline / self.tick)
+        if self.current is not None and at <= self.current:
+            at = self.current + 1
+        self.deadlines[key] = at
+        self.slots[at % len(self.slots)].add(key)
+
+    def cancel(self, key: Hashable):
+        at = self.deadlines.pop(key, None)
+        if at is not None:
+            self.slots[at % len(self.slots)].discard(key)
+
+    def advance(self, now: float) -> list[Hashable]:
+        target = math.floor(now / self.tick)
+        if self.current is None:
+            self.current = target - 1
+        expired = []
+        if target - self.current >= len(self.slots):
+            # the clock jumped past a full turn of the wheel, every slot is due
+            ticks = range(len(self.slots))
+        else:
+            ticks = range(self.current + 1, target + 1)
+        for tick in ticks:
+            slot = self.slots[tick % len(self.slots)]
+            for key in [key for key in slot if self.deadlines[key] <= target]:
+                slot.remove(key)
+                del self.deadlines[key]
+                expired.append(key)
+        self.current = max(self.current, target)
+        return expired
+
+
+def idle_move(game: Game, player: Player) -> tuple[int | None, Color | None]:
+    # an idle player draws, unless forced play makes them play the first card they can
+    if game.table.forced_play and not game.pickup_stack and game.has_playable(player):
+        return first_playable_policy(game, player, None)
+    return None, None
+
+
+class Reaper:
+    def __init__(self, store: GameStore, close: Callable[[int, str], Awaitable[None]],
+                 submit: Callable[[int, Callable[[], Awaitable[Any]]], Awaitable[Any]] | None = None,
+                 load: Callable[[int], Awaitable[Any]] | None = None,
+                 archive: SnapshotStore | None = None, lobby_timeout: float = LOBBY_TIMEOUT,
+                 turn_timeout: float = TURN_TIMEOUT, kick_after: int = KICK_AFTER, max_games: int = MAX_GAMES,
+                 tick: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        self.store = store
+        self.close = close
+        self.submit = submit if submit is not None else lambda channel_id, action: action()
+        self.load = load  # brings a game evicted from the local cache back from the shared store
+        self.archive = archive
+        self.lobby_timeout = lobby_timeout
+        self.turn_timeout = turn_timeout
+        self.kick_after = kick_after
+        self.max_games = max_games
+        self.clock = clock
+        self.wheel = TimerWheel(tick)
+        self.last_activity: OrderedDict[int, float] = OrderedDict()  # least recently active first
+        self.strikes: dict[int, dict[str, int]] = {}
+        self.expired = 0
+        self.auto_draws = 0
+        self.kicks = 0
+        self.archived = 0
+
+    def __len__(self) -> int:
+        return len(self.last_activity)
+
+    def touch(self, channel_id: int, discord_tag: str | None = None):
+        entry = self.store.games.get(channel_id)
+        if entry is None and channel_id not in self.last_activity:
+            return
+        if discord_tag is not None:
+            strikes = self.strikes.get(channel_id)
+            if strikes:
+                strikes.pop(discord_tag, None)
+        now = self.clock()
+        self.last_activity[channel_id] = now
+        self.last_activity.move_to_end(channel_id)
+        ongoing = entry is None or entry.game.state == GameState.ONGOING  # an evicted game is checked after a turn
+        self.wheel.schedule(channel_id, now + (self.turn_timeout if ongoing else self.lobby_timeout))
+
+    def forget(self, channel_id: int):
+        self.last_activity.pop(channel_id, None)
+        self.strikes.pop(channel_id, None)
+        self.wheel.cancel(channel_id)
+
+    async def admit(self, channel_id: int):
+        self.touch(channel_id)
+        while len(self.last_activity) > self.max_games:
+            oldest = next(iter(self.last_activity))
+            self.forget(oldest)
+            entry = await self.__load__(oldest)
+            if entry is None:
+                continue  # gone from the shared store as well, nothing left to archive
+            if self.archive is not None:
+                self.archive.archive(oldest, entry.message_id, entry.game)
+            self.archived += 1
+            await self.close(oldest, 'The game was archived to make room for new games.')
+
+    async def __load__(self, channel_id: int) -> StoredGame | None:
+        # evicted games stay tracked, so abandoned games in the shared store are reaped too
+        entry = self.store.games.get(channel_id)
+        if entry is None and self.load is not None:
+            try:
+                await self.load(channel_id)
+            except Exception as e:
+                print(f'__load__, cannot load game in channel {channel_id}, deleting it: {e!r}')
+                self.store.delete(channel_id)
+                return None
+            entry = self.store.games.get(channel_id)
+        return entry
+
+    async def reap(self):
+        for channel_id in self.wheel.advance(self.clock()):
+            try:
+                await self.__expire__(channel_id)
+            except Exception as e:
+                # a failed commit or a vanished actor must not end reaping for every other game
+                print(f'reap, cannot expire game in channel {channel_id}: {e!r}')
+                self.touch(channel_id)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.wheel.tick)
+            try:
+                await self.reap()
+            except Exception as e:
+                print(f'run, reaping failed: {e!r}')
+
+    async def __expire__(self, channel_id: int):
+        entry = await self.__load__(channel_id)
+        if entry is None:
+            self.forget(channel_id)
+            return
+        game = entry.game
+        if game.state != GameState.ONGOING:
+            self.forget(channel_id)
+            self.expired += 1
+            await self.close(channel_id, 'The game was closed after being idle.')
+            return
+        player = game.current_player
+        strikes = self.strikes.setdefault(channel_id, {})
+        strikes[player.discord_tag] = strikes.get(player.discord_tag, 0) + 1
+        try:
+            if strikes[player.discord_tag] >= self.kick_after:
+                del strikes[player.discord_tag]
+                self.kicks += 1
+                await self.submit(channel_id, lambda: game.kick_player(player))
+            else:
+                self.auto_draws += 1
+                await self.submit(channel_id, lambda: game.process_turn(player.discord_tag, *idle_move(game, player)))
+        finally:
+            # the next player gets a full turn, without clearing anyone's strikes; a failed move is retried then
+            self.touch(channel_id)
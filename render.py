@@ -0,0 +1,129 @@
+import asyncio
+import inspect
+import time
+from typing import Any, Awaitable, Callable, Hashable
+
+import metrics
+
+EDIT_HISTOGRAM = metrics.registry.histogram('uno_message_edit_seconds', 'Latency of a single Message.edit')
+RATE_LIMIT_HISTOGRAM = metrics.registry.histogram('uno_rate_limit_wait_seconds',
+                                                  'Time an edit waited for its rate limit bucket')
+
+Render = Callable[[], dict[str, Any] | None | Awaitable[dict[str, Any] | None]]
+
+
+class TokenBucket:
+    def __init__(self, capacity: int, per: float):
+        self.capacity = capacity
+        self.per = per
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def __refill__(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / self.per)
+        self.updated = now
+
+    async def acquire(self):
+        self.__refill__()
+        while self.tokens < 1:
+            await asyncio.sleep((1 - self.tokens) * self.per / self.capacity)
+            self.__refill__()
+        self.tokens -= 1
+
+
+class ChannelRenderer:
+    def __init__(self, scheduler: 'RenderScheduler', channel_id: int):
+        self.scheduler = scheduler
+        self.channel_id = channel_id
+        self.pending: dict[Hashable, tuple[Any, Render, Hashable]] = {}
+        self.waiters: list[asyncio.Future] = []
+        self.task: asyncio.Task | None = None
+
+    def schedule(self, target: Hashable, message, render: Render, bucket: Hashable) -> asyncio.Future:
+        self.pending[target] = (message, render, bucket)
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        if self.task is None:
+            self.task = asyncio.create_task(self.__run__())
+        return waiter
+
+    async def __run__(self):
+        try:
+            while self.pending:
+                await asyncio.sleep(self.scheduler.delay)
+                pending, self.pending = self.pending, {}
+                waiters, self.waiters = self.waiters, []
+                results = await asyncio.gather(
+                    *(self.__edit__(message, render, bucket) for message, render, bucket in pending.values()),
+                    return_exceptions=True)
+                for result in results:
+                    if isinstance(result, Exception):
+                        print(f'render, channel {self.channel_id}: {result!r}')
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+        finally:
+            self.task = None
+            if self.scheduler.channels.get(self.channel_id) is self:
+                del self.scheduler.channels[self.channel_id]
+
+    async def __edit__(self, message, render: Render, bucket: Hashable):
+        start = time.perf_counter_ns()
+        await self.scheduler.bucket(bucket).acquire()
+        metrics.record_since(RATE_LIMIT_HISTOGRAM, start)
+        kwargs = render()
+        if inspect.isawaitable(kwargs):
+            kwargs = await kwargs  # images are drawn off the event loop, only once the edit is due
+        if kwargs is None:
+            return
+        self.scheduler.edits_sent += 1
+        start = time.perf_counter_ns()
+        await message.edit(**kwargs)
+        metrics.record_since(EDIT_HISTOGRAM, start)
+
+
+class RenderScheduler:
+    def __init__(self, delay: float = 0.02, rate: int = 5, per: float = 5.0):
+        self.delay = delay
+        self.rate = rate
+        self.per = per
+        self.edits_sent = 0
+        self.channels: dict[int, ChannelRenderer] = {}
+        self.buckets: dict[Hashable, TokenBucket] = {}
+
+    def bucket(self, key: Hashable) -> TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.rate, self.per)
+        return bucket
+
+    def schedule(self, channel_id: int, target: Hashable, message, render: Render,
+                 bucket: Hashable | None = None) -> asyncio.Future:
+        renderer = self.channels.get(channel_id)
+        if renderer is None:
+            renderer = self.channels[channel_id] = ChannelRenderer(self, channel_id)
+        return renderer.schedule(target, message, render, channel_id if bucket is None else bucket)
+
+    def forget(self, channel_id: int, *buckets: Hashable, after: asyncio.Future | None = None):
+        # an edit still queued would create the bucket again, so buckets are only dropped once the edits
+        # scheduled up to `after` are sent and the bucket has refilled: a full bucket is what a new one would be,
+        # dropping it neither leaks nor resets the rate limit of the next game in the channel
+        if after is not None and not after.done():
+            after.add_done_callback(lambda _: self.forget(channel_id, *buckets))
+            return
+        asyncio.get_running_loop().call_later(self.per, self.__drop__, (channel_id, *buckets))
+
+    def __drop__(self, keys: tuple[Hashable, ...]):
+        busy = []
+        for key in keys:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                continue
+            bucket.__refill__()
+            if bucket.tokens < bucket.capacity:
+                busy.append(key)
+            else:
+                del self.buckets[key]
+        if busy:
+            asyncio.get_running_loop().call_later(self.per, self.__drop__, tuple(busy))
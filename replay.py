@@ -0,0 +1,280 @@
+import mmap
+import os
+import struct
+import time
+from collections.abc import Callable, Iterator
+
+from game import *
+from gamelog import LENGTH, MAGIC, NO_SEAT, RULES, SEAT, SHUFFLE, START, TAG, TURN, Record
+
+DECK_CODES = new_deck()  # the deck template is ordered by card id
+CHUNK_GAMES = 20_000
+
+
+class LogReader:
+    def __init__(self, data: memoryview):
+        self.data = data
+        self.offset = 0
+
+    def header(self) -> tuple[int | None, list[int]]:
+        magic, seed, player_count = START.unpack_from(self.data)
+        if magic != MAGIC:
+            raise RuntimeError(f'header, unknown log format {bytes(magic)!r}')
+        self.offset = START.size
+        tags = []
+        for _ in range(player_count):
+            (discord_tag,) = TAG.unpack_from(self.data, self.offset)
+            self.offset += TAG.size
+            tags.append(discord_tag)
+        return None if seed < 0 else seed, tags
+
+    def rules(self) -> HouseRule:
+        if self.peek() != Record.RULES:
+            return DEFAULT_RULES
+        _, rules = RULES.unpack_from(self.data, self.offset)
+        self.offset += RULES.size
+        return HouseRule(rules)
+
+    def peek(self) -> Record | None:
+        return Record(self.data[self.offset]) if self.offset < len(self.data) else None
+
+    def turn(self) -> tuple[int, int | None, Color | None]:
+        _, seat, card_id, wild_color = TURN.unpack_from(self.data, self.offset)
+        self.offset += TURN.size
+        return seat, None if card_id < 0 else card_id, None if wild_color == 0 else Color(wild_color)
+
+    def seat(self) -> int:
+        _, seat = SEAT.unpack_from(self.data, self.offset)
+        self.offset += SEAT.size
+        return seat
+
+    def shuffle(self) -> array:
+        record, length = SHUFFLE.unpack_from(self.data, self.offset)
+        if record != Record.SHUFFLE:
+            raise RuntimeError(f'shuffle, the replay diverged at offset {self.offset}, found {Record(record).name}')
+        self.offset += SHUFFLE.size
+        pile = array(CARD_TYPECODE, [DECK_CODES[card_id] for card_id in self.data[self.offset:self.offset + length]])
+        self.offset += length
+        return pile
+
+
+class ReplayRandom(random.Random):
+    # hands the game the recorded order instead of shuffling
+    def __init__(self, reader: LogReader):
+        super().__init__(0)
+        self.reader = reader
+
+    def shuffle(self, pile):
+        recorded = self.reader.shuffle()
+        if len(recorded) != len(pile):
+            raise RuntimeError(f'shuffle, the replay diverged, expected {len(pile)} cards, got {len(recorded)}')
+        pile[:] = recorded
+
+
+class ReplayResult:
+    game: Game
+    players: list[Player]
+    winner: Player | None
+    turns: int
+    rejected: int
+    played_kinds: dict[Player, int]  # bit k is set when the player played a card of CardKind k
+
+    def __init__(self, game: Game, players: list[Player]):
+        self.game = game
+        self.players = players
+        self.winner = None
+        self.turns = 0
+        self.rejected = 0
+        self.played_kinds = {player: 0 for player in players}
+
+
+def replay_game(data: memoryview, trace: Callable[[str], None] | None = None) -> ReplayResult:
+    reader = LogReader(data)
+    _, tags = reader.header()
+    players = [Player(discord_tag, f'player{seat}') for seat, discord_tag in enumerate(tags)]
+    game = Game(players[0], rng=ReplayRandom(reader), rules=reader.rules())
+    game.players = list(players)
+    game.state = GameState.READY_TO_START
+    game.deal()
+    result = ReplayResult(game, players)
+    while (record := reader.peek()) is not None:
+        if record == Record.TURN:
+            seat, card_id, wild_color = reader.turn()
+            player = game.players[seat]
+            card = None if card_id is None else game.playersToCards[player].get(card_id)
+            if trace is not None:
+                trace(f'{player.nickname}: {"draw" if card_id is None else card_label(card or 0)}'
+                      f'{"" if wild_color is None else f" ({wild_color})"}')
+            try:
+                winner = game.apply_turn(player.discord_tag, card_id, wild_color)
+            except RuntimeError as e:
+                result.rejected += 1
+                if trace is not None:
+                    trace(f'  rejected: {e!r}')
+                continue
+            result.turns += 1
+            if card is not None:
+                result.played_kinds[player] |= 1 << (card & KIND_MASK)
+            if winner is not None:
+                result.winner = winner
+        elif record == Record.KICK:
+            player = game.players[reader.seat()]
+            if trace is not None:
+                trace(f'{player.nickname} is kicked')
+            result.winner = game.apply_kick(player) or result.winner
+        elif record == Record.END:
+            seat = reader.seat()
+            if result.winner is None or seat == NO_SEAT or game.players[seat] is not result.winner:
+                raise RuntimeError(f'replay_game, the replay diverged, the log ends with seat {seat} winning')
+        else:
+            raise RuntimeError(f'replay_game, the replay diverged, unexpected {record.name}')
+    return result
+
+
+class ReplayStats:
+    def __init__(self):
+        self.games = 0
+        self.finished = 0
+        self.turns = 0
+        self.rejected = 0
+        self.broken = 0  # games whose log diverged or was cut short
+        self.first_player_wins = 0
+        self.expected_first_player_wins = 0.0
+        self.kind_games = [0] * len(CardKind)  # player-games in which the kind was played
+        self.kind_wins = [0] * len(CardKind)
+        self.player_games = 0
+        self.elapsed = 0.0
+
+    def add(self, result: ReplayResult):
+        self.games += 1
+        self.turns += result.turns
+        self.rejected += result.rejected
+        self.player_games += len(result.players)
+        for player, kinds in result.played_kinds.items():
+            for kind in CardKind:
+                if kinds >> kind & 1:
+                    self.kind_games[kind] += 1
+                    self.kind_wins[kind] += player is result.winner
+        if result.winner is not None:
+            self.finished += 1
+            self.first_player_wins += result.winner is result.players[0]
+            self.expected_first_player_wins += 1 / len(result.players)
+
+    def merge(self, other: 'ReplayStats'):
+        for name, value in vars(other).items():
+            if isinstance(value, list):
+                for i, v in enumerate(value):
+                    getattr(self, name)[i] += v
+            elif name != 'elapsed':
+                setattr(self, name, getattr(self, name) + value)
+
+    def report(self) -> str:
+        lines = [f'{self.games} games ({self.finished} finished), {self.turns} turns, {self.rejected} rejected turns',
+                 f'average game length: {self.turns / max(self.games, 1):.1f} turns']
+        if self.broken:
+            lines.append(f'{self.broken} games could not be replayed')
+        if self.finished:
+            lines.append(f'first player won {self.first_player_wins / self.finished:.1%} of finished games, '
+                         f'{self.expected_first_player_wins / self.finished:.1%} expected without an advantage')
+        base = self.finished / max(self.player_games, 1)
+        for kind in CardKind:
+            if self.kind_games[kind]:
+                rate = self.kind_wins[kind] / self.kind_games[kind]
+                lines.append(f'played {kind.name.lower()}: won {rate:.1%} ({rate - base:+.1%} against the base rate)')
+        if self.elapsed:
+            lines.append(f'{self.games / self.elapsed:,.0f} games/sec, {self.turns / self.elapsed:,.0f} turns/sec')
+        return '\n'.join(lines)
+
+
+def iter_games(data: memoryview, start: int = 0, end: int | None = None) -> Iterator[memoryview]:
+    offset = start
+    end = len(data) if end is None else end
+    while offset < end:
+        (length,) = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+        yield data[offset:offset + length]
+        offset += length
+
+
+def chunk_offsets(path: str, games_per_chunk: int = CHUNK_GAMES) -> list[tuple[int, int]]:
+    # only the length prefixes are read, the chunks are then replayed by separate workers
+    chunks = []
+    with open(path, 'rb') as archive, mmap.mmap(archive.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        start = offset = games = 0
+        while offset < len(data):
+            (length,) = LENGTH.unpack_from(data, offset)
+            offset += LENGTH.size + length
+            games += 1
+            if games == games_per_chunk:
+                chunks.append((start, offset))
+                start, games = offset, 0
+        if offset > start:
+            chunks.append((start, offset))
+    return chunks
+
+
+def analyse_chunk(path: str, start: int, end: int) -> ReplayStats:
+    stats = ReplayStats()
+    with open(path, 'rb') as archive, mmap.mmap(archive.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        data = memoryview(mapped)
+        try:
+            for game in iter_games(data, start, end):
+                # one bad log is counted and skipped, the rest of the archive is still worth reading
+                try:
+                    stats.add(replay_game(game))
+                except (RuntimeError, ValueError, struct.error):
+                    stats.broken += 1
+                finally:
+                    game.release()
+        finally:
+            data.release()
+    return stats
+
+
+def analyse(paths: list[str], workers: int = 1) -> ReplayStats:
+    total = ReplayStats()
+    start = time.perf_counter()
+    jobs = [(path, chunk_start, chunk_end) for path in paths if os.path.getsize(path)
+            for chunk_start, chunk_end in chunk_offsets(path)]
+    if workers <= 1:
+        for job in jobs:
+            total.merge(analyse_chunk(*job))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for stats in pool.map(analyse_chunk, *zip(*jobs)):
+                total.merge(stats)
+    total.elapsed = time.perf_counter() - start
+    return total
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Replays game logs without Discord and reports statistics')
+    parser.add_argument('archives', nargs='+')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--trace', type=int, help='prints every action of the game with this index in the first archive')
+    args = parser.parse_args()
+
+    if args.trace is not None:
+        selected = None
+        with open(args.archives[0], 'rb') as archive, mmap.mmap(archive.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            view = memoryview(data)
+            for index, game in enumerate(iter_games(view)):
+                if index == args.trace:
+                    selected = bytes(game)
+                game.release()
+                if selected is not None:
+                    break
+            view.release()
+        if selected is None:
+            print(f'{args.archives[0]} has no game {args.trace}')
+            return
+        result = replay_game(memoryview(selected), print)
+        print(f'winner: {"none" if result.winner is None else result.winner.nickname}')
+        return
+    print(analyse(args.archives, args.workers).report())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Awaitable, Callable
+
+from game import *
+
+PREFIX = 'uno'
+HAND_PAGE_SIZE = 20  # four rows of cards, the fifth row holds the paging and draw buttons
+
+
+class Action(Enum):
+    JOIN = 'join'
+    LEAVE = 'leave'
+    ABORT = 'abort'
+    START = 'start'
+    HAND = 'hand'
+    PLAY = 'play'
+    WILD = 'wild'
+    COLOR = 'color'
+    BACK = 'back'
+    DRAW = 'draw'
+    PAGE = 'page'
+    ADD_BOT = 'bot'
+    SPECTATE = 'watch'
+    REVEAL = 'reveal'
+    TOURNAMENT_JOIN = 'tjoin'
+    TOURNAMENT_LEAVE = 'tleave'
+    TOURNAMENT_START = 'tstart'
+
+
+TOURNAMENT_ACTIONS = frozenset((Action.TOURNAMENT_JOIN, Action.TOURNAMENT_LEAVE, Action.TOURNAMENT_START))
+
+
+ButtonSpec = tuple[str, str, bool]  # label, custom id, disabled
+Reply = Callable[[], Awaitable[Any]]  # answers the click once the action has left the game's actor
+Handler = Callable[[Any, int, str], Awaitable[Reply | None]]  # interaction, channel id, argument
+
+
+def encode_custom_id(channel_id: int, action: Action, arg: str | int = '') -> str:
+    return f'{PREFIX}:{channel_id}:{action.value}:{arg}'
+
+
+def decode_custom_id(custom_id: str) -> tuple[int, Action, str] | None:
+    parts = custom_id.split(':', 3)
+    if len(parts) != 4 or parts[0] != PREFIX:
+        return None
+    try:
+        return int(parts[1]), Action(parts[2]), parts[3]
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def lobby_buttons(channel_id: int, start_active: bool) -> tuple[ButtonSpec, ...]:
+    return (('Join game', encode_custom_id(channel_id, Action.JOIN), False),
+            ('Leave game', encode_custom_id(channel_id, Action.LEAVE), False),
+            ('Abort game', encode_custom_id(channel_id, Action.ABORT), False),
+            ('Start game', encode_custom_id(channel_id, Action.START), not start_active),
+            ('Add bot', encode_custom_id(channel_id, Action.ADD_BOT), False))
+
+
+@lru_cache(maxsize=4096)
+def tournament_buttons(channel_id: int) -> tuple[ButtonSpec, ...]:
+    return (('Join tournament', encode_custom_id(channel_id, Action.TOURNAMENT_JOIN), False),
+            ('Leave tournament', encode_custom_id(channel_id, Action.TOURNAMENT_LEAVE), False),
+            ('Start tournament', encode_custom_id(channel_id, Action.TOURNAMENT_START), False))
+
+
+@lru_cache(maxsize=4096)
+def in_game_buttons(channel_id: int) -> tuple[ButtonSpec, ...]:
+    return (('View cards', encode_custom_id(channel_id, Action.HAND), False),
+            ('Abort game', encode_custom_id(channel_id, Action.ABORT), False),
+            ('Watch', encode_custom_id(channel_id, Action.SPECTATE), False))
+
+
+@lru_cache(maxsize=4096)
+def table_buttons(channel_id: int) -> tuple[ButtonSpec, ...]:
+    # a tournament table cannot be aborted, the round waits for it
+    return (('View cards', encode_custom_id(channel_id, Action.HAND), False),
+            ('Watch', encode_custom_id(channel_id, Action.SPECTATE), False))
+
+
+@lru_cache(maxsize=4096)
+def spectator_buttons(channel_id: int, reveal_hands: bool) -> tuple[ButtonSpec, ...]:
+    return (('Watch / stop watching', encode_custom_id(channel_id, Action.SPECTATE), False),
+            ('Hide hands after the game' if reveal_hands else 'Reveal hands after the game',
+             encode_custom_id(channel_id, Action.REVEAL), False))
+
+
+def hand_page(channel_id: int, game: Game, player: Player, page: int) -> tuple[list[ButtonSpec], int, int]:
+    # one button per distinct face, playable faces first; only the requested page is turned into buttons,
+    # so the cost depends on the page size and the number of distinct faces, never on the hand size
+    is_current = game.current_player.discord_tag == player.discord_tag
+    # with jump-in, the other players may play a copy of the top card out of turn
+    mask = game.playable_mask if is_current else game.jump_in_mask()
+    faces = game.playersToCards[player].faces
+    playable = sorted(face for face in faces if mask >> face & 1)
+    ordered = playable + sorted(face for face in faces if not mask >> face & 1)
+    page_count = max(1, -(-len(ordered) // HAND_PAGE_SIZE))
+    page = min(max(page, 0), page_count - 1)
+
+    prefix = f'{PREFIX}:{channel_id}:'
+    play = prefix + Action.PLAY.value + ':'
+    wild = prefix + Action.WILD.value + ':'
+    buttons = []
+    for face in ordered[page * HAND_PAGE_SIZE:(page + 1) * HAND_PAGE_SIZE]:
+        group = faces[face]
+        label = CARD_LABELS[face] if len(group) == 1 else f'{CARD_LABELS[face]} ×{len(group)}'
+        buttons.append((label, (wild if is_wild(face) else play) + str(group[0] >> ID_SHIFT),
+                        not mask >> face & 1))
+    if page_count > 1:
+        buttons.append(('◀', encode_custom_id(channel_id, Action.PAGE, page - 1), page == 0))
+    # with forced play a player holding a playable card may only draw what is stacked on them
+    forced = game.table.forced_play and not game.pickup_stack and is_current and game.has_playable(player)
+    buttons.append(('Draw a card', prefix + Action.DRAW.value + ':', not is_current or forced))
+    if page_count > 1:
+        buttons.append(('▶', encode_custom_id(channel_id, Action.PAGE, page + 1), page == page_count - 1))
+    return buttons, page, page_count
+
+
+@lru_cache(maxsize=4096)
+def color_buttons(channel_id: int, card_id: int) -> tuple[ButtonSpec, ...]:
+    return tuple((str(color), encode_custom_id(channel_id, Action.COLOR, f'{card_id}.{color.value}'), False)
+                 for color in Color) + (('Back', encode_custom_id(channel_id, Action.BACK), False),)
+
+
+def build_view(buttons):
+    from discord.ui import Button, View
+
+    v = View(timeout=None)
+    for label, custom_id, disabled in buttons:
+        v.add_item(Button(label=label, custom_id=custom_id, disabled=disabled))
+    return v
+
+
+class Router:
+    def __init__(self):
+        self.handlers: dict[Action, Handler] = {}
+
+    def route(self, action: Action) -> Callable[[Handler], Handler]:
+        def register(handler: Handler) -> Handler:
+            self.handlers[action] = handler
+            return handler
+
+        return register
+
+    async def dispatch(self, interaction, channel_id: int, action: Action, arg: str) -> Reply | None:
+        return await self.handlers[action](interaction, channel_id, arg)
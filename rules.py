@@ -0,0 +1,120 @@
+import os
+from enum import IntFlag
+from functools import lru_cache
+
+from card import *
+
+PENDING_SHIFT = ID_SHIFT + 3  # index bits: | pending stack (1) | current color (3) | current face (10) |
+TABLE_SIZE = 1 << (PENDING_SHIFT + 1)
+CHANNEL_RULES_PATH = 'channel_rules.json'
+
+
+class HouseRule(IntFlag):
+    STACK_PLUS4_ON_PLUS2 = 1  # a +4 adds to a pending +2 stack instead of being played after drawing it
+    JUMP_IN = 2  # a card identical to the top card may be played out of turn
+    SEVEN_ZERO = 4  # a 7 swaps hands with the next player, a 0 passes every hand on in the direction of play
+    DRAW_UNTIL_PLAYABLE = 8  # drawing goes on until a playable card comes up, which may then be played
+    FORCED_PLAY = 16  # a player holding a playable card may not draw
+
+
+DEFAULT_RULES = HouseRule.STACK_PLUS4_ON_PLUS2  # the rules games were always played by
+RULE_NAMES = {rule: rule.name.lower() for rule in HouseRule}
+
+
+def rule_index(card: int, color: Color | None, pickup_stack: int) -> int:
+    return (card & FACE_MASK | (0 if color is None else color.value) << ID_SHIFT
+            | (pickup_stack != 0) << PENDING_SHIFT)
+
+
+class RuleTable:
+    # every decision that depends on the top card is answered by one lookup of a face bitmask
+    rules: HouseRule
+    playable: list[int]  # rule index -> faces that may be played
+    stacking: list[int]  # rule index -> faces that add to the pickup stack instead of drawing it first
+    jump_in: list[int]  # top face -> faces that may be played out of turn
+
+    def __init__(self, rules: HouseRule):
+        self.rules = rules
+        # plain booleans, testing an IntFlag on every turn costs more than the rest of the lookup
+        self.seven_zero = bool(rules & HouseRule.SEVEN_ZERO)
+        self.draw_until_playable = bool(rules & HouseRule.DRAW_UNTIL_PLAYABLE)
+        self.forced_play = bool(rules & HouseRule.FORCED_PLAY)
+        self.playable = [0] * TABLE_SIZE
+        self.stacking = [0] * TABLE_SIZE
+        self.jump_in = [0] * (FACE_MASK + 1)
+        faces = [face for face, label in enumerate(CARD_LABELS) if label is not None]
+        for top in faces:
+            top_kind = top & KIND_MASK
+            for color_value in range(len(Color) + 1):
+                if top_kind < CardKind.WILD and color_value != (top & COLOR_MASK) >> COLOR_SHIFT:
+                    continue  # only wild cards take a color other than their own
+                for pending in (0, 1):
+                    index = top | color_value << ID_SHIFT | pending << PENDING_SHIFT
+                    playable = stacking = 0
+                    for face in faces:
+                        kind = face & KIND_MASK
+                        if (kind >= CardKind.WILD
+                                or (face & COLOR_MASK) >> COLOR_SHIFT == color_value
+                                or (face ^ top) & (KIND_MASK | NUMBER_MASK) == 0):
+                            playable |= 1 << face
+                            if kind == CardKind.PLUS or (kind == CardKind.WILD_PLUS and (
+                                    not pending or top_kind != CardKind.PLUS
+                                    or rules & HouseRule.STACK_PLUS4_ON_PLUS2)):
+                                stacking |= 1 << face
+                    self.playable[index] = playable
+                    self.stacking[index] = stacking
+            if rules & HouseRule.JUMP_IN and top_kind < CardKind.WILD:
+                self.jump_in[top] = 1 << top
+
+
+@lru_cache(maxsize=None)
+def compile_rules(rules: HouseRule) -> RuleTable:
+    return RuleTable(rules)
+
+
+def parse_rules(names: list[str]) -> HouseRule:
+    rules = HouseRule(0)
+    for name in names:
+        try:
+            rules |= HouseRule[name.upper()]
+        except KeyError:
+            raise RuntimeError(f'parse_rules, unknown house rule {name}')
+    return rules
+
+
+def describe_rules(rules: HouseRule) -> str:
+    return ', '.join(RULE_NAMES[rule] for rule in HouseRule if rules & rule) or 'no house rules'
+
+
+def load_channel_rules(path: str = CHANNEL_RULES_PATH) -> dict[int, HouseRule]:
+    import json  # only the bot keeps channel rules, the engine does without the json and re modules
+    try:
+        with open(path) as f:
+            return {int(channel_id): parse_rules(names) for channel_id, names in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+
+
+def save_channel_rules(channel_rules: dict[int, HouseRule], path: str = CHANNEL_RULES_PATH):
+    import json
+    data = {str(channel_id): [RULE_NAMES[rule] for rule in HouseRule if rules & rule]
+            for channel_id, rules in channel_rules.items()}
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(path + '.tmp', path)
+
+
+def update_channel_rules(channel_id: int, rules: HouseRule, path: str = CHANNEL_RULES_PATH) -> dict[int, HouseRule]:
+    # every shard worker saves to the same file: it is reloaded under a lock and only this channel is changed,
+    # so the rules other workers saved since this one started are kept
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None  # no file locks on windows, where the bot runs as a single process anyway
+    with open(path + '.lock', 'w') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        channel_rules = load_channel_rules(path)
+        channel_rules[channel_id] = rules
+        save_channel_rules(channel_rules, path)
+    return channel_rules
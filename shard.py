@@ -0,0 +1,120 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+SHARD_IDS_ENV = 'UNO_SHARD_IDS'
+SHARD_COUNT_ENV = 'UNO_SHARD_COUNT'
+WORKER_ENV = 'UNO_WORKER'
+LAUNCHED_AT_ENV = 'UNO_LAUNCHED_AT'
+
+
+def shard_for_guild(guild_id: int, shard_count: int) -> int:
+    return (guild_id >> 22) % shard_count
+
+
+def assign_shards(shard_count: int, workers: int) -> list[list[int]]:
+    if workers < 1 or shard_count < workers:
+        raise RuntimeError(f'assign_shards, cannot spread {shard_count} shards over {workers} workers')
+    return [list(range(worker, shard_count, workers)) for worker in range(workers)]
+
+
+def shards_from_env() -> tuple[list[int] | None, int | None]:
+    if SHARD_COUNT_ENV not in os.environ:
+        return None, None
+    shard_ids = [int(shard_id) for shard_id in os.environ[SHARD_IDS_ENV].split(',')]
+    return shard_ids, int(os.environ[SHARD_COUNT_ENV])
+
+
+def worker_index() -> int:
+    return int(os.environ.get(WORKER_ENV, 0))
+
+
+class Worker:
+    def __init__(self, index: int, shard_ids: list[int], shard_count: int, command: list[str]):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.command = command
+        self.process: subprocess.Popen | None = None
+        self.restarts = 0
+        self.started_at = 0.0
+
+    def start(self):
+        env = dict(os.environ)
+        env[SHARD_IDS_ENV] = ','.join(map(str, self.shard_ids))
+        env[SHARD_COUNT_ENV] = str(self.shard_count)
+        env[WORKER_ENV] = str(self.index)
+        env[LAUNCHED_AT_ENV] = repr(time.time())
+        self.process = subprocess.Popen(self.command, env=env)
+        self.started_at = time.monotonic()
+
+
+class Supervisor:
+    def __init__(self, command: list[str], workers: int, shard_count: int, restart: bool = True,
+                 max_backoff: float = 60.0):
+        self.restart = restart
+        self.max_backoff = max_backoff
+        self.workers = [Worker(index, shard_ids, shard_count, command)
+                        for index, shard_ids in enumerate(assign_shards(shard_count, workers))]
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def poll(self) -> bool:
+        running = False
+        for worker in self.workers:
+            code = worker.process.poll()
+            if code is None:
+                running = True
+                continue
+            if not self.restart or code == 0:
+                continue
+            # a worker that crashed right after starting is restarted with exponential backoff
+            if time.monotonic() - worker.started_at > self.max_backoff:
+                worker.restarts = 0
+            delay = min(self.max_backoff, 2 ** worker.restarts - 1)
+            if time.monotonic() - worker.started_at < delay:
+                running = True
+                continue
+            print(f'supervisor, worker {worker.index} (shards {worker.shard_ids}) exited with {code}, restarting')
+            worker.restarts += 1
+            worker.start()
+            running = True
+        return running
+
+    def wait(self, interval: float = 0.5):
+        try:
+            while self.poll():
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def stop(self, timeout: float = 10.0):
+        for worker in self.workers:
+            if worker.process is not None and worker.process.poll() is None:
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process is not None:
+                try:
+                    worker.process.wait(timeout)
+                except subprocess.TimeoutExpired:
+                    worker.process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs the bot as several sharded worker processes')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--shards', type=int, default=None, help='total shard count, defaults to the worker count')
+    parser.add_argument('command', nargs='*', default=[sys.executable, 'main.py'])
+    args = parser.parse_args()
+
+    supervisor = Supervisor(args.command, args.workers, args.shards or args.workers)
+    supervisor.start()
+    supervisor.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+import random
+import time
+from collections import Counter
+from collections.abc import Callable
+
+from game import *
+from gamelog import LENGTH
+from rules import RULE_NAMES, parse_rules
+
+Policy = Callable[[Game, Player, random.Random], tuple[int | None, Color | None]]
+
+
+def pick_wild_color(game: Game, player: Player) -> Color:
+    colors = Counter(card & COLOR_MASK for card in game.playersToCards[player] if not is_wild(card))
+    if not colors:
+        return Color.RED
+    return Color(colors.most_common(1)[0][0] >> COLOR_SHIFT)
+
+
+def draw_policy(game: Game, player: Player, rng: random.Random) -> tuple[int | None, Color | None]:
+    return None, None
+
+
+def first_playable_policy(game: Game, player: Player, rng: random.Random) -> tuple[int | None, Color | None]:
+    for card in game.playersToCards[player]:
+        if game.is_playable(card):
+            if is_wild(card):
+                return card_id(card), pick_wild_color(game, player)
+            return card_id(card), None
+    return None, None
+
+
+def random_policy(game: Game, player: Player, rng: random.Random) -> tuple[int | None, Color | None]:
+    playable = [card for card in game.playersToCards[player] if game.is_playable(card)]
+    if not playable:
+        return None, None
+    card = rng.choice(playable)
+    if is_wild(card):
+        return card_id(card), Color(rng.randint(1, 4))
+    return card_id(card), None
+
+
+def greedy_policy(game: Game, player: Player, rng: random.Random) -> tuple[int | None, Color | None]:
+    # keeps wild cards for last, follows the colour it holds most of and attacks an opponent close to winning
+    playable = game.playable_cards(player)
+    if not playable:
+        return None, None
+    hand = game.playersToCards[player]
+    next_player = game.players[(game.current_seat + game.is_reversed) % len(game.players)]
+    threatened = len(game.playersToCards[next_player]) <= 2
+
+    def score(card: int) -> int:
+        kind = card & KIND_MASK
+        if kind >= CardKind.WILD:
+            return (40 if threatened and kind == CardKind.WILD_PLUS else 0) - 100
+        value = hand.color_counts[(card & COLOR_MASK) >> COLOR_SHIFT] * 4
+        if kind == CardKind.NUMBER:
+            return value + ((card & NUMBER_MASK) >> NUMBER_SHIFT) // 3
+        return value + (30 if threatened else 3)
+
+    card = max(playable, key=score)
+    if is_wild(card):
+        return card_id(card), pick_wild_color(game, player)
+    return card_id(card), None
+
+
+POLICIES: dict[str, Policy] = {
+    'draw': draw_policy,
+    'first': first_playable_policy,
+    'random': random_policy,
+    'greedy': greedy_policy,
+}
+
+
+class GameResult:
+    seed: int
+    winner_seat: int | None
+    turns: int
+    log: GameLog | None
+
+    def __init__(self, seed: int, winner_seat: int | None, turns: int, log: GameLog | None = None):
+        self.seed = seed
+        self.winner_seat = winner_seat
+        self.turns = turns
+        self.log = log
+
+
+class BatchResult:
+    games: int
+    finished: int
+    turns: int
+    elapsed: float
+    wins: list[int]
+    logs: bytearray
+
+    def __init__(self, player_count: int):
+        self.games = 0
+        self.finished = 0
+        self.turns = 0
+        self.elapsed = 0.0
+        self.wins = [0] * player_count
+        self.logs = bytearray()
+
+    def add(self, result: GameResult):
+        if result.log is not None:
+            self.logs += LENGTH.pack(len(result.log.data)) + result.log.data
+        self.games += 1
+        self.turns += result.turns
+        if result.winner_seat is not None:
+            self.finished += 1
+            self.wins[result.winner_seat] += 1
+
+    def merge(self, other: 'BatchResult'):
+        self.games += other.games
+        self.finished += other.finished
+        self.turns += other.turns
+        for seat, wins in enumerate(other.wins):
+            self.wins[seat] += wins
+
+    @property
+    def games_per_second(self) -> float:
+        return self.games / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def turns_per_second(self) -> float:
+        return self.turns / self.elapsed if self.elapsed else 0.0
+
+
+class CorruptedGame(Exception):
+    # not a RuntimeError, those are rejected moves and callers count them as such
+    pass
+
+
+def check_consistency(game: Game):
+    for player, hand in game.playersToCards.items():
+        if len(hand.slots) != len(hand.cards) or any(
+                hand.cards[slot] >> ID_SHIFT != card_id for card_id, slot in hand.slots.items()):
+            raise CorruptedGame(f'check_consistency, hand index of {player.nickname} is corrupted')
+        if sum(hand.kind_counts) != len(hand.cards):
+            raise CorruptedGame(f'check_consistency, hand counts of {player.nickname} are corrupted')
+    ids = [card >> ID_SHIFT for hand in game.playersToCards.values() for card in hand.cards]
+    ids += [card >> ID_SHIFT for card in game.deck]
+    ids += [card >> ID_SHIFT for card in game.discard]
+    ids.append(game.current_card >> ID_SHIFT)
+    if len(ids) != DECK_SIZE or len(set(ids)) != DECK_SIZE:
+        raise CorruptedGame(f'check_consistency, {len(set(ids))} distinct of {len(ids)} cards in play')
+
+
+def create_game(seed: int, player_count: int, record: bool = False, rules: HouseRule = DEFAULT_RULES) -> Game:
+    if player_count < 2:
+        raise RuntimeError(f'create_game, at least two players are required, got {player_count}')
+    players = [Player(seat, f'bot{seat}') for seat in range(player_count)]
+    game = Game(players[0], rng=random.Random(seed), rules=rules)
+    game.seed = seed
+    if record:
+        game.log = GameLog()
+    game.players.extend(players[1:])
+    game.state = GameState.READY_TO_START
+    game.deal()
+    return game
+
+
+def run_game(seed: int, policies: list[Policy], max_turns: int = 10_000, record: bool = False,
+             rules: HouseRule = DEFAULT_RULES) -> GameResult:
+    game = create_game(seed, len(policies), record, rules)
+    rng = random.Random(seed ^ 0x5EED)
+    seats = {player.discord_tag: seat for seat, player in enumerate(game.players)}
+    for turn in range(1, max_turns + 1):
+        player = game.current_player
+        card_id, wild_color = policies[seats[player.discord_tag]](game, player, rng)
+        winner = game.apply_turn(player.discord_tag, card_id, wild_color)
+        if winner is not None:
+            return GameResult(seed, seats[winner.discord_tag], turn, game.log)
+    return GameResult(seed, None, max_turns, game.log)
+
+
+def run_batch(seeds: list[int], policy_names: list[str], max_turns: int = 10_000,
+              record: bool = False, rules: HouseRule = DEFAULT_RULES) -> BatchResult:
+    policies = [POLICIES[name] for name in policy_names]
+    batch = BatchResult(len(policies))
+    start = time.perf_counter()
+    for seed in seeds:
+        batch.add(run_game(seed, policies, max_turns, record, rules))
+    batch.elapsed = time.perf_counter() - start
+    return batch
+
+
+def run_parallel(games: int, policy_names: list[str], workers: int, seed: int = 0,
+                 max_turns: int = 10_000, chunk_size: int = 500, log_path: str | None = None,
+                 rules: HouseRule = DEFAULT_RULES) -> BatchResult:
+    seeds = list(range(seed, seed + games))
+    chunks = [seeds[i:i + chunk_size] for i in range(0, len(seeds), chunk_size)]
+    total = BatchResult(len(policy_names))
+    record = log_path is not None
+    archive = open(log_path, 'ab') if record else None
+    start = time.perf_counter()
+    try:
+        if workers <= 1:
+            batches = (run_batch(chunk, policy_names, max_turns, record, rules) for chunk in chunks)
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            pool = ProcessPoolExecutor(max_workers=workers)
+            batches = pool.map(run_batch, chunks, [policy_names] * len(chunks), [max_turns] * len(chunks),
+                               [record] * len(chunks), [rules] * len(chunks))
+        for batch in batches:
+            if archive is not None:
+                archive.write(batch.logs)
+            total.merge(batch)
+    finally:
+        if archive is not None:
+            archive.close()
+        if workers > 1:
+            pool.shutdown()
+    total.elapsed = time.perf_counter() - start
+    return total
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Runs headless uno games without Discord')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--policies', default='first,random,random',
+                        help=f'comma separated seat policies, one of {", ".join(POLICIES)}')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-turns', type=int, default=10_000)
+    parser.add_argument('--log', help='appends a replay log of every game to this archive')
+    parser.add_argument('--rules', default=RULE_NAMES[DEFAULT_RULES],
+                        help=f'comma separated house rules, any of {", ".join(RULE_NAMES.values())}')
+    args = parser.parse_args()
+
+    policy_names = args.policies.split(',')
+    rules = parse_rules([name for name in args.rules.split(',') if name])
+    result = run_parallel(args.games, policy_names, args.workers, args.seed, args.max_turns, log_path=args.log,
+                          rules=rules)
+    print(f'{result.games} games ({result.finished} finished), {result.turns} turns in {result.elapsed:.2f}s')
+    print(f'{result.games_per_second:.1f} games/sec, {result.turns_per_second:.1f} turns/sec')
+    for seat, (name, wins) in enumerate(zip(policy_names, result.wins)):
+        print(f'seat {seat} ({name}): {wins} wins')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+import hashlib
+import json
+import os
+from typing import Any
+
+# interactions reach the bot whatever its intents are, guilds is only needed for the channel and thread cache;
+# without message content, members and presences the gateway stops sending every message of every guild
+GATEWAY_INTENTS = ('guilds',)
+SYNC_HASH_PATH = 'command_tree.sha256'
+
+
+def command_payload(tree: Any) -> list[dict]:
+    return sorted((command.to_dict() for command in tree.get_commands()), key=lambda command: command['name'])
+
+
+def tree_hash(application_id: int | None, payload: list[dict]) -> str:
+    data = json.dumps([application_id, payload], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+async def sync_tree(tree: Any, application_id: int | None, path: str = SYNC_HASH_PATH) -> bool:
+    # registering commands is a rate limited call that makes discord reindex them for every guild, so the tree
+    # is only uploaded when it differs from what was uploaded last time
+    digest = tree_hash(application_id, command_payload(tree))
+    try:
+        with open(path) as f:
+            if f.read().strip() == digest:
+                return False
+    except FileNotFoundError:
+        pass
+    await tree.sync()
+    with open(path + '.tmp', 'w') as f:
+        f.write(digest)
+    os.replace(path + '.tmp', path)
+    return True
@@ -0,0 +1,229 @@
+import os
+import random
+import struct
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO
+
+from game import *
+
+MAGIC = b'UNO\x05'
+# state, pickup stack, is_reversed, current seat, last seat, current card, current color, player count, house rules,
+# spectator count, reveal hands
+HEADER = struct.Struct('<4sBHbHhIBHBH?')
+PLAYER = struct.Struct('<qHH')  # discord tag, nickname length, hand length
+SPECTATOR = struct.Struct('<qH')  # discord tag, nickname length
+LENGTH = struct.Struct('<I')
+RNG_STATE_LENGTH = 625
+RNG = struct.Struct(f'<B{RNG_STATE_LENGTH}I?d')  # version, mersenne twister state, has gauss, gauss
+LOG = struct.Struct('<q?I')  # seed (-1 when unknown), is logged, log length, followed by the log so far
+JOURNAL_ENTRY = struct.Struct('<qiB')  # discord tag, card id (-1 for draw), wild color (0 for none)
+SNAPSHOT_SUFFIX = '.snap'
+JOURNAL_SUFFIX = '.journal'
+
+
+def dump_game(game: Game, log: bool = True) -> bytes:
+    seats = game.seats
+    parts = [HEADER.pack(
+        MAGIC, game.state.value, game.pickup_stack, game.is_reversed, game.current_seat,
+        -1 if game.last_player is None else seats[game.last_player.discord_tag],
+        getattr(game, 'current_card', 0),
+        0 if getattr(game, 'current_color', None) is None else game.current_color.value,
+        len(game.players), game.rules, len(game.spectators), game.reveal_hands)]
+    for player in game.players:
+        nickname = player.nickname.encode()
+        hand = game.playersToCards.get(player)
+        cards = b'' if hand is None else hand.cards.tobytes()
+        parts.append(PLAYER.pack(player.discord_tag, len(nickname), 0 if hand is None else len(hand)))
+        parts.append(nickname)
+        parts.append(cards)
+    for spectator in game.spectators.values():
+        nickname = spectator.nickname.encode()
+        parts.append(SPECTATOR.pack(spectator.discord_tag, len(nickname)))
+        parts.append(nickname)
+    for pile in (game.deck, game.discard):
+        parts.append(LENGTH.pack(len(pile)))
+        parts.append(pile.tobytes())
+    version, internal, gauss = game.rng.getstate()
+    parts.append(RNG.pack(version, *internal, gauss is not None, gauss or 0.0))
+    # a restored game keeps logging where it left off, so it still ends up in the replay archive
+    logged = log and game.log is not None
+    parts.append(LOG.pack(-1 if game.seed is None else game.seed, logged, len(game.log.data) if logged else 0))
+    if logged:
+        parts.append(game.log.data)
+    return b''.join(parts)
+
+
+def load_game(data: bytes | memoryview) -> Game:
+    data = memoryview(data)
+    (magic, state, pickup_stack, is_reversed, current_seat, last_seat, current_card, current_color,
+     player_count, rules, spectator_count, reveal_hands) = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise RuntimeError(f'load_game, unknown snapshot format {bytes(magic)!r}')
+    offset = HEADER.size
+    players = []
+    hands = []
+    for _ in range(player_count):
+        discord_tag, nickname_length, hand_length = PLAYER.unpack_from(data, offset)
+        offset += PLAYER.size
+        players.append(Player(discord_tag, bytes(data[offset:offset + nickname_length]).decode()))
+        offset += nickname_length
+        cards = array(CARD_TYPECODE)
+        cards.frombytes(data[offset:offset + hand_length * cards.itemsize])
+        offset += hand_length * cards.itemsize
+        hands.append(cards)
+    spectators = []
+    for _ in range(spectator_count):
+        discord_tag, nickname_length = SPECTATOR.unpack_from(data, offset)
+        offset += SPECTATOR.size
+        spectators.append(Player(discord_tag, bytes(data[offset:offset + nickname_length]).decode()))
+        offset += nickname_length
+    piles = []
+    for _ in range(2):
+        (length,) = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+        pile = array(CARD_TYPECODE)
+        pile.frombytes(data[offset:offset + length * pile.itemsize])
+        offset += length * pile.itemsize
+        piles.append(pile)
+    version, *internal, has_gauss, gauss = RNG.unpack_from(data, offset)
+    offset += RNG.size
+    rng = random.Random()
+    rng.setstate((version, tuple(internal), gauss if has_gauss else None))
+    seed, logged, log_length = LOG.unpack_from(data, offset)
+    offset += LOG.size
+
+    game = Game(players[0], rng=rng, rules=HouseRule(rules))
+    game.seed = None if seed < 0 else seed
+    if logged:
+        game.log = GameLog()
+        game.log.data += data[offset:offset + log_length]
+    game.players = players
+    game.__reindex_seats__()
+    game.spectators = {spectator.discord_tag: spectator for spectator in spectators}
+    game.reveal_hands = reveal_hands
+    game.state = GameState(state)
+    game.pickup_stack = pickup_stack
+    game.is_reversed = is_reversed
+    game.deck, game.discard = piles
+    if game.state == GameState.ONGOING or game.state == GameState.FINISHED:
+        for player, cards in zip(players, hands):
+            hand = Hand()
+            for card in cards:
+                hand.add(card)
+            game.playersToCards[player] = hand
+        game.current_seat = current_seat
+        game.current_player = players[current_seat]
+        game.last_player = None if last_seat < 0 else players[last_seat]
+        game.current_card = current_card
+        game.current_color = None if current_color == 0 else Color(current_color)
+        game.__update_rule_index__()
+    return game
+
+
+def replay_journal(game: Game, data: bytes | memoryview):
+    for discord_tag, card_id, wild_color in JOURNAL_ENTRY.iter_unpack(data[:len(data) - len(data) % JOURNAL_ENTRY.size]):
+        game.apply_turn(discord_tag, None if card_id < 0 else card_id, None if wild_color == 0 else Color(wild_color))
+
+
+class SnapshotStore:
+    def __init__(self, directory: str, compact_after: int = 256):
+        self.directory = directory
+        self.compact_after = compact_after
+        self.journal_lengths: dict[int, int] = {}
+        self.journals: dict[int, BinaryIO] = {}  # only touched from the writer thread
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='snapshot')
+        os.makedirs(directory, exist_ok=True)
+
+    def __path__(self, channel_id: int, suffix: str) -> str:
+        return os.path.join(self.directory, f'{channel_id}{suffix}')
+
+    def save(self, channel_id: int, message_id: int, game: Game) -> Future:
+        data = struct.pack('<Q', message_id) + dump_game(game)
+        self.journal_lengths[channel_id] = 0
+        return self.executor.submit(self.__write_snapshot__, channel_id, data)
+
+    def archive(self, channel_id: int, message_id: int, game: Game) -> Future:
+        # a final snapshot of a game that is no longer live, nothing is journaled after it
+        data = struct.pack('<Q', message_id) + dump_game(game)
+        return self.executor.submit(self.__write_archive__, channel_id, data)
+
+    def append_turn(self, channel_id: int, message_id: int, game: Game, discord_tag: int, card_id: int | None,
+                    wild_color: Color | None) -> Future:
+        length = self.journal_lengths.get(channel_id, 0) + 1
+        if length >= self.compact_after:
+            return self.save(channel_id, message_id, game)
+        self.journal_lengths[channel_id] = length
+        entry = JOURNAL_ENTRY.pack(discord_tag, -1 if card_id is None else card_id,
+                                   0 if wild_color is None else wild_color.value)
+        return self.executor.submit(self.__write_journal__, channel_id, entry)
+
+    def delete(self, channel_id: int) -> Future:
+        self.journal_lengths.pop(channel_id, None)
+        return self.executor.submit(self.__delete__, channel_id)
+
+    def flush(self):
+        self.executor.submit(lambda: None).result()
+
+    def close(self):
+        self.executor.submit(self.__close_journals__).result()
+        self.executor.shutdown()
+
+    def load_all(self) -> list[tuple[int, int, Game]]:
+        games = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(SNAPSHOT_SUFFIX):
+                continue
+            channel_id = int(name[:-len(SNAPSHOT_SUFFIX)])
+            try:
+                with open(self.__path__(channel_id, SNAPSHOT_SUFFIX), 'rb') as snapshot:
+                    data = snapshot.read()
+                (message_id,) = struct.unpack_from('<Q', data)
+                game = load_game(memoryview(data)[8:])
+                journal_path = self.__path__(channel_id, JOURNAL_SUFFIX)
+                if os.path.exists(journal_path):
+                    with open(journal_path, 'rb') as journal:
+                        journal_data = journal.read()
+                    replay_journal(game, journal_data)
+                    self.journal_lengths[channel_id] = len(journal_data) // JOURNAL_ENTRY.size
+            except (RuntimeError, struct.error, ValueError, KeyError) as e:
+                print(f'load_all, cannot restore game in channel {channel_id}: {e!r}')
+                continue
+            games.append((channel_id, message_id, game))
+        return games
+
+    def __write_snapshot__(self, channel_id: int, data: bytes):
+        path = self.__path__(channel_id, SNAPSHOT_SUFFIX)
+        with open(path + '.tmp', 'wb') as snapshot:
+            snapshot.write(data)
+        os.replace(path + '.tmp', path)
+        journal = self.journals.pop(channel_id, None)
+        if journal is not None:
+            journal.close()
+        open(self.__path__(channel_id, JOURNAL_SUFFIX), 'wb').close()
+
+    def __write_archive__(self, channel_id: int, data: bytes):
+        path = self.__path__(channel_id, SNAPSHOT_SUFFIX)
+        with open(path + '.tmp', 'wb') as snapshot:
+            snapshot.write(data)
+        os.replace(path + '.tmp', path)
+
+    def __write_journal__(self, channel_id: int, entry: bytes):
+        journal = self.journals.get(channel_id)
+        if journal is None:
+            journal = self.journals[channel_id] = open(self.__path__(channel_id, JOURNAL_SUFFIX), 'ab')
+        journal.write(entry)
+        journal.flush()
+
+    def __delete__(self, channel_id: int):
+        journal = self.journals.pop(channel_id, None)
+        if journal is not None:
+            journal.close()
+        for suffix in (SNAPSHOT_SUFFIX, JOURNAL_SUFFIX):
+            path = self.__path__(channel_id, suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __close_journals__(self):
+        for journal in self.journals.values():
+            journal.close()
+        self.journals.clear()
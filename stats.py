@@ -0,0 +1,292 @@
+import asyncio
+import bisect
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from ai import is_ai
+from game import *
+
+STATS_PATH = 'stats.sqlite3'
+INITIAL_RATING = 1000.0
+K_FACTOR = 32.0
+LEADERBOARD_SIZE = 10
+CACHE_DEPTH = 50  # rows kept per guild, the slack lets players drop out of the top without a query
+BATCH_SIZE = 512  # games per transaction
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS players (
+    guild_id INTEGER NOT NULL,
+    discord_tag INTEGER NOT NULL,
+    nickname TEXT NOT NULL,
+    rating REAL NOT NULL,
+    games INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, discord_tag)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS players_by_rating ON players (guild_id, rating DESC, discord_tag);
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    finished_at REAL NOT NULL,
+    winner INTEGER NOT NULL,
+    player_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_by_guild ON games (guild_id, finished_at);
+'''
+
+
+class PlayerStats:
+    discord_tag: int
+    nickname: str
+    rating: float
+    games: int
+    wins: int
+
+    def __init__(self, discord_tag: int, nickname: str, rating: float, games: int, wins: int):
+        self.discord_tag = discord_tag
+        self.nickname = nickname
+        self.rating = rating
+        self.games = games
+        self.wins = wins
+
+    def key(self) -> tuple[float, int]:
+        # the order of the leaderboard index
+        return -self.rating, self.discord_tag
+
+
+class FinishedGame:
+    # what the writer needs of a game, taken on the event loop so the game itself is never shared with the thread
+    def __init__(self, guild_id: int, channel_id: int, players: list[tuple[int, str]], winner: int):
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.players = players
+        self.winner = winner
+        self.finished_at = time.time()
+
+
+def elo_deltas(ratings: list[float], winner: int, k: float = K_FACTOR) -> list[float]:
+    # the winner beat every other player at the table, the others did not play each other;
+    # k is split among the pairs so a table of any size moves as much rating as a duel
+    deltas = [0.0] * len(ratings)
+    scale = k / max(len(ratings) - 1, 1)
+    for seat, rating in enumerate(ratings):
+        if seat == winner:
+            continue
+        expected = 1 / (1 + 10 ** ((rating - ratings[winner]) / 400))
+        change = scale * (1 - expected)
+        deltas[winner] += change
+        deltas[seat] -= change
+    return deltas
+
+
+class Leaderboard:
+    rows: list[PlayerStats]  # the best rows of the guild in index order
+    keys: list[tuple[float, int]]
+    complete: bool  # no player of the guild is missing from rows
+
+    def __init__(self, rows: list[PlayerStats], depth: int):
+        self.rows = rows
+        self.keys = [row.key() for row in rows]
+        self.complete = len(rows) < depth
+
+
+class LeaderboardCache:
+    # the top of every queried guild; committed ratings are moved into place instead of dropping the guild
+    def __init__(self, depth: int = CACHE_DEPTH):
+        self.depth = depth
+        self.boards: dict[int, Leaderboard] = {}
+        self.generations: dict[int, int] = {}  # bumped on every change, a query started before one is not cached
+        self.lock = threading.Lock()
+
+    def get(self, guild_id: int, limit: int) -> list[PlayerStats] | None:
+        with self.lock:
+            board = self.boards.get(guild_id)
+            return None if board is None else board.rows[:limit]
+
+    def generation(self, guild_id: int) -> int:
+        with self.lock:
+            return self.generations.get(guild_id, 0)
+
+    def put(self, guild_id: int, rows: list[PlayerStats], generation: int):
+        with self.lock:
+            if self.generations.get(guild_id, 0) == generation:
+                self.boards[guild_id] = Leaderboard(rows, self.depth)
+
+    def update(self, guild_id: int, changed: list[PlayerStats]):
+        with self.lock:
+            self.generations[guild_id] = self.generations.get(guild_id, 0) + 1
+            board = self.boards.get(guild_id)
+            if board is None:
+                return
+            for row in changed:
+                for i, cached in enumerate(board.rows):
+                    if cached.discord_tag == row.discord_tag:
+                        del board.rows[i]
+                        del board.keys[i]
+                        break
+                key = row.key()
+                if not board.complete and (not board.keys or key > board.keys[-1]):
+                    continue  # ranks below the cached rows, somewhere among the players that are not cached
+                i = bisect.bisect(board.keys, key)
+                board.rows.insert(i, row)
+                board.keys.insert(i, key)
+                if len(board.rows) > self.depth:
+                    board.rows.pop()
+                    board.keys.pop()
+                    board.complete = False
+            if not board.complete and len(board.rows) < LEADERBOARD_SIZE:
+                del self.boards[guild_id]  # too many players fell out of the cached rows, the next query refills them
+
+    def clear(self):
+        with self.lock:
+            self.boards.clear()
+
+
+class StatsStore:
+    # finished games are queued on the event loop and written in batches by one thread,
+    # leaderboards are read from a pool of connections that WAL lets run alongside the writer
+    def __init__(self, path: str = STATS_PATH, readers: int = 2, batch_size: int = BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.cache = LeaderboardCache()
+        self.pending: list[FinishedGame] = []
+        self.scheduled = False
+        self.lock = threading.Lock()
+        self.written = 0
+        self.hits = 0
+        self.misses = 0
+        self.connection = self.__connect__()  # only used from the writer thread after this
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stats-write')
+        self.local = threading.local()
+        self.readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='stats-read')
+
+    def __connect__(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        connection.execute('PRAGMA synchronous=NORMAL')  # with WAL a crash may lose the last batch, never corrupt
+        connection.execute('PRAGMA busy_timeout=5000')
+        return connection
+
+    def record(self, guild_id: int, channel_id: int, game: Game, winner: Player) -> Future | None:
+        # bots have no rating: only the humans are rated against each other, a game a bot won rates nobody
+        humans = [p for p in game.players if not is_ai(p)]
+        if winner not in humans or len(humans) < 2:
+            return None
+        finished = FinishedGame(guild_id, channel_id, [(p.discord_tag, p.nickname) for p in humans],
+                                humans.index(winner))
+        with self.lock:
+            self.pending.append(finished)
+            if self.scheduled:
+                return None  # the queued flush takes this game along
+            self.scheduled = True
+        return self.writer.submit(self.__flush__)
+
+    def flush(self):
+        self.writer.submit(self.__flush__).result()
+
+    def close(self):
+        self.flush()
+        self.readers.shutdown()
+        self.writer.submit(self.connection.close).result()
+        self.writer.shutdown()
+
+    async def leaderboard(self, guild_id: int, limit: int = LEADERBOARD_SIZE) -> list[PlayerStats]:
+        rows = self.cache.get(guild_id, limit)
+        if rows is not None:
+            self.hits += 1
+            return rows
+        self.misses += 1
+        generation = self.cache.generation(guild_id)
+        rows = await asyncio.get_running_loop().run_in_executor(self.readers, self.__top__, guild_id,
+                                                                self.cache.depth)
+        self.cache.put(guild_id, rows, generation)
+        return rows[:limit]
+
+    async def player(self, guild_id: int, discord_tag: int) -> tuple[int, PlayerStats] | None:
+        return await asyncio.get_running_loop().run_in_executor(self.readers, self.__rank__, guild_id, discord_tag)
+
+    def __reader__(self) -> sqlite3.Connection:
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = self.__connect__()
+            connection.execute('PRAGMA query_only=1')
+        return connection
+
+    def __top__(self, guild_id: int, limit: int) -> list[PlayerStats]:
+        cursor = self.__reader__().execute(
+            'SELECT discord_tag, nickname, rating, games, wins FROM players WHERE guild_id = ? '
+            'ORDER BY rating DESC, discord_tag LIMIT ?', (guild_id, limit))
+        return [PlayerStats(*row) for row in cursor]
+
+    def __rank__(self, guild_id: int, discord_tag: int) -> tuple[int, PlayerStats] | None:
+        connection = self.__reader__()
+        row = connection.execute('SELECT discord_tag, nickname, rating, games, wins FROM players '
+                                 'WHERE guild_id = ? AND discord_tag = ?', (guild_id, discord_tag)).fetchone()
+        if row is None:
+            return None
+        stats = PlayerStats(*row)
+        (above,) = connection.execute(
+            'SELECT COUNT(*) FROM players WHERE guild_id = ? AND (rating > ? OR rating = ? AND discord_tag < ?)',
+            (guild_id, stats.rating, stats.rating, discord_tag)).fetchone()
+        return above + 1, stats
+
+    def __flush__(self):
+        with self.lock:
+            batch, self.pending = self.pending, []
+            self.scheduled = False
+        for start in range(0, len(batch), self.batch_size):
+            games = batch[start:start + self.batch_size]
+            try:
+                changed = self.__write__(games)
+            except sqlite3.Error as e:
+                print(f'__flush__, cannot record {len(games)} games: {e!r}')
+                continue
+            self.written += len(games)
+            by_guild: dict[int, list[PlayerStats]] = {}
+            for (guild_id, _), stats in changed.items():
+                by_guild.setdefault(guild_id, []).append(stats)
+            for guild_id, rows in by_guild.items():
+                self.cache.update(guild_id, rows)
+
+    def __write__(self, games: list[FinishedGame]) -> dict[tuple[int, int], PlayerStats]:
+        # ratings of a batch are updated in memory and written once per player
+        connection = self.connection
+        players: dict[tuple[int, int], PlayerStats] = {}
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            for game in games:
+                seats = []
+                for discord_tag, nickname in game.players:
+                    stats = players.get((game.guild_id, discord_tag))
+                    if stats is None:
+                        row = connection.execute(
+                            'SELECT discord_tag, nickname, rating, games, wins FROM players '
+                            'WHERE guild_id = ? AND discord_tag = ?', (game.guild_id, discord_tag)).fetchone()
+                        stats = PlayerStats(discord_tag, nickname, INITIAL_RATING, 0, 0) if row is None \
+                            else PlayerStats(*row)
+                        players[game.guild_id, discord_tag] = stats
+                    stats.nickname = nickname
+                    seats.append(stats)
+                for seat, (stats, delta) in enumerate(zip(seats, elo_deltas([s.rating for s in seats], game.winner))):
+                    stats.rating += delta
+                    stats.games += 1
+                    stats.wins += seat == game.winner
+            connection.executemany(
+                'INSERT INTO games (guild_id, channel_id, finished_at, winner, player_count) VALUES (?, ?, ?, ?, ?)',
+                [(game.guild_id, game.channel_id, game.finished_at, game.players[game.winner][0], len(game.players))
+                 for game in games])
+            connection.executemany(
+                'INSERT INTO players (guild_id, discord_tag, nickname, rating, games, wins) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (guild_id, discord_tag) DO UPDATE SET nickname = excluded.nickname, '
+                'rating = excluded.rating, games = excluded.games, wins = excluded.wins',
+                [(guild_id, stats.discord_tag, stats.nickname, stats.rating, stats.games, stats.wins)
+                 for (guild_id, _), stats in players.items()])
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return players
@@ -0,0 +1,293 @@
+import asyncio
+import hashlib
+import os
+import struct
+from collections import OrderedDict
+from typing import Any, Callable
+from urllib.parse import urlparse
+
+from game import *
+from snapshot import dump_game, load_game
+
+REDIS_URL_ENV = 'UNO_REDIS_URL'
+KEY_PREFIX = 'uno:game:'
+# compare-and-set of a game snapshot, returns the new version or -1 when another process got there first;
+# the tests and benchmarks run against RespStandIn, which reimplements it in python, so the lua itself is
+# only exercised by a real redis server
+CAS_SCRIPT = b"""local v = tonumber(redis.call('HGET', KEYS[1], 'version') or '0')
+if v ~= tonumber(ARGV[1]) then return -1 end
+redis.call('HSET', KEYS[1], 'data', ARGV[2], 'version', v + 1)
+return v + 1
+"""
+CAS_SHA = hashlib.sha1(CAS_SCRIPT).hexdigest().encode()
+
+
+class VersionConflict(RuntimeError):
+    pass
+
+
+class RespError(RuntimeError):
+    pass
+
+
+class StoredGame:
+    game: Game
+    message_id: int
+    version: int
+    message: Any  # the discord message, only meaningful inside this process
+    hands: dict[Player, Any]
+    broadcast: Any  # what spectators see, only meaningful inside this process
+
+    def __init__(self, game: Game, message_id: int, version: int = 0, message: Any = None):
+        self.game = game
+        self.message_id = message_id
+        self.version = version
+        self.message = message
+        self.hands = {}
+        self.broadcast = None
+
+
+def encode_entry(entry: StoredGame) -> bytes:
+    return struct.pack('<Q', entry.message_id) + dump_game(entry.game)
+
+
+def decode_entry(data: bytes, version: int) -> StoredGame:
+    (message_id,) = struct.unpack_from('<Q', data)
+    return StoredGame(load_game(memoryview(data)[8:]), message_id, version)
+
+
+class GameStore:
+    # games of this process, most recently used last; subclasses decide where the shared copy lives
+    def __init__(self):
+        self.games: OrderedDict[int, StoredGame] = OrderedDict()
+        self.on_evicted: Callable[[int, StoredGame], None] | None = None
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self.games
+
+    def __getitem__(self, channel_id: int) -> StoredGame:
+        entry = self.games[channel_id]
+        self.games.move_to_end(channel_id)
+        return entry
+
+    def __len__(self) -> int:
+        return len(self.games)
+
+    def get(self, channel_id: int) -> StoredGame | None:
+        entry = self.games.get(channel_id)
+        if entry is not None:
+            self.games.move_to_end(channel_id)
+        return entry
+
+    def add(self, channel_id: int, game: Game, message: Any) -> StoredGame:
+        entry = self.games[channel_id] = StoredGame(game, message.id, message=message)
+        return entry
+
+    def pop(self, channel_id: int) -> StoredGame | None:
+        return self.games.pop(channel_id, None)
+
+    async def load(self, channel_id: int) -> StoredGame | None:
+        return self.get(channel_id)
+
+    async def commit(self, channel_id: int):
+        raise NotImplementedError()
+
+    def delete(self, channel_id: int):
+        raise NotImplementedError()
+
+    async def close(self):
+        pass
+
+
+class MemoryGameStore(GameStore):
+    async def commit(self, channel_id: int):
+        self.games[channel_id].version += 1
+
+    def delete(self, channel_id: int):
+        self.games.pop(channel_id, None)
+
+
+class RespConnection:
+    def __init__(self, host: str = '127.0.0.1', port: int = 6379):
+        self.host = host
+        self.port = port
+        self.reader: asyncio.StreamReader | None = None
+        self.writer: asyncio.StreamWriter | None = None
+        self.lock = asyncio.Lock()
+
+    async def execute(self, *commands: tuple) -> list:
+        # every command is written before the first reply is read, one round trip for the whole batch
+        async with self.lock:
+            try:
+                if self.writer is None:
+                    self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+                self.writer.write(b''.join(encode_command(command) for command in commands))
+                await self.writer.drain()
+                return [await read_reply(self.reader) for _ in commands]
+            except BaseException:
+                # a failed or cancelled exchange leaves the stream mid-reply, the next call reconnects
+                writer, self.reader, self.writer = self.writer, None, None
+                if writer is not None:
+                    writer.close()
+                raise
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+            self.reader = self.writer = None
+
+
+def encode_command(command: tuple) -> bytes:
+    parts = [b'*%d\r\n' % len(command)]
+    for arg in command:
+        if isinstance(arg, str):
+            arg = arg.encode()
+        elif isinstance(arg, int):
+            arg = b'%d' % arg
+        parts.append(b'$%d\r\n' % len(arg))
+        parts.append(arg)
+        parts.append(b'\r\n')
+    return b''.join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    line = await reader.readline()
+    if not line:
+        raise RespError('read_reply, connection closed')
+    kind, rest = line[:1], line[1:-2]
+    if kind == b'+':
+        return rest
+    if kind == b'-':
+        return RespError(rest.decode())
+    if kind == b':':
+        return int(rest)
+    if kind == b'$':
+        length = int(rest)
+        if length < 0:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if kind == b'*':
+        length = int(rest)
+        if length < 0:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise RespError(f'read_reply, unknown reply {line!r}')
+
+
+class RedisGameStore(GameStore):
+    # hot games stay in a local LRU cache, every turn is written back with a versioned compare-and-set;
+    # writes from all games that finish a turn within the same tick share one pipelined round trip
+    def __init__(self, host: str = '127.0.0.1', port: int = 6379, cache_size: int = 1024):
+        super().__init__()
+        self.connection = RespConnection(host, port)
+        self.cache_size = cache_size
+        self.pending: list[tuple[int, StoredGame, bytes, asyncio.Future]] = []
+        self.flusher: asyncio.Task | None = None
+        self.deletes: set[asyncio.Task] = set()  # referenced until done, the loop only keeps weak references
+        self.script_loaded = False
+        self.round_trips = 0
+
+    def add(self, channel_id: int, game: Game, message: Any) -> StoredGame:
+        entry = super().add(channel_id, game, message)
+        self.__evict__()
+        return entry
+
+    async def load(self, channel_id: int) -> StoredGame | None:
+        entry = self.get(channel_id)
+        if entry is not None:
+            return entry
+        (reply,) = await self.__execute__(('HMGET', KEY_PREFIX + str(channel_id), 'data', 'version'))
+        data, version = reply
+        if data is None:
+            return None
+        entry = self.games[channel_id] = decode_entry(data, int(version))
+        self.__evict__()
+        return entry
+
+    async def commit(self, channel_id: int):
+        # the game actor waits for this before the next turn, so a channel never has two writes in flight
+        entry = self.games[channel_id]
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((channel_id, entry, encode_entry(entry), future))
+        if self.flusher is None:
+            self.flusher = asyncio.create_task(self.__flush__())
+        await future
+
+    def delete(self, channel_id: int):
+        self.games.pop(channel_id, None)
+        task = asyncio.get_running_loop().create_task(self.__execute__(('DEL', KEY_PREFIX + str(channel_id))))
+        self.deletes.add(task)
+        task.add_done_callback(self.__deleted__)
+
+    def __deleted__(self, task: asyncio.Task):
+        self.deletes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f'delete, cannot delete a game from redis: {task.exception()!r}')
+
+    async def close(self):
+        if self.flusher is not None:
+            await self.flusher
+        if self.deletes:
+            await asyncio.gather(*self.deletes, return_exceptions=True)
+        await self.connection.close()
+
+    async def __execute__(self, *commands: tuple) -> list:
+        self.round_trips += 1
+        replies = await self.connection.execute(*commands)
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    async def __flush__(self):
+        batch = []
+        try:
+            await asyncio.sleep(0)  # let every game that is mid-turn in this tick join the batch
+            while self.pending:
+                batch, self.pending = self.pending, []
+                try:
+                    if not self.script_loaded:
+                        await self.__execute__(('SCRIPT', 'LOAD', CAS_SCRIPT))
+                        self.script_loaded = True
+                    replies = await self.__execute__(*(
+                        ('EVALSHA', CAS_SHA, 1, KEY_PREFIX + str(channel_id), entry.version, data)
+                        for channel_id, entry, data, _ in batch))
+                except (OSError, RuntimeError, asyncio.IncompleteReadError) as e:
+                    if 'NOSCRIPT' in str(e):
+                        self.script_loaded = False  # the server restarted and lost its script cache
+                    for _, _, _, future in batch:
+                        future.set_exception(e)
+                    continue
+                for (channel_id, entry, _, future), version in zip(batch, replies):
+                    if version < 0:
+                        # another process moved the game on, our copy is stale and must be reloaded
+                        if self.games.get(channel_id) is entry:
+                            self.games.pop(channel_id)
+                            if self.on_evicted is not None:
+                                self.on_evicted(channel_id, entry)
+                        future.set_exception(VersionConflict(f'commit, game in channel {channel_id} has changed'))
+                    else:
+                        entry.version = version
+                        future.set_result(None)
+        finally:
+            self.flusher = None
+            # whatever stopped the flush, no commit may be left waiting for it
+            for _, _, _, future in batch + self.pending:
+                if not future.done():
+                    future.set_exception(RuntimeError('commit, the redis flush stopped'))
+            self.pending = []
+
+    def __evict__(self):
+        while len(self.games) > self.cache_size:
+            channel_id, entry = self.games.popitem(last=False)
+            if self.on_evicted is not None:
+                self.on_evicted(channel_id, entry)
+
+
+def store_from_env() -> GameStore:
+    url = os.environ.get(REDIS_URL_ENV)
+    if not url:
+        return MemoryGameStore()
+    parsed = urlparse(url)
+    return RedisGameStore(parsed.hostname or '127.0.0.1', parsed.port or 6379)
@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def bot(tmp_path, monkeypatch):
+    # imported here, only the tests that ask for the bot pay for importing main and discord
+    from tests.fakes import open_bot
+    yield from open_bot(tmp_path, monkeypatch)
@@ -0,0 +1,113 @@
+import asyncio
+
+import main
+from config import Config
+
+
+class FakeMessage:
+    def __init__(self, id: int, channel_id: int, guild_id: int = 1):
+        self.id = id
+        self.channel = FakeChannel(channel_id)
+        self.guild = FakeChannel(guild_id)
+        self.edits: list[dict] = []
+
+    async def edit(self, **kwargs):
+        self.edits.append(kwargs)
+
+
+class FakeChannel:
+    def __init__(self, id: int):
+        self.id = id
+
+
+class FakeUser:
+    def __init__(self, id: int, display_name: str = ''):
+        self.id = id
+        self.display_name = display_name or f'user{id}'
+
+
+class FakeResponse:
+    def __init__(self):
+        self.answers: list[tuple[str, dict]] = []
+
+    def is_done(self) -> bool:
+        return bool(self.answers)
+
+    async def __answer__(self, kind: str, kwargs: dict):
+        if self.answers:
+            raise RuntimeError('the interaction was already answered')
+        self.answers.append((kind, kwargs))
+
+    async def defer(self, **kwargs):
+        await self.__answer__('defer', kwargs)
+
+    async def send_message(self, **kwargs):
+        await self.__answer__('send_message', kwargs)
+
+    async def edit_message(self, **kwargs):
+        await self.__answer__('edit_message', kwargs)
+
+
+class FakeFollowup:
+    def __init__(self, response: FakeResponse, channel_id: int):
+        self.response = response
+        self.channel_id = channel_id
+        self.sent: list[dict] = []
+
+    async def send(self, wait: bool = False, **kwargs) -> FakeMessage | None:
+        if not self.response.is_done():
+            raise RuntimeError('a followup needs an answered interaction')
+        self.sent.append(kwargs)
+        return FakeMessage(len(self.sent), self.channel_id) if wait else None
+
+
+class FakeInteraction:
+    def __init__(self, user_id: int, channel_id: int, custom_id: str = ''):
+        self.user = FakeUser(user_id)
+        self.channel_id = channel_id
+        self.data = {'custom_id': custom_id}
+        self.response = FakeResponse()
+        self.followup = FakeFollowup(self.response, channel_id)
+        self.edits: list[dict] = []
+
+    async def original_response(self) -> FakeMessage:
+        return FakeMessage(hash((self.user.id, self.channel_id)) & 0xFFFF, self.channel_id)
+
+    async def edit_original_response(self, **kwargs):
+        if not self.response.is_done():
+            raise RuntimeError('edit_original_response, the interaction was not answered')
+        self.edits.append(kwargs)
+
+
+def open_bot(tmp_path, monkeypatch):
+    # main's globals as main() opens them, on a memory store and without card images
+    monkeypatch.setattr(main, 'card_images', None)
+    main.open_stores(Config(snapshot_dir=str(tmp_path / 'snapshots'), archive_dir=str(tmp_path / 'archive'),
+                            log_path=str(tmp_path / 'games.unolog'), stats_path=str(tmp_path / 'stats.sqlite3'),
+                            channel_rules_path=str(tmp_path / 'channel_rules.json')))
+    yield main
+    main.game_actors.clear()
+    main.table_games.clear()
+    main.tournaments.clear()
+    main.stats_store.close()
+    main.log_archive.close()
+    main.snapshot_store.close()
+    main.ai_runner.close()
+
+
+def seat_game(channel_id: int, game) -> FakeMessage:
+    message = FakeMessage(channel_id * 10, channel_id)
+    entry = main.game_store.add(channel_id, game, message)
+    main.attach_game(channel_id, entry)
+    entry.hands = {player: main.HandMessage() for player in game.players}
+    return message
+
+
+async def settle():
+    await asyncio.sleep(main.render_scheduler.delay * 3)
+
+
+class BrokenChannel(FakeChannel):
+    # a channel the bot may not open threads in
+    async def create_thread(self, **kwargs):
+        raise RuntimeError('create_thread, missing permissions')
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+from ai import AIRunner, candidate_moves, default_workers, is_ai, think
+from game import Player
+from simulation import create_game
+from snapshot import dump_game, load_game
+
+
+def test_bot_tags_stay_unique_in_restored_games():
+    runner = AIRunner()
+    try:
+        game = create_game(0, 2)
+        for _ in range(2):
+            game.players.append(runner.create_player(game))
+        restored = load_game(dump_game(game))
+        bot = AIRunner().create_player(restored)  # a fresh process after a restart
+        assert is_ai(bot)
+        assert bot.discord_tag not in {player.discord_tag for player in restored.players}
+        assert [p.discord_tag for p in game.players[2:]] == [-1, -2] and bot.discord_tag == -3
+        assert runner.create_player(create_game(1, 2)).discord_tag == -1
+        assert not is_ai(Player(5, 'human'))
+    finally:
+        runner.close()
+
+
+def playable_game():
+    # a game in which the player to move has a choice, so the search has something to compare
+    return next(g for g in (create_game(seed, 3) for seed in range(100))
+                if len(candidate_moves(g, g.current_player)) > 1)
+
+
+def test_think_returns_a_legal_move_for_a_snapshot():
+    game = playable_game()
+    player = game.current_player
+    data = dump_game(game, log=False)
+    move = think(data, game.seats[player.discord_tag], 'montecarlo', 0.02, 1, time.time() + 10)
+    assert move in candidate_moves(game, player)
+    load_game(data).apply_turn(player.discord_tag, *move)  # raises on an illegal move
+
+
+def test_a_search_nobody_waits_for_is_skipped():
+    game = playable_game()
+    start = time.perf_counter()
+    move = think(dump_game(game, log=False), game.current_seat, 'montecarlo', 10.0, 1, time.time() - 1)
+    assert move == (None, None) and time.perf_counter() - start < 1.0
+
+
+def test_the_pool_chooses_a_legal_move():
+    runner = AIRunner(workers=1, budget=0.02)
+    try:
+        game = playable_game()
+        player = game.current_player
+        move = asyncio.run(runner.choose(game, player))
+        assert move in candidate_moves(game, player)
+        assert runner.workers == 1 and default_workers() >= 1
+    finally:
+        runner.close()
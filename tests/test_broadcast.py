@@ -0,0 +1,15 @@
+from broadcast import MESSAGE_LIMIT, Broadcast, revealed_hands
+from simulation import create_game
+
+
+def test_revealed_hands_fit_in_a_message():
+    game = create_game(0, 10)
+    game.reveal_hands = True
+    assert 'bot9: ' in revealed_hands(game) and 'bot9: 7 cards' not in revealed_hands(game)
+    assert 'bot9: 7 cards' in revealed_hands(game, 300)
+    assert len(revealed_hands(game, 100)) == 100
+    content = 'x' * (MESSAGE_LIMIT - 150)
+    final = Broadcast(game).final(content)
+    assert len(final) <= MESSAGE_LIMIT and final.startswith(content)
+    game.reveal_hands = False
+    assert Broadcast(game).final(content) == content
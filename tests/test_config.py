@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from config import CONFIG_ENV, TOKEN_ENV, Config, load_config
+
+
+def write_config(tmp_path, **settings) -> str:
+    path = tmp_path / 'uno.json'
+    path.write_text(json.dumps(settings))
+    return str(path)
+
+
+def test_the_command_line_beats_the_environment_which_beats_the_file(tmp_path):
+    path = write_config(tmp_path, snapshot_dir='file', archive_dir='file', stats_path='file', metrics_port=1)
+    environ = {'UNO_SNAPSHOT_DIR': 'env', 'UNO_ARCHIVE_DIR': 'env', 'UNO_METRICS_PORT': '2'}
+    config = load_config(['--config', path, '--snapshot-dir', 'cli', '--metrics-port', '3'], environ)
+    assert (config.snapshot_dir, config.archive_dir, config.stats_path) == ('cli', 'env', 'file')
+    assert config.metrics_port == 3
+    assert config.log_path == Config().log_path  # not set anywhere
+
+
+def test_the_config_file_can_come_from_the_environment(tmp_path):
+    path = write_config(tmp_path, ai_workers=2)
+    config = load_config([], {CONFIG_ENV: path, 'UNO_METRICS_PORT': '9000'})
+    assert config.ai_workers == 2 and config.metrics_port == 9000
+    assert load_config([], {'UNO_AI_WORKERS': ''}).ai_workers is None  # an empty variable is unset
+
+
+def test_unknown_settings_are_rejected(tmp_path):
+    with pytest.raises(RuntimeError):
+        load_config(['--config', write_config(tmp_path, snapshot_directory='typo')], {})
+
+
+def test_the_token_comes_from_the_environment_before_the_file(tmp_path, monkeypatch):
+    token_file = tmp_path / 'token.txt'
+    token_file.write_text('from the file\n')
+    config = Config(token_file=str(token_file))
+    monkeypatch.delenv(TOKEN_ENV, raising=False)
+    assert config.token() == 'from the file'
+    monkeypatch.setenv(TOKEN_ENV, ' from the environment ')
+    assert config.token() == 'from the environment'
+    monkeypatch.delenv(TOKEN_ENV)
+    with pytest.raises(RuntimeError):
+        Config(token_file=str(tmp_path / 'missing.txt')).token()
@@ -0,0 +1,82 @@
+import asyncio
+
+from events import EventBus
+
+
+class Base:
+    pass
+
+
+class Child(Base):
+    pass
+
+
+class Other:
+    pass
+
+
+def test_a_failing_listener_does_not_stop_the_others():
+    async def run():
+        bus = EventBus()
+        heard = []
+        error = RuntimeError('listener, broken')
+
+        async def broken(event):
+            raise error
+
+        async def slow(event):
+            await asyncio.sleep(0.01)
+            heard.append('slow')
+
+        async def quick(event):
+            heard.append('quick')
+
+        for listener in (broken, slow, quick):
+            bus.subscribe(Base, listener)
+        return await bus.publish(Base()), heard, bus.errors, error
+
+    errors, heard, count, error = asyncio.run(run())
+    assert errors == [error] and count == 1
+    assert heard == ['quick', 'slow']  # run concurrently, not one after the other
+
+
+def test_a_listener_runs_once_per_event_across_subclasses():
+    async def run():
+        bus = EventBus()
+        heard = []
+
+        async def listener(event):
+            heard.append(type(event).__name__)
+
+        bus.subscribe((Base, Child), listener)
+        bus.subscribe(Child, listener)
+        await bus.publish(Child())
+        await bus.publish(Base())
+        await bus.publish(Other())
+        bus.unsubscribe(Base, listener)
+        await bus.publish(Base())
+        await bus.publish(Child())  # still subscribed to the subclass itself
+        return heard
+
+    assert asyncio.run(run()) == ['Child', 'Base', 'Child']
+
+
+def test_routes_follow_new_subscriptions():
+    async def run():
+        bus = EventBus()
+        heard = []
+
+        async def first(event):
+            heard.append('first')
+
+        async def second(event):
+            heard.append('second')
+
+        bus.subscribe(Base, first)
+        await bus.publish(Child())  # builds and caches the route of Child
+        bus.subscribe(Base, second)
+        await bus.publish(Child())
+        return heard, bus.listeners_of(Child)
+
+    heard, route = asyncio.run(run())
+    assert heard == ['first', 'first', 'second'] and len(route) == 2
@@ -0,0 +1,60 @@
+import asyncio
+import random
+
+import pytest
+
+from actor import ActorBusy, DuplicateAction, GameActor
+from game import *
+from rules import RULE_NAMES
+from simulation import check_consistency, create_game, first_playable_policy, greedy_policy, random_policy
+
+VARIANTS = [DEFAULT_RULES] + [DEFAULT_RULES | rule for rule in RULE_NAMES if not DEFAULT_RULES & rule]
+VARIANTS.append(HouseRule(sum(HouseRule)))
+
+
+@pytest.mark.parametrize('rules', VARIANTS, ids=lambda rules: str(int(rules)))
+def test_games_stay_consistent(rules: HouseRule):
+    for seed in range(30):
+        game = create_game(seed, 4, rules=rules)
+        rng = random.Random(seed)
+        policy = greedy_policy if seed % 2 else random_policy
+        for _ in range(2_000):
+            player = game.current_player
+            if game.apply_turn(player.discord_tag, *policy(game, player, rng)) is not None:
+                break
+            check_consistency(game)
+        assert game.state == GameState.FINISHED
+        check_consistency(game)
+
+
+def test_concurrent_clicks_stay_consistent():
+    async def run():
+        rng = random.Random(0)
+        applied = 0
+
+        async def click(game: Game, actor: GameActor, player: Player):
+            nonlocal applied
+            card_id, wild_color = first_playable_policy(game, player, rng)
+            try:
+                await actor.submit((player.discord_tag, card_id),
+                                   lambda: game.process_turn(player.discord_tag, card_id, wild_color))
+                applied += 1
+            except (DuplicateAction, ActorBusy, RuntimeError):
+                pass  # a CorruptedGame is no RuntimeError and fails the test
+
+        async def on_turn_completed(event: TurnCompleted):
+            await asyncio.sleep(0)
+            check_consistency(event.game)
+
+        for seed in range(10):
+            game = create_game(seed, 6)
+            game.events.subscribe(TurnCompleted, on_turn_completed)
+            actor = GameActor(max_depth=32)
+            for _ in range(500):
+                if game.state != GameState.ONGOING:
+                    break
+                await asyncio.gather(*(click(game, actor, player) for player in game.players for _ in range(2)))
+            check_consistency(game)
+        return applied
+
+    assert asyncio.run(run()) > 0
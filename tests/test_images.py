@@ -0,0 +1,98 @@
+import asyncio
+import threading
+
+import pytest
+
+import images
+from card import CardKind, Color, encode_card
+
+pytest.importorskip('PIL')  # the images are optional, so are their tests
+
+RED_FIVE = encode_card(CardKind.NUMBER, Color.RED, 5, 0)
+
+
+def counting_draw(monkeypatch, release: threading.Event | None = None) -> list[tuple]:
+    calls = []
+    draw_board = images.draw_board
+
+    def draw(atlas, *args):
+        calls.append(args)
+        if release is not None:
+            release.wait(5)
+        return draw_board(atlas, *args)
+
+    monkeypatch.setattr(images, 'draw_board', draw)
+    return calls
+
+
+def test_identical_renders_are_drawn_once(monkeypatch):
+    calls = counting_draw(monkeypatch)
+
+    async def run():
+        renderer = images.CardRenderer()
+        try:
+            first = await renderer.board(RED_FIVE, Color.RED, 0, 1)
+            again = await renderer.board(encode_card(CardKind.NUMBER, Color.RED, 5, 7), Color.RED, 0, 1)  # a copy
+            other = await renderer.board(RED_FIVE, Color.RED, 2, 1)
+            return first, again, other, renderer.hits, renderer.misses
+        finally:
+            renderer.close()
+
+    first, again, other, hits, misses = asyncio.run(run())
+    assert first == again != other and first.startswith(b'\x89PNG')
+    assert (hits, misses, len(calls)) == (1, 2, 2)
+
+
+def test_concurrent_requests_share_the_render_in_flight(monkeypatch):
+    release = threading.Event()
+    calls = counting_draw(monkeypatch, release)
+
+    async def run():
+        renderer = images.CardRenderer()
+        try:
+            jobs = [asyncio.ensure_future(renderer.board(RED_FIVE, Color.RED, 0, 1)) for _ in range(5)]
+            await asyncio.sleep(0.05)
+            inflight = len(renderer.inflight)
+            release.set()
+            pngs = await asyncio.gather(*jobs)
+            return pngs, inflight, renderer.inflight, renderer.hits, renderer.misses
+        finally:
+            renderer.close()
+
+    pngs, inflight, left, hits, misses = asyncio.run(run())
+    assert len(set(pngs)) == 1 and inflight == 1 and left == {}
+    assert (hits, misses, len(calls)) == (4, 1, 1)
+
+
+def test_the_cache_drops_the_least_recently_used(monkeypatch):
+    calls = counting_draw(monkeypatch)
+
+    async def run():
+        renderer = images.CardRenderer(cache_size=2)
+        try:
+            for stack in (0, 2, 0, 4, 2):  # 0 is used again before 4 pushes 2 out
+                await renderer.board(RED_FIVE, Color.RED, stack, 1)
+        finally:
+            renderer.close()
+
+    asyncio.run(run())
+    assert [args[2] for args in calls] == [0, 2, 4, 2]
+
+
+def test_a_failed_render_is_tried_again(monkeypatch):
+    def broken(atlas, *args):
+        raise RuntimeError('draw_board, out of memory')
+
+    async def run():
+        renderer = images.CardRenderer()
+        try:
+            monkeypatch.setattr(images, 'draw_board', broken)
+            with pytest.raises(RuntimeError):
+                await renderer.board(RED_FIVE, Color.RED, 0, 1)
+            monkeypatch.undo()
+            return await renderer.board(RED_FIVE, Color.RED, 0, 1), renderer.inflight, len(renderer.cache)
+        finally:
+            renderer.close()
+
+    png, inflight, cached = asyncio.run(run())
+    assert png.startswith(b'\x89PNG') and inflight == {} and cached == 1
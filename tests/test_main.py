@@ -0,0 +1,128 @@
+import asyncio
+import random
+
+from card import Color, card_id, is_wild, new_deck
+from game import GameState, Hand, Player
+from routing import Action, encode_custom_id
+from simulation import create_game
+from store import VersionConflict
+from tournament import Tournament, TournamentMode
+from tests.fakes import BrokenChannel, FakeInteraction, FakeMessage, seat_game, settle
+
+
+def test_winning_with_a_wild_answers_the_click(bot):
+    async def run():
+        game = next(g for g in (create_game(seed, 2) for seed in range(50)) if g.pickup_stack == 0)
+        player = game.current_player
+        wild = next(card for card in new_deck() if is_wild(card) and card_id(card) not in game.playersToCards[player])
+        hand = game.playersToCards[player] = Hand()
+        hand.add(wild)
+        seat_game(555, game)
+        arg = f'{card_id(wild)}.{Color.RED.value}'
+        interaction = FakeInteraction(player.discord_tag, 555, encode_custom_id(555, Action.COLOR, arg))
+        assert await bot.submit_interaction(interaction, None, 555, Action.COLOR, arg)
+        await settle()
+        return game, interaction
+
+    game, interaction = asyncio.run(run())
+    assert game.state == GameState.FINISHED and 555 not in bot.game_store
+    assert [kind for kind, _ in interaction.response.answers] == ['defer']
+
+
+def test_tables_that_cannot_open_are_forfeited(bot):
+    async def run():
+        t = Tournament(Player(1, 'admin'), TournamentMode.BRACKET, table_size=2, rng=random.Random(0))
+        for tag in range(2, 5):
+            t.add_entrant(Player(tag, f'player{tag}'))
+        message = FakeMessage(70, 7)
+        message.channel = BrokenChannel(7)
+        bot.tournaments[7] = t, message
+        bot.schedule_tables(7, t.start())
+        for _ in range(50):
+            await asyncio.sleep(0.02)
+            if t.finished:
+                break
+        await settle()
+        return t, message
+
+    t, message = asyncio.run(run())
+    assert t.finished and t.round == 2 and 7 not in bot.tournaments
+    assert 'The champion is' in message.edits[-1]['content']
+
+
+def test_clicks_are_acknowledged_before_they_wait_for_the_game(bot):
+    async def run():
+        game = create_game(3, 3)
+        seat_game(556, game)
+        player = game.current_player
+        release = asyncio.Event()
+        held = asyncio.ensure_future(bot.game_actors[556].submit(None, release.wait))  # an action stuck on I/O
+        interaction = FakeInteraction(player.discord_tag, 556, encode_custom_id(556, Action.DRAW))
+        click = asyncio.ensure_future(bot.submit_interaction(interaction, None, 556, Action.DRAW, ''))
+        await asyncio.sleep(0)
+        answered_while_held = [kind for kind, _ in interaction.response.answers]
+        release.set()
+        await held
+        return game, player, answered_while_held, await click
+
+    game, player, answered_while_held, submitted = asyncio.run(run())
+    assert answered_while_held == ['defer'] and submitted
+    assert game.last_action[0] == player.discord_tag
+
+
+def test_moves_that_cannot_be_made_are_answered_after_the_defer(bot):
+    async def run():
+        game = create_game(4, 3)
+        seat_game(557, game)
+        waiting = next(player for player in game.players if player is not game.current_player)
+        interaction = FakeInteraction(waiting.discord_tag, 557, encode_custom_id(557, Action.DRAW))
+        submitted = await bot.submit_interaction(interaction, None, 557, Action.DRAW, '')
+        return interaction, submitted
+
+    interaction, submitted = asyncio.run(run())
+    assert not submitted
+    assert [kind for kind, _ in interaction.response.answers] == ['defer']
+    assert interaction.followup.sent == [dict(content='You cannot do this right now.', ephemeral=True)]
+
+
+def test_a_full_game_rejects_clicks_before_queueing(bot):
+    async def run():
+        game = create_game(5, 3)
+        seat_game(558, game)
+        actor = bot.game_actors[558]
+        release = asyncio.Event()
+        held = [asyncio.ensure_future(actor.submit(None, release.wait)) for _ in range(actor.queue.maxsize)]
+        await asyncio.sleep(0)
+        while not actor.queue.full():
+            held.append(asyncio.ensure_future(actor.submit(None, release.wait)))
+            await asyncio.sleep(0)
+        interaction = FakeInteraction(game.current_player.discord_tag, 558, encode_custom_id(558, Action.DRAW))
+        submitted = await bot.submit_interaction(interaction, None, 558, Action.DRAW, '')
+        release.set()
+        await asyncio.gather(*held)
+        return interaction, submitted
+
+    interaction, submitted = asyncio.run(run())
+    assert not submitted
+    assert interaction.response.answers == [('send_message', dict(content='The game is busy, try again.',
+                                                                  ephemeral=True))]
+
+
+def test_a_turn_that_loses_the_commit_is_not_shown(bot, monkeypatch):
+    async def conflict(channel_id: int):
+        raise VersionConflict(f'commit, game in channel {channel_id} has changed')
+
+    async def run():
+        game = create_game(6, 3)
+        message = seat_game(559, game)
+        entry = bot.game_store[559]
+        version = entry.broadcast.version
+        monkeypatch.setattr(bot.game_store, 'commit', conflict)
+        interaction = FakeInteraction(game.current_player.discord_tag, 559, encode_custom_id(559, Action.DRAW))
+        submitted = await bot.submit_interaction(interaction, None, 559, Action.DRAW, '')
+        await settle()
+        return entry, version, message, interaction, submitted
+
+    entry, version, message, interaction, submitted = asyncio.run(run())
+    assert not submitted and entry.broadcast.version == version and message.edits == []
+    assert interaction.followup.sent == [dict(content='The game has changed, try again.', ephemeral=True)]
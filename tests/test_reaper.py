@@ -0,0 +1,89 @@
+import asyncio
+
+from game import GameState
+from reaper import Reaper
+from simulation import create_game
+from store import MemoryGameStore
+
+
+class Message:
+    def __init__(self, id: int):
+        self.id = id
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def evicting_store():
+    # the local cache of a shared store: evicted games are kept aside and loaded back on demand
+    store = MemoryGameStore()
+    shared = {}
+
+    async def load(channel_id: int):
+        if channel_id in shared:
+            store.games[channel_id] = shared.pop(channel_id)
+
+    def evict(channel_id: int):
+        shared[channel_id] = store.games.pop(channel_id)
+
+    return store, shared, load, evict
+
+
+def test_evicted_games_are_loaded_to_be_archived_and_expired():
+    async def run():
+        store, shared, load, evict = evicting_store()
+        closed = []
+
+        async def close(channel_id: int, content: str):
+            assert channel_id in store  # loaded back before it is closed
+            closed.append(channel_id)
+            store.delete(channel_id)
+
+        clock = Clock()
+        reaper = Reaper(store, close, load=load, max_games=2, tick=1.0, clock=clock)
+        await reaper.reap()  # starts the wheel at 0
+        for channel_id in (1, 2):
+            store.add(channel_id, create_game(channel_id, 2), Message(channel_id))
+            await reaper.admit(channel_id)
+        evict(1)
+        store.add(3, create_game(3, 2), Message(3))
+        await reaper.admit(3)
+        assert closed == [1] and reaper.archived == 1 and not shared
+
+        store.games[2].game.state = GameState.READY_TO_START  # an idle lobby is closed, not played for
+        evict(2)
+        clock.now = reaper.turn_timeout + 2
+        await reaper.reap()
+        return closed, reaper
+
+    closed, reaper = asyncio.run(run())
+    assert closed == [1, 2] and reaper.expired == 1 and 2 not in reaper.last_activity
+
+
+def test_games_that_cannot_be_loaded_are_deleted():
+    async def run():
+        store, shared, _, evict = evicting_store()
+        deleted = []
+        store.delete = deleted.append
+
+        async def load(channel_id: int):
+            raise RuntimeError('fetch_channel, unknown channel')
+
+        async def close(channel_id: int, content: str):
+            raise AssertionError('close, the game is not loaded')
+
+        reaper = Reaper(store, close, load=load, max_games=1)
+        store.add(1, create_game(1, 2), Message(1))
+        await reaper.admit(1)
+        evict(1)
+        store.add(2, create_game(2, 2), Message(2))
+        await reaper.admit(2)
+        return deleted, reaper
+
+    deleted, reaper = asyncio.run(run())
+    assert deleted == [1] and list(reaper.last_activity) == [2]
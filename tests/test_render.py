@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+from render import RenderScheduler
+
+
+class Message:
+    def __init__(self):
+        self.edits = 0
+
+    async def edit(self, **kwargs):
+        self.edits += 1
+
+
+def test_forget_waits_for_the_final_edit():
+    async def run():
+        scheduler = RenderScheduler(delay=0.01, rate=2, per=0.05)
+        game, spectators = Message(), Message()
+        done = scheduler.schedule(1, 'game', game, lambda: dict(content='over'))
+        done = scheduler.schedule(1, 'spectators', spectators, lambda: dict(content='over'), bucket='spectators')
+        scheduler.forget(1, 'spectators', after=done)
+        await done
+        assert set(scheduler.buckets) == {1, 'spectators'}  # refilling, a new game in the channel keeps the limit
+        await asyncio.sleep(0.2)
+        return game.edits, spectators.edits, scheduler.buckets
+
+    assert asyncio.run(run()) == (1, 1, {})
+
+
+class FailingMessage(Message):
+    async def edit(self, **kwargs):
+        raise RuntimeError('edit, missing access')
+
+
+def test_quick_changes_are_folded_into_one_edit():
+    async def run():
+        scheduler = RenderScheduler(delay=0.01)
+        board, hand = Message(), Message()
+        shown = []
+
+        def render(turn: int):
+            shown.append(turn)
+            return dict(content=f'turn {turn}')
+
+        waiters = [scheduler.schedule(1, 'board', board, lambda turn=turn: render(turn)) for turn in range(10)]
+        waiters.append(scheduler.schedule(1, 'hand', hand, lambda: dict(content='hand'), bucket='hand'))
+        await asyncio.gather(*waiters)
+        return board.edits, hand.edits, shown, scheduler.edits_sent, scheduler.channels
+
+    assert asyncio.run(run()) == (1, 1, [9], 2, {})  # only the latest render of a message is drawn
+
+
+def test_edits_wait_for_the_rate_limit():
+    async def run():
+        scheduler = RenderScheduler(delay=0.001, rate=2, per=0.2)
+        message = Message()
+        start = time.perf_counter()
+        for _ in range(4):
+            await scheduler.schedule(1, 'board', message, lambda: dict(content='board'))
+        return message.edits, time.perf_counter() - start
+
+    edits, elapsed = asyncio.run(run())
+    assert edits == 4 and elapsed >= 0.18  # two edits from the full bucket, then one every 0.1s
+
+
+def test_skipped_and_failed_edits_do_not_hold_up_the_others():
+    async def run():
+        scheduler = RenderScheduler(delay=0.001)
+        board, broken, unchanged = Message(), FailingMessage(), Message()
+
+        async def drawn():
+            await asyncio.sleep(0)
+            return dict(content='drawn off the loop')
+
+        scheduler.schedule(1, 'board', board, drawn)
+        scheduler.schedule(1, 'broken', broken, lambda: dict(content='lost'))
+        await scheduler.schedule(1, 'unchanged', unchanged, lambda: None)
+        return board.edits, unchanged.edits, scheduler.edits_sent
+
+    assert asyncio.run(run()) == (1, 0, 2)
@@ -0,0 +1,30 @@
+from gamelog import LENGTH
+from replay import analyse_chunk, iter_games, replay_game
+from simulation import run_batch
+
+POLICIES = ['first', 'random', 'random']
+
+
+def test_replay_finds_the_simulated_winners():
+    seeds = list(range(50))
+    plain = run_batch(seeds, POLICIES)
+    recorded = run_batch(seeds, POLICIES, record=True)
+    winners = []
+    for data in iter_games(memoryview(recorded.logs)):
+        result = replay_game(data)
+        assert result.rejected == 0
+        winners.append(None if result.winner is None else result.players.index(result.winner))
+    assert len(winners) == len(seeds)
+    assert winners.count(None) == 0
+    assert [winners.count(seat) for seat in range(len(POLICIES))] == plain.wins
+
+
+def test_broken_logs_are_counted_and_skipped(tmp_path):
+    games = [bytes(data) for data in iter_games(memoryview(run_batch(list(range(6)), POLICIES, record=True).logs))]
+    games[1] = games[1][:len(games[1]) // 2]  # cut short
+    games[3] = games[3][:-1]  # the winner record is missing its seat
+    path = tmp_path / 'games.unolog'
+    path.write_bytes(b''.join(LENGTH.pack(len(data)) + data for data in games))
+    stats = analyse_chunk(str(path), 0, path.stat().st_size)
+    assert stats.games == stats.finished == 4 and stats.broken == 2
+    assert '2 games could not be replayed' in stats.report()
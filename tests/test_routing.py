@@ -0,0 +1,84 @@
+from game import *
+from routing import HAND_PAGE_SIZE, Action, decode_custom_id, encode_custom_id, hand_page
+from simulation import create_game
+
+
+def test_custom_ids_round_trip():
+    for action in Action:
+        assert decode_custom_id(encode_custom_id(1234, action, 'a:b')) == (1234, action, 'a:b')
+    assert decode_custom_id(encode_custom_id(1, Action.DRAW)) == (1, Action.DRAW, '')
+
+
+def test_foreign_and_broken_custom_ids_are_ignored():
+    for custom_id in ('', 'uno', 'uno:1:play', 'other:1:play:3', 'uno:x:play:3', 'uno:1:nope:3'):
+        assert decode_custom_id(custom_id) is None
+
+
+def test_hand_page_lists_playable_faces_first():
+    game = create_game(2, 3)
+    player = game.current_player
+    buttons, page, page_count = hand_page(7, game, player, 0)
+    assert (page, page_count) == (0, 1)
+    cards = buttons[:-1]
+    faces = game.playersToCards[player].faces
+    assert len(cards) == len(faces) and sum(len(group) for group in faces.values()) == len(game.playersToCards[player])
+    disabled = [spec[2] for spec in cards]
+    assert disabled == sorted(disabled)  # every enabled card comes before the disabled ones
+    for label, custom_id, off in cards:
+        channel_id, action, arg = decode_custom_id(custom_id)
+        card = game.playersToCards[player].get(int(arg))
+        assert channel_id == 7 and card is not None and off != game.is_playable(card)
+        assert action == (Action.WILD if is_wild(card) else Action.PLAY)
+        group = faces[card & FACE_MASK]
+        assert label == (card_label(card) if len(group) == 1 else f'{card_label(card)} ×{len(group)}')
+    assert buttons[-1] == ('Draw a card', encode_custom_id(7, Action.DRAW), False)
+
+
+def test_only_the_current_player_may_draw():
+    game = create_game(3, 3)
+    waiting = next(player for player in game.players if player is not game.current_player)
+    buttons, _, _ = hand_page(7, game, waiting, 0)
+    assert buttons[-1] == ('Draw a card', encode_custom_id(7, Action.DRAW), True)
+    assert all(spec[2] for spec in buttons[:-1])  # without jump-in nothing is playable out of turn
+    assert len(buttons) - 1 <= HAND_PAGE_SIZE
+
+
+def big_hand_game(cards: int = 100) -> tuple[Game, Player]:
+    game = create_game(4, 2)
+    player = game.current_player
+    hand = game.playersToCards[player]
+    while len(hand) < cards:
+        hand.add(game.deck.pop())
+    return game, player
+
+
+def test_a_100_card_hand_is_paged():
+    game, player = big_hand_game()
+    faces = game.playersToCards[player].faces
+    seen = []
+    page_count = None
+    for page in range(len(faces)):
+        buttons, shown, page_count = hand_page(7, game, player, page)
+        if shown != page:
+            break
+        previous, draw, following = buttons[-3:]
+        assert previous == ('◀', encode_custom_id(7, Action.PAGE, page - 1), page == 0)
+        assert following == ('▶', encode_custom_id(7, Action.PAGE, page + 1), page == page_count - 1)
+        assert draw[0] == 'Draw a card' and len(buttons) <= 25  # five rows of five buttons
+        seen.extend(game.playersToCards[player].get(int(decode_custom_id(spec[1])[2])) & FACE_MASK
+                    for spec in buttons[:-3])
+    assert page_count == -(-len(faces) // HAND_PAGE_SIZE) > 1
+    assert sorted(seen) == sorted(faces)  # every face on exactly one page
+
+
+def test_pages_out_of_range_are_clamped():
+    game, player = big_hand_game()
+    first, page, page_count = hand_page(7, game, player, -3)
+    assert page == 0 and first == hand_page(7, game, player, 0)[0]
+    last, page, _ = hand_page(7, game, player, 999)
+    assert page == page_count - 1 and last == hand_page(7, game, player, page_count - 1)[0]
+    kept = game.playersToCards[player].cards[0]
+    game.playersToCards[player] = Hand()  # the hand shrank under a stale page number
+    game.playersToCards[player].add(kept)
+    buttons, page, page_count = hand_page(7, game, player, 2)
+    assert (page, page_count, len(buttons)) == (0, 1, 2)
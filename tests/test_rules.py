@@ -0,0 +1,132 @@
+import pytest
+
+from game import *
+from routing import hand_page
+from rules import HouseRule, load_channel_rules, save_channel_rules, update_channel_rules
+from simulation import check_consistency, create_game
+
+
+def test_update_keeps_rules_saved_by_other_workers(tmp_path):
+    path = str(tmp_path / 'channel_rules.json')
+    stale = {1: HouseRule.JUMP_IN}
+    save_channel_rules(stale, path)
+    update_channel_rules(2, HouseRule.SEVEN_ZERO, path)  # another worker
+    stale[3] = HouseRule.FORCED_PLAY
+    merged = update_channel_rules(3, HouseRule.FORCED_PLAY, path)
+    assert merged == load_channel_rules(path) == {1: HouseRule.JUMP_IN, 2: HouseRule.SEVEN_ZERO,
+                                                  3: HouseRule.FORCED_PLAY}
+
+
+def face(kind: CardKind, color: Color | None = None, number: int = 0) -> int:
+    return encode_card(kind, color, number, 0)
+
+
+def rigged_game(rules: HouseRule, top: int, *hands: list[int], drawn: tuple[int, ...] = (),
+                pickup_stack: int = 0) -> Game:
+    # the first player is to move on top of the given card, the cards in drawn come off the deck in that order
+    game = create_game(0, len(hands), rules=rules)
+    pool = list(new_deck())
+
+    def take(wanted: int) -> int:
+        card = next(card for card in pool if card & FACE_MASK == wanted)
+        pool.remove(card)
+        return card
+
+    for player, faces in zip(game.players, hands):
+        hand = game.playersToCards[player] = Hand()
+        for wanted in faces:
+            hand.add(take(wanted))
+    game.current_card = take(top)
+    game.current_color = card_color(game.current_card)
+    drawn = [take(wanted) for wanted in drawn]
+    game.deck = array(CARD_TYPECODE, pool + drawn[::-1])
+    game.discard = array(CARD_TYPECODE)
+    game.current_seat, game.current_player, game.is_reversed = 0, game.players[0], 1
+    game.pickup_stack = pickup_stack
+    game.rules = rules
+    check_consistency(game)
+    return game
+
+
+RED_PLUS = face(CardKind.PLUS, Color.RED)
+WILD_PLUS = face(CardKind.WILD_PLUS)
+
+
+def card_of(game: Game, seat: int, wanted: int) -> int:
+    return next(card_id(card) for card in game.playersToCards[game.players[seat]] if card & FACE_MASK == wanted)
+
+
+@pytest.mark.parametrize('stacking', [True, False])
+def test_plus4_on_a_pending_plus2(stacking: bool):
+    rules = HouseRule.STACK_PLUS4_ON_PLUS2 if stacking else HouseRule(0)
+    green_five = face(CardKind.NUMBER, Color.GREEN, 5)
+    game = rigged_game(rules, RED_PLUS, [WILD_PLUS, green_five], [green_five], pickup_stack=2)
+    game.apply_turn(0, card_of(game, 0, WILD_PLUS), Color.BLUE)
+    if stacking:
+        assert game.pickup_stack == 6 and len(game.playersToCards[game.players[0]]) == 1
+    else:
+        assert game.pickup_stack == 4 and len(game.playersToCards[game.players[0]]) == 3  # drew the +2 first
+    assert game.current_player is game.players[1] and game.current_color == Color.BLUE
+    check_consistency(game)
+
+
+@pytest.mark.parametrize('jump_in', [True, False])
+def test_jump_in_out_of_turn(jump_in: bool):
+    red_five, red_six = face(CardKind.NUMBER, Color.RED, 5), face(CardKind.NUMBER, Color.RED, 6)
+    rules = HouseRule.JUMP_IN if jump_in else HouseRule(0)
+    game = rigged_game(rules, red_five, [red_six], [red_five, red_six], [face(CardKind.NUMBER, Color.BLUE, 9)])
+    with pytest.raises(RuntimeError):
+        game.apply_turn(1, card_of(game, 1, red_six), None)  # only an identical card may jump in
+    if not jump_in:
+        with pytest.raises(RuntimeError):
+            game.apply_turn(1, card_of(game, 1, red_five), None)
+        return
+    game.apply_turn(1, card_of(game, 1, red_five), None)
+    assert game.current_player is game.players[2] and game.last_player is game.players[1]
+    check_consistency(game)
+
+
+def test_seven_swaps_and_zero_rotates_hands():
+    red_five = face(CardKind.NUMBER, Color.RED, 5)
+    red_seven, red_zero = face(CardKind.NUMBER, Color.RED, 7), face(CardKind.NUMBER, Color.RED, 0)
+    blue, green = face(CardKind.NUMBER, Color.BLUE, 1), face(CardKind.NUMBER, Color.GREEN, 2)
+    game = rigged_game(HouseRule.SEVEN_ZERO, red_five, [red_seven, red_five], [blue], [green])
+    first, second, third = (game.playersToCards[player] for player in game.players)
+    game.apply_turn(0, card_of(game, 0, red_seven), None)
+    assert [game.playersToCards[player] for player in game.players] == [second, first, third]
+    game = rigged_game(HouseRule.SEVEN_ZERO, red_five, [red_zero, red_five], [blue], [green])
+    first, second, third = (game.playersToCards[player] for player in game.players)
+    game.apply_turn(0, card_of(game, 0, red_zero), None)
+    assert [game.playersToCards[player] for player in game.players] == [third, first, second]
+    check_consistency(game)
+
+
+def test_drawing_until_playable_keeps_the_turn():
+    red_five, red_one = face(CardKind.NUMBER, Color.RED, 5), face(CardKind.NUMBER, Color.RED, 1)
+    blue, green = face(CardKind.NUMBER, Color.BLUE, 9), face(CardKind.NUMBER, Color.GREEN, 3)
+    game = rigged_game(HouseRule.DRAW_UNTIL_PLAYABLE, red_five, [blue], [green], drawn=(green, blue, red_one))
+    player = game.players[0]
+    game.apply_turn(0, None, None)
+    assert game.current_player is player and len(game.playersToCards[player]) == 4
+    game.apply_turn(0, card_of(game, 0, red_one), None)
+    assert game.current_player is game.players[1]
+    check_consistency(game)
+
+
+def test_forced_play_rejects_a_draw():
+    red_five, red_three = face(CardKind.NUMBER, Color.RED, 5), face(CardKind.NUMBER, Color.RED, 3)
+    blue = face(CardKind.NUMBER, Color.BLUE, 9)
+    game = rigged_game(HouseRule.FORCED_PLAY, red_five, [red_three, blue], [blue])
+    with pytest.raises(RuntimeError):
+        game.apply_turn(0, None, None)
+    assert len(game.playersToCards[game.players[0]]) == 2 and game.current_player is game.players[0]
+    draw = hand_page(1, game, game.players[0], 0)[0][-1]
+    assert draw[0] == 'Draw a card' and draw[2]
+    game = rigged_game(HouseRule.FORCED_PLAY, red_five, [blue], [blue])
+    assert not hand_page(1, game, game.players[0], 0)[0][-1][2]
+    game.apply_turn(0, None, None)
+    assert game.current_player is game.players[1]
+    game = rigged_game(HouseRule.FORCED_PLAY, RED_PLUS, [red_three], [blue], pickup_stack=2)
+    assert not hand_page(1, game, game.players[0], 0)[0][-1][2]  # a stack may always be drawn
+    game.apply_turn(0, None, None)
+    assert len(game.playersToCards[game.players[0]]) == 4
@@ -0,0 +1,36 @@
+import asyncio
+
+from discord import app_commands
+
+import main
+from slash import GATEWAY_INTENTS, sync_tree
+
+
+def test_the_bot_asks_only_for_the_gateway_intents():
+    assert {name for name, enabled in main.intents if enabled} == set(GATEWAY_INTENTS)
+
+
+def test_the_command_tree_is_synced_only_when_it_changes(tmp_path, monkeypatch):
+    syncs = []
+
+    async def sync():
+        syncs.append(len(main.tree.get_commands()))
+
+    async def leaderboard(interaction):
+        pass
+
+    async def run():
+        path = str(tmp_path / 'command_tree.sha256')
+        monkeypatch.setattr(main.tree, 'sync', sync)
+        assert await sync_tree(main.tree, 1, path)
+        assert not await sync_tree(main.tree, 1, path)
+        assert await sync_tree(main.tree, 2, path)  # another application has not seen the commands yet
+        main.tree.add_command(app_commands.Command(name='unoleaderboard', description='Shows the best players',
+                                                   callback=leaderboard))
+        try:
+            assert await sync_tree(main.tree, 2, path)
+        finally:
+            main.tree.remove_command('unoleaderboard')
+        assert syncs == [1, 1, 2]
+
+    asyncio.run(run())
@@ -0,0 +1,54 @@
+import random
+
+from game import *
+from simulation import check_consistency, create_game, random_policy
+from replay import replay_game
+from snapshot import dump_game, load_game
+
+
+def play(game: Game, turns: int, seed: int):
+    rng = random.Random(seed)
+    for _ in range(turns):
+        player = game.current_player
+        if game.apply_turn(player.discord_tag, *random_policy(game, player, rng)) is not None:
+            return
+
+
+def test_snapshot_round_trip():
+    game = create_game(7, 3, rules=HouseRule(sum(HouseRule)))
+    game.spectators[42] = Player(42, 'watcher')
+    game.reveal_hands = True
+    play(game, 20, 7)
+    restored = load_game(dump_game(game))
+    check_consistency(restored)
+    assert dump_game(restored) == dump_game(game)
+    assert restored.rules == game.rules
+    assert restored.reveal_hands
+    assert [(p.discord_tag, p.nickname) for p in restored.spectators.values()] == [(42, 'watcher')]
+    assert [p.discord_tag for p in restored.players] == [p.discord_tag for p in game.players]
+    assert {p.discord_tag: list(h.cards) for p, h in restored.playersToCards.items()} == \
+        {p.discord_tag: list(h.cards) for p, h in game.playersToCards.items()}
+
+
+def test_restored_game_plays_on_identically():
+    game = create_game(11, 4)
+    play(game, 15, 11)
+    restored = load_game(dump_game(game))
+    play(game, 5_000, 12)
+    play(restored, 5_000, 12)
+    assert game.state == restored.state == GameState.FINISHED
+    assert dump_game(restored) == dump_game(game)
+
+
+def test_restored_game_keeps_its_log():
+    game = create_game(5, 3, record=True)
+    play(game, 25, 5)
+    restored = load_game(dump_game(game))
+    assert restored.seed == 5 and restored.log.data == game.log.data
+    assert load_game(dump_game(game, log=False)).log is None
+    play(restored, 5_000, 6)
+    result = replay_game(memoryview(restored.log.data))
+    assert restored.state == GameState.FINISHED and result.rejected == 0
+    assert [len(hand) for hand in result.game.playersToCards.values()] == \
+        [len(hand) for hand in restored.playersToCards.values()]
+    assert len(restored.playersToCards[restored.players[result.players.index(result.winner)]]) == 0
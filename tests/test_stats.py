@@ -0,0 +1,18 @@
+from game import Player
+from simulation import create_game
+from stats import StatsStore
+
+
+def test_bots_are_not_rated(tmp_path):
+    store = StatsStore(str(tmp_path / 'stats.sqlite3'))
+    try:
+        game = create_game(0, 2)
+        alice, bob, bot = Player(1, 'alice'), Player(2, 'bob'), Player(-1, 'Bot 1')
+        game.players = [alice, bot]
+        assert store.record(1, 1, game, alice) is None  # a human against a bot only
+        game.players = [alice, bob, bot]
+        assert store.record(1, 1, game, bot) is None
+        store.record(1, 1, game, bob).result()
+        assert [(row.discord_tag, row.games, row.wins) for row in store.__top__(1, 10)] == [(2, 1, 1), (1, 1, 0)]
+    finally:
+        store.close()
@@ -0,0 +1,127 @@
+import asyncio
+import random
+
+import pytest
+
+from benchmark import FakeMessage, RespStandIn
+from simulation import create_game, first_playable_policy
+from store import CAS_SHA, MemoryGameStore, RedisGameStore, RespError, VersionConflict
+
+
+def play_turn(game):
+    player = game.current_player
+    game.apply_turn(player.discord_tag, *first_playable_policy(game, player, random.Random(0)))
+
+
+async def stand_in_server(stand_in: RespStandIn) -> tuple[asyncio.AbstractServer, int]:
+    server = await asyncio.start_server(stand_in.handle, '127.0.0.1', 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def test_memory_store_versions_commits():
+    async def run():
+        store = MemoryGameStore()
+        entry = store.add(1, create_game(0, 3), FakeMessage(10, 0))
+        await store.commit(1)
+        await store.commit(1)
+        store.delete(1)
+        return store, entry
+
+    store, entry = asyncio.run(run())
+    assert entry.version == 2 and 1 not in store
+
+
+def test_a_stale_commit_conflicts_and_drops_the_cached_game():
+    async def run():
+        server, port = await stand_in_server(RespStandIn())
+        first, second = RedisGameStore('127.0.0.1', port), RedisGameStore('127.0.0.1', port)
+        evicted = []
+        second.on_evicted = lambda channel_id, entry: evicted.append((channel_id, entry))
+        first.add(1, create_game(0, 3), FakeMessage(10, 0))
+        await first.commit(1)
+        ours, theirs = await first.load(1), await second.load(1)
+        play_turn(ours.game)
+        play_turn(theirs.game)
+        await first.commit(1)
+        with pytest.raises(VersionConflict):
+            await second.commit(1)
+        cached = 1 in second
+        reloaded = await second.load(1)
+        for store in (first, second):
+            await store.close()
+        server.close()
+        await server.wait_closed()
+        return ours, theirs, evicted, cached, reloaded
+
+    ours, theirs, evicted, cached, reloaded = asyncio.run(run())
+    assert evicted == [(1, theirs)] and not cached
+    assert reloaded.version == ours.version == 2
+    assert reloaded.game.current_player.discord_tag == ours.game.current_player.discord_tag
+
+
+def test_games_beyond_the_cache_are_evicted_and_load_back():
+    async def run():
+        server, port = await stand_in_server(RespStandIn())
+        store = RedisGameStore('127.0.0.1', port, cache_size=2)
+        evicted = []
+        store.on_evicted = lambda channel_id, entry: evicted.append(channel_id)
+        for channel_id in (1, 2, 3):
+            store.add(channel_id, create_game(channel_id, 3), FakeMessage(channel_id * 10, 0))
+            await store.commit(channel_id)
+        store.get(2)  # used last, 3 is now the oldest
+        reloaded = await store.load(1)
+        await store.close()
+        server.close()
+        await server.wait_closed()
+        return store, evicted, reloaded
+
+    store, evicted, reloaded = asyncio.run(run())
+    assert evicted == [1, 3] and list(store.games) == [2, 1]
+    assert reloaded.message_id == 10 and reloaded.version == 1 and reloaded.message is None
+
+
+class ForgetfulStandIn(RespStandIn):
+    # a server that restarted once and lost its script cache
+    def __init__(self):
+        super().__init__()
+        self.forgot = False
+
+    def execute(self, command: list[bytes]) -> bytes:
+        if command[0].upper() == b'EVALSHA' and command[1] == CAS_SHA and not self.forgot:
+            self.forgot = True
+            return b'-NOSCRIPT No matching script. Please use EVAL.\r\n'
+        return super().execute(command)
+
+
+def test_a_failed_flush_fails_the_commit_and_the_next_one_recovers():
+    async def run():
+        server, port = await stand_in_server(ForgetfulStandIn())
+        store = RedisGameStore('127.0.0.1', port)
+        store.add(1, create_game(0, 3), FakeMessage(10, 0))
+        with pytest.raises(RespError, match='NOSCRIPT'):
+            await store.commit(1)
+        failed = store.script_loaded, store.flusher, len(store.pending)
+        await store.commit(1)
+        await store.close()
+        server.close()
+        await server.wait_closed()
+        return store, failed
+
+    store, failed = asyncio.run(run())
+    assert failed == (False, None, 0)
+    assert store.games[1].version == 1
+
+
+def test_commits_fail_when_redis_is_unreachable():
+    async def run():
+        server, port = await stand_in_server(RespStandIn())
+        server.close()
+        await server.wait_closed()
+        store = RedisGameStore('127.0.0.1', port)
+        store.add(1, create_game(0, 3), FakeMessage(10, 0))
+        with pytest.raises(OSError):
+            await store.commit(1)
+        return store
+
+    store = asyncio.run(run())
+    assert store.flusher is None and store.pending == [] and store.games[1].version == 0
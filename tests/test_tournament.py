@@ -0,0 +1,24 @@
+import random
+
+from game import Player
+from tournament import Tournament, TournamentMode
+
+
+def entrants(count: int) -> Tournament:
+    t = Tournament(Player(0, 'admin'), TournamentMode.BRACKET, table_size=2, rng=random.Random(0))
+    for tag in range(1, count):
+        t.add_entrant(Player(tag, f'player{tag}'))
+    return t
+
+
+def test_forfeited_tables_finish_the_bracket():
+    t = entrants(4)
+    tables = t.start()
+    assert t.record_winner(tables[0], tables[0].players[0]) is None
+    kicked = tables[1].players[0]
+    final = t.record_forfeit(tables[1], [p for p in tables[1].players if p is not kicked])
+    assert tables[1].winner is tables[1].players[1]
+    assert t.points[tables[1].winner.discord_tag] == 0
+    assert [len(table.players) for table in final] == [2]
+    assert t.record_forfeit(final[0], []) == []
+    assert t.champion in final[0].players
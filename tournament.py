@@ -0,0 +1,173 @@
+import asyncio
+import math
+import random
+from enum import Enum
+from typing import Awaitable, Callable
+
+from game import *
+from render import TokenBucket
+
+
+class TournamentMode(Enum):
+    BRACKET = 'bracket'
+    SWISS = 'swiss'
+
+
+class Table:
+    id: int
+    round: int
+    players: list[Player]
+    winner: Player | None
+
+    def __init__(self, id: int, round: int, players: list[Player]):
+        self.id = id
+        self.round = round
+        self.players = players
+        self.winner = None
+
+
+def split_tables(players: list[Player], table_size: int) -> list[list[Player]]:
+    # spreads players as evenly as possible so that no table is left with a single player
+    if len(players) < 2:
+        return [players] if players else []
+    count = max(1, math.ceil(len(players) / table_size))
+    if len(players) // count < 2:
+        count = len(players) // 2
+    base, extra = divmod(len(players), count)
+    tables = []
+    start = 0
+    for i in range(count):
+        size = base + (1 if i < extra else 0)
+        tables.append(players[start:start + size])
+        start += size
+    return tables
+
+
+class Tournament:
+    def __init__(self, admin: Player, mode: TournamentMode = TournamentMode.BRACKET, table_size: int = 4,
+                 rounds: int | None = None, rng: random.Random | None = None):
+        if table_size < 2:
+            raise RuntimeError(f'Tournament, a table needs at least two seats, got {table_size}')
+        self.admin = admin
+        self.mode = mode
+        self.table_size = table_size
+        self.rounds = rounds
+        self.rng = rng if rng is not None else random.Random()
+        self.entrants: list[Player] = [admin]
+        self.seats: dict[str, Player] = {admin.discord_tag: admin}
+        self.points: dict[str, int] = {}
+        self.round = 0
+        self.tables: list[Table] = []
+        self.alive: list[Player] = []
+        self.champion: Player | None = None
+        self.max_table_id = 0
+
+    @property
+    def started(self) -> bool:
+        return self.round > 0
+
+    @property
+    def finished(self) -> bool:
+        return self.champion is not None
+
+    def add_entrant(self, player: Player):
+        if self.started:
+            raise RuntimeError('add_entrant, the tournament has already started')
+        if player.discord_tag in self.seats:
+            raise RuntimeError(f'add_entrant, {player.nickname} has already joined')
+        self.entrants.append(player)
+        self.seats[player.discord_tag] = player
+
+    def remove_entrant(self, player: Player):
+        if self.started:
+            raise RuntimeError('remove_entrant, the tournament has already started')
+        if player.discord_tag == self.admin.discord_tag:
+            raise RuntimeError('remove_entrant, cannot remove the admin')
+        if self.seats.pop(player.discord_tag, None) is None:
+            raise RuntimeError(f'remove_entrant, {player.nickname} is not part of the tournament')
+        self.entrants = [p for p in self.entrants if p.discord_tag != player.discord_tag]
+
+    def start(self) -> list[Table]:
+        if self.started:
+            raise RuntimeError('start, the tournament has already started')
+        if len(self.entrants) < 2:
+            raise RuntimeError('start, at least two entrants are required')
+        if self.rounds is None:
+            self.rounds = max(1, math.ceil(math.log(len(self.entrants), self.table_size)))
+        self.alive = list(self.entrants)
+        self.points = {player.discord_tag: 0 for player in self.entrants}
+        return self.__next_round__()
+
+    def record_winner(self, table: Table, winner: Player) -> list[Table] | None:
+        # returns the tables of the next round once the last table of the current round is finished
+        if table.round != self.round or table.winner is not None:
+            raise RuntimeError(f'record_winner, table {table.id} is not running')
+        self.points[winner.discord_tag] += 1
+        return self.__close_table__(table, winner)
+
+    def record_forfeit(self, table: Table, seated: list[Player]) -> list[Table] | None:
+        # a table that ended without a winner (idle, archived) still has to finish the round:
+        # a seeded draw among the players left at the table advances, nobody scores
+        if table.round != self.round or table.winner is not None:
+            raise RuntimeError(f'record_forfeit, table {table.id} is not running')
+        tags = {player.discord_tag for player in seated}
+        return self.__close_table__(table, self.rng.choice([p for p in table.players if p.discord_tag in tags]
+                                                           or table.players))
+
+    def __close_table__(self, table: Table, winner: Player) -> list[Table] | None:
+        table.winner = winner
+        if any(t.winner is None for t in self.tables):
+            return None
+        if self.mode == TournamentMode.BRACKET:
+            self.alive = [t.winner for t in self.tables]
+            if len(self.alive) == 1:
+                self.champion = self.alive[0]
+                return []
+        elif self.round >= self.rounds:
+            self.champion = max(self.entrants, key=lambda p: self.points[p.discord_tag])
+            return []
+        return self.__next_round__()
+
+    def standings(self) -> list[tuple[Player, int]]:
+        return sorted(((p, self.points.get(p.discord_tag, 0)) for p in self.entrants), key=lambda s: -s[1])
+
+    def __next_round__(self) -> list[Table]:
+        self.round += 1
+        if self.mode == TournamentMode.BRACKET:
+            players = list(self.alive)
+            self.rng.shuffle(players)
+        else:
+            # swiss: players with the same score meet, ties are broken randomly
+            players = sorted(self.entrants, key=lambda p: (-self.points[p.discord_tag], self.rng.random()))
+        self.tables = []
+        for seated in split_tables(players, self.table_size):
+            self.max_table_id += 1
+            self.tables.append(Table(self.max_table_id, self.round, seated))
+        return self.tables
+
+
+class TableScheduler:
+    # opens tables no faster than Discord lets us create threads and messages
+    def __init__(self, rate: int = 5, per: float = 5.0):
+        self.bucket = TokenBucket(rate, per)
+
+    async def open_tables(self, tables: list[Table], open_table: Callable[[Table], Awaitable[None]],
+                          failed: Callable[[Table], None] | None = None):
+        # a table that cannot be opened has no game to finish it, failed has to settle it or the round never ends
+        tasks = []
+        for table in tables:
+            await self.bucket.acquire()
+            tasks.append(asyncio.create_task(open_table(table)))
+        for table, result in zip(tables, await asyncio.gather(*tasks, return_exceptions=True)):
+            if isinstance(result, Exception):
+                print(f'open_tables, cannot open table {table.id}: {result!r}')
+                if failed is not None:
+                    failed(table)
+
+
+def create_table_game(table: Table, rng: random.Random | None = None) -> Game:
+    game = Game(table.players[0], rng=rng)
+    game.players.extend(table.players[1:])
+    game.__reindex_seats__()
+    game.state = GameState.READY_TO_START
+    return game